@@ -117,6 +117,31 @@ else:
     }
 
 
+# Caches
+# The 'scraper' cache persists scrape results across restarts and is shared by
+# all workers on the host; MAX_ENTRIES bounds it on disk.
+SCRAPER_CACHE_DIR = os.getenv('SCRAPER_CACHE_DIR', os.path.join(BASE_DIR, '.cache', 'scraper'))
+
+# Persisted cookies/consent state for the Playwright browser pool, one file per domain
+BROWSER_STATE_DIR = os.getenv('BROWSER_STATE_DIR', os.path.join(BASE_DIR, '.cache', 'browser-state'))
+
+# Lock files that let worker processes on the host coalesce scrapes of the same URL
+SCRAPER_LOCK_DIR = os.getenv('SCRAPER_LOCK_DIR', os.path.join(BASE_DIR, '.cache', 'scrape-locks'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'scraper': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': SCRAPER_CACHE_DIR,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('SCRAPER_CACHE_MAX_ENTRIES', '5000')),
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
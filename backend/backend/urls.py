@@ -22,7 +22,8 @@ from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from core.views import (
     UserViewSet, FamilyViewSet, WishListViewSet,
-    WishListItemViewSet, NotificationViewSet, PasswordResetViewSet, test_email
+    WishListItemViewSet, NotificationViewSet, PasswordResetViewSet, test_email,
+    scraper_stats, scraper_metrics
 )
 
 router = DefaultRouter()
@@ -39,6 +40,8 @@ urlpatterns = [
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/test-email/', test_email, name='test-email'),
+    path('api/scraper-stats/', scraper_stats, name='scraper-stats'),
+    path('api/scraper-metrics/', scraper_metrics, name='scraper-metrics'),
 ]
 
 # Serve media files in all environments
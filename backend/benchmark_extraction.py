@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+"""
+Benchmark single-pass field extraction against the per-field extractors it
+replaced (kept here as the reference implementation).
+
+Usage:
+    python benchmark_extraction.py                 # synthetic ~1.5 MB retailer page
+    python benchmark_extraction.py page.html ...   # saved product pages
+"""
+
+import json
+import os
+import re
+import sys
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urljoin
+
+import django
+
+# Setup Django
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+django.setup()
+
+from bs4 import BeautifulSoup
+from core.utils.extraction import SinglePassExtractor, extract_price_from_text, parse_structured_product
+
+BASE_URL = 'https://www.example-retailer.com/product/12345'
+ROUNDS = 5
+
+
+def synthetic_page(cards: int = 4000) -> str:
+    """A large listing-style page: navigation, many product cards, no meta tags"""
+    parts = ['<html><head><title>Shop</title></head><body>']
+    parts.append('<nav>' + ''.join(f'<a href="/c/{i}">Category {i}</a>' for i in range(300)) + '</nav>')
+    for i in range(cards):
+        parts.append(
+            f'<div class="product-card card-{i}">'
+            f'<img src="/img/thumb-{i}.jpg" class="thumb" alt="Item {i}">'
+            f'<span class="badge">New</span>'
+            f'<div class="rating"><span>4.{i % 10} stars</span> <span>({i} reviews)</span></div>'
+            f'<div class="price-block"><span class="price-label">Was</span> <span class="strike">list</span></div>'
+            f'<p class="blurb">Lorem ipsum dolor sit amet, consectetur adipiscing elit {i}.</p>'
+            f'</div>'
+        )
+    parts.append('<h1 class="product-title">Benchmark Widget</h1>')
+    parts.append('<span class="sale-price">$1,299.99</span>')
+    parts.append('<div class="product-description">' + 'A very good widget. ' * 50 + '</div>')
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+
+# Per-field extractors: one soup.find/find_all per selector, as the scraper
+# extracted fields before SinglePassExtractor.
+
+def get_structured_data(soup: BeautifulSoup) -> Optional[Dict]:
+    """Extract product info from JSON-LD structured data if available"""
+    for script in soup.find_all('script', type='application/ld+json'):
+        try:
+            product = parse_structured_product(json.loads(script.string))
+            if product:
+                return product
+        except:
+            continue
+    return None
+
+
+def get_title(soup: BeautifulSoup) -> Optional[str]:
+    """Get product title using various selectors"""
+    selectors = [
+        # Common meta tags
+        ('meta', {'property': 'og:title'}),
+        ('meta', {'name': 'twitter:title'}),
+
+        # Common title elements
+        ('h1', {'class': re.compile(r'product.*title|title|name', re.I)}),
+        ('h1', {'id': re.compile(r'product.*title|title|name', re.I)}),
+        ('span', {'id': 'productTitle'}),    # Amazon
+        ('h1', {'itemprop': 'name'}),       # Schema.org
+        ('h1', {}),  # Any h1 as last resort
+    ]
+
+    for tag, attrs in selectors:
+        element = soup.find(tag, attrs)
+        if element:
+            if tag == 'meta':
+                return element.get('content')
+            text = element.text.strip()
+            if text:
+                return text
+    return None
+
+
+def get_price(soup: BeautifulSoup) -> Optional[float]:
+    """Get product price using various selectors"""
+    # Enhanced meta tag selectors
+    meta_selectors = [
+        ('meta', {'property': 'product:price:amount'}),
+        ('meta', {'property': 'og:price:amount'}),
+        ('meta', {'name': 'price'}),
+        ('meta', {'itemprop': 'price'}),
+        ('meta', {'name': 'product:price:amount'}),
+    ]
+
+    # Try meta tags first
+    for tag, attrs in meta_selectors:
+        element = soup.find(tag, attrs)
+        if element:
+            content = element.get('content', '')
+            try:
+                # Clean and convert
+                price_str = content.replace(',', '').replace('$', '').strip()
+                return float(price_str)
+            except ValueError:
+                continue
+
+    # HTML element selectors
+    selectors = [
+        ('span', {'class': re.compile(r'.*price.*', re.I)}),
+        ('div', {'class': re.compile(r'.*price.*', re.I)}),
+        ('span', {'itemprop': 'price'}),
+        ('p', {'class': re.compile(r'.*price.*', re.I)}),
+    ]
+
+    # Try HTML elements
+    for tag, attrs in selectors:
+        elements = soup.find_all(tag, attrs)
+        for element in elements:
+            price_text = ' '.join(element.stripped_strings)
+            price = extract_price_from_text(price_text)
+            if price:
+                return price
+
+    return None
+
+
+def get_image(soup: BeautifulSoup, base_url: str) -> Optional[str]:
+    """Get product image URL using various selectors"""
+    selectors = [
+        ('meta', {'property': 'og:image'}),
+        ('meta', {'property': 'product:image'}),
+        ('meta', {'name': 'twitter:image'}),
+        ('img', {'class': re.compile(r'product.*image|main.*image', re.I)}),
+        ('img', {'id': re.compile(r'product.*image|main.*image', re.I)}),
+    ]
+
+    for tag, attrs in selectors:
+        element = soup.find(tag, attrs)
+        if element:
+            if tag == 'meta':
+                url = element.get('content')
+            else:
+                url = element.get('src') or element.get('data-src')
+
+            if url and not url.startswith('data:'):
+                return urljoin(base_url, url)
+    return None
+
+
+def get_description(soup: BeautifulSoup) -> Optional[str]:
+    """Get product description using various selectors"""
+    selectors = [
+        ('meta', {'property': 'og:description'}),
+        ('meta', {'name': 'description'}),
+        ('div', {'class': re.compile(r'.*description.*', re.I)}),
+        ('div', {'id': re.compile(r'.*description.*', re.I)}),
+    ]
+
+    for tag, attrs in selectors:
+        element = soup.find(tag, attrs)
+        if element:
+            if tag == 'meta':
+                return element.get('content', '').strip()
+            text = element.text.strip()
+            if text and len(text) > 20:  # Avoid short/empty descriptions
+                return text[:500]  # Limit length
+    return None
+
+
+def get_all_images(soup: BeautifulSoup, base_url: str) -> List[str]:
+    """Get all product images from the page"""
+    images = set()
+
+    # Look for product images
+    for img in soup.find_all('img'):
+        src = img.get('src') or img.get('data-src')
+        if src and not src.startswith('data:'):
+            full_url = urljoin(base_url, src)
+            # Filter out tiny images (likely icons)
+            if 'icon' not in full_url.lower() and 'logo' not in full_url.lower():
+                images.add(full_url)
+
+    # Also check JSON-LD for images
+    for script in soup.find_all('script', type='application/ld+json'):
+        try:
+            data = json.loads(script.string)
+            if isinstance(data, list):
+                data = data[0]
+            if 'image' in data:
+                if isinstance(data['image'], str):
+                    images.add(urljoin(base_url, data['image']))
+                elif isinstance(data['image'], list):
+                    for img in data['image']:
+                        if isinstance(img, str):
+                            images.add(urljoin(base_url, img))
+        except:
+            continue
+
+    return list(images)[:20]  # Limit to 20 images
+
+
+def per_field(soup: BeautifulSoup) -> dict:
+    return {
+        'structured': get_structured_data(soup),
+        'title': get_title(soup),
+        'price': get_price(soup),
+        'image_url': get_image(soup, BASE_URL),
+        'description': get_description(soup),
+        'all_images': get_all_images(soup, BASE_URL),
+    }
+
+
+def single_pass(soup: BeautifulSoup) -> dict:
+    extractor = SinglePassExtractor(soup, BASE_URL)
+    data = extractor.generic()
+    data['structured'] = extractor.structured_data()
+    return data
+
+
+def best_of(fn, rounds: int = ROUNDS) -> float:
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def benchmark(name: str, html: str) -> bool:
+    soup = BeautifulSoup(html, 'lxml')
+
+    old = per_field(soup)
+    new = single_pass(soup)
+    identical = old == new
+
+    old_time = best_of(lambda: per_field(soup))
+    new_time = best_of(lambda: single_pass(soup))
+
+    print(f"\n{name} ({len(html) / 1024:.0f} KB)")
+    print(f"  Per-field:   {old_time * 1000:8.1f} ms")
+    print(f"  Single pass: {new_time * 1000:8.1f} ms")
+    print(f"  Speedup:     {old_time / new_time:8.1f}x")
+    print(f"  Results identical: {'✓' if identical else '✗'}")
+    if not identical:
+        for key in old:
+            if old[key] != new[key]:
+                print(f"    {key}: {old[key]!r} != {new[key]!r}")
+    return identical
+
+
+def main():
+    print("=" * 60)
+    print("Field extraction benchmark (best of %d)" % ROUNDS)
+    print("=" * 60)
+
+    pages = sys.argv[1:]
+    results = []
+    if pages:
+        for path in pages:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                results.append(benchmark(os.path.basename(path), f.read()))
+    else:
+        results.append(benchmark('Synthetic retailer page', synthetic_page()))
+
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
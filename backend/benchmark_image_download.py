@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+Measure peak memory of image ingestion: the streaming download_image_from_url
+path against the old read-everything path (response.content, verify(), a
+second decode and a full RGB copy).
+
+Each case runs in a fresh process and reports its peak RSS above the
+baseline after imports, so Pillow's pixel buffers are counted too.
+
+Usage:
+    python benchmark_image_download.py               # synthetic RGBA PNG and 4000x3000 JPEG
+    python benchmark_image_download.py photo.png ... # your own files
+"""
+
+import os
+import sys
+import time
+import importlib
+import resource
+import subprocess
+import tempfile
+from io import BytesIO
+
+# Setup Django
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+CHUNK = 64 * 1024
+
+
+class FileResponse:
+    """Just enough of a streamed requests.Response to replay a file from disk"""
+
+    def __init__(self, path):
+        self.path = path
+        self.status_code = 200
+        self.headers = {'Content-Type': 'image/png', 'Content-Length': str(os.path.getsize(path))}
+
+    @property
+    def content(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def iter_content(self, chunk_size=CHUNK):
+        with open(self.path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def old_path(response):
+    """download_image_from_url before streaming ingestion"""
+    from PIL import Image
+    content = response.content
+    img = Image.open(BytesIO(content))
+    img.verify()
+    img = Image.open(BytesIO(content))
+    img.load()
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        img = background
+    output = BytesIO()
+    img = img.convert('RGB')
+    img.save(output, format='JPEG', quality=85, optimize=True)
+    output.seek(0)
+    return output.read()
+
+
+def new_path(response):
+    from core.utils import http_client
+    from core.utils.image_downloader import download_image_from_url
+    http_client.get = lambda url, **kwargs: response
+    content_file, _ = download_image_from_url('https://images.example.com/bench.png')
+    return content_file.read()
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def child(mode: str, path: str):
+    import django
+    django.setup()
+    # Load what both paths use before taking the baseline, so only ingestion itself is measured
+    for module in ('PIL.Image', 'core.utils.image_downloader'):
+        importlib.import_module(module)
+    baseline = max_rss_mb()
+    start = time.perf_counter()
+    output = (old_path if mode == 'old' else new_path)(FileResponse(path))
+    seconds = time.perf_counter() - start
+    print(f"{max_rss_mb() - baseline:.1f} {seconds:.3f} {len(output)}")
+
+
+def synthetic_images(directory: str):
+    from PIL import Image
+    noise = Image.effect_noise((2400, 1600), 64).convert('RGB')
+    png = os.path.join(directory, 'hero.png')
+    noise.putalpha(255)
+    noise.save(png)
+    jpeg = os.path.join(directory, 'photo.jpg')
+    Image.effect_noise((4000, 3000), 32).convert('RGB').save(jpeg, quality=90)
+    return [png, jpeg]
+
+
+def run(mode: str, path: str):
+    result = subprocess.run([sys.executable, __file__, '--child', mode, path], capture_output=True, text=True,
+                            check=True)
+    peak, seconds, size = result.stdout.split()[-3:]
+    return float(peak), float(seconds), int(size)
+
+
+def main():
+    if sys.argv[1:2] == ['--child']:
+        child(sys.argv[2], sys.argv[3])
+        return
+
+    print("=" * 60)
+    print("Image ingestion peak memory (RSS above baseline)")
+    print("=" * 60)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = sys.argv[1:] or synthetic_images(directory)
+        for path in paths:
+            old_peak, old_seconds, _ = run('old', path)
+            new_peak, new_seconds, _ = run('new', path)
+            print(f"\n{os.path.basename(path)} ({os.path.getsize(path) / 1024 / 1024:.1f} MB)")
+            print(f"  Old: {old_peak:7.1f} MB peak  {old_seconds * 1000:7.0f} ms")
+            print(f"  New: {new_peak:7.1f} MB peak  {new_seconds * 1000:7.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
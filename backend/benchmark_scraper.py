@@ -0,0 +1,465 @@
+#!/usr/bin/env python
+"""
+Offline scraper benchmark and regression suite.
+
+Replays the recorded pages in scraper_fixtures/ through a local HTTP proxy,
+so every fetch goes through the real http_client session and the real
+ProductScraper tiers without touching the network. For each page it reports
+latency per fetch mode, a phase breakdown of the extraction strategies, peak
+Python memory and whether the data still matches the recorded expectation.
+
+Usage:
+    python benchmark_scraper.py                        # replay every fixture
+    python benchmark_scraper.py etsy amazon            # only fixtures matching these names
+    python benchmark_scraper.py --json run.json        # also write machine-readable results
+    python benchmark_scraper.py --compare base.json    # latency change against an earlier run
+    python benchmark_scraper.py --playwright           # also render through the browser pool (fast and full mode)
+    python benchmark_scraper.py --update-expected      # accept current output as expected
+    python benchmark_scraper.py --record NAME URL      # add a live page to the corpus
+
+Pages are replayed over plain HTTP, so relative image URLs resolve to http://.
+Exits non-zero when any page no longer matches its expected data.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import django
+
+# Setup Django
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+django.setup()
+
+from core.utils import browser_pool as browser_pool_module
+from core.utils import http_client
+from core.utils.extraction import SinglePassExtractor, decode_html
+from core.utils.scraper import PLAYWRIGHT_AVAILABLE, ProductScraper
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'scraper_fixtures')
+MANIFEST_PATH = os.path.join(FIXTURE_DIR, 'manifest.json')
+DEFAULT_CONTENT_TYPE = 'text/html; charset=utf-8'
+ROUNDS = 5
+
+# Fetch modes: (scraper options, fields that must match the expected data)
+FULL_FIELDS = ['title', 'price', 'image_url', 'description', 'all_images', 'scrape_method']
+MODES = {
+    'requests': ({'streaming': False, 'backend': 'bs4', 'gallery': True}, FULL_FIELDS),
+    'requests-lxml': ({'streaming': False, 'backend': 'lxml', 'gallery': True}, FULL_FIELDS),
+    # The default scrape_url path: the gallery is left for a later request
+    'no-gallery': ({'streaming': False, 'backend': 'lxml', 'gallery': False}, FULL_FIELDS[:4] + FULL_FIELDS[5:]),
+    # The early exit must give the same data as the full parse; only its method is called 'meta-tags'.
+    # Gallery scrapes read the whole page, so the gallery is left out to exercise the early exit
+    'streaming': ({'streaming': True, 'backend': 'bs4', 'gallery': False}, FULL_FIELDS[:4]),
+}
+STRATEGIES = ['json-ld', 'site-specific', 'generic', 'playwright']
+GALLERY_LIMIT = 20  # all_images is truncated from an unordered set, so only its size is stable at the limit
+SLOWER_THRESHOLD = 1.2  # --compare flags pages this much slower than the baseline
+
+
+def load_manifest() -> dict:
+    with open(MANIFEST_PATH) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict):
+    with open(MANIFEST_PATH, 'w') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+
+
+def replay_url(url: str) -> str:
+    """The fixture URL as fetched through the replay proxy"""
+    parsed = urlparse(url)
+    return parsed._replace(scheme='http').geturl()
+
+
+class ReplayServer:
+    """
+    Serves fixture pages as an HTTP forward proxy: the client asks for the
+    original absolute URL and gets the recorded body back, so domain-based
+    SITE_CONFIGS matching works unchanged.
+    """
+
+    def __init__(self, manifest: dict):
+        self.pages = {}
+        for name, entry in manifest.items():
+            with open(os.path.join(FIXTURE_DIR, name), 'rb') as f:
+                body = f.read()
+            content_type = entry.get('content_type', DEFAULT_CONTENT_TYPE)
+            self.pages[self._key(entry['url'])] = (body, content_type)
+        self.requests_served = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, like a real site
+            disable_nagle_algorithm = True  # Headers and body are separate writes
+
+            def do_GET(self):
+                page = server.pages.get(server._key(self.path))
+                server.requests_served += 1
+                if page is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body, content_type = page
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='replay-server', daemon=True)
+
+    @staticmethod
+    def _key(url: str) -> str:
+        parsed = urlparse(url)
+        host = parsed.netloc.lower()
+        host = host[4:] if host.startswith('www.') else host
+        return host + (parsed.path or '/') + (f'?{parsed.query}' if parsed.query else '')
+
+    @property
+    def proxy_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread.start()
+        http_client.get_session().proxies['http'] = self.proxy_url
+
+    def stop(self):
+        http_client.get_session().proxies.pop('http', None)
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def comparable(data: dict, fields) -> dict:
+    """The checked fields of a result, with the gallery order ignored"""
+    result = {}
+    for field in fields:
+        value = data.get(field)
+        if field == 'all_images' and not isinstance(value, int):
+            value = sorted(value or [])
+            if len(value) >= GALLERY_LIMIT:
+                value = len(value)
+        result[field] = value
+    return result
+
+
+def check(data: dict, expected: dict, fields) -> list:
+    """Names of fields that differ from the expected data"""
+    if expected is None:
+        return []
+    if not data:
+        return list(fields)
+    actual = comparable(data, fields)
+    wanted = comparable(expected, fields)
+    return [field for field in fields if actual[field] != wanted[field]]
+
+
+def run_mode(url: str, options: dict, rounds: int) -> dict:
+    """Fetch and extract one page `rounds` times through the requests tier"""
+    timings = []
+    data = None
+    for _ in range(rounds):
+        scraper = ProductScraper(url, use_cache=False, **options)
+        start = time.perf_counter()
+        data = scraper._scrape_with_requests()
+        timings.append(time.perf_counter() - start)
+
+    # Measure memory on an untimed run; tracemalloc slows everything down
+    tracemalloc.start()
+    try:
+        ProductScraper(url, use_cache=False, **options)._scrape_with_requests()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'ms_median': round(statistics.median(timings) * 1000, 2),
+        'ms_min': round(min(timings) * 1000, 2),
+        'peak_kb': round(peak / 1024, 1),
+        'scrape_method': data.get('scrape_method') if data else None,
+        'data': data,
+    }
+
+
+def run_playwright(url: str, fast_render: bool = True) -> dict:
+    scraper = ProductScraper(url, use_cache=False, fast_render=fast_render, gallery=True)
+    start = time.perf_counter()
+    data = scraper._scrape_with_playwright()
+    elapsed = time.perf_counter() - start
+    if data is None:
+        return {'error': 'render failed'}
+    return {
+        'ms_median': round(elapsed * 1000, 2),
+        'ms_min': round(elapsed * 1000, 2),
+        'scrape_method': data.get('scrape_method'),
+        'data': data,
+    }
+
+
+def time_phases(url: str, content: bytes, content_type: str, rounds: int) -> dict:
+    """Best-of timings for each extraction step on the bs4 backend"""
+    scraper = ProductScraper(url, use_cache=False, backend='bs4')
+    phases = {
+        'decode': lambda: decode_html(content, content_type),
+    }
+    html = decode_html(content, content_type)
+    phases['parse'] = lambda: scraper.backend.parse(html)
+    document = scraper.backend.parse(html)
+    phases['collect'] = lambda: SinglePassExtractor(document, scraper.url, scraper.backend)
+    extractor = SinglePassExtractor(document, scraper.url, scraper.backend)
+    phases['json-ld'] = extractor.structured_data
+    if scraper.site_config:
+        phases['site-specific'] = lambda: scraper._scrape_with_site_config(document, extractor)
+    phases['generic'] = extractor.generic
+
+    timings = {}
+    for phase, fn in phases.items():
+        best = None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[phase] = round(best * 1000, 3)
+    return timings
+
+
+def strategy_of(scrape_method: str) -> str:
+    if not scrape_method:
+        return 'failed'
+    if scrape_method.startswith('playwright'):
+        return 'playwright'
+    if scrape_method == 'generic-html':
+        return 'generic'
+    return scrape_method
+
+
+def benchmark_page(name: str, entry: dict, rounds: int, playwright: bool) -> dict:
+    url = replay_url(entry['url'])
+    with open(os.path.join(FIXTURE_DIR, name), 'rb') as f:
+        content = f.read()
+    content_type = entry.get('content_type', DEFAULT_CONTENT_TYPE)
+    expected = entry.get('expected')
+
+    page = {
+        'name': name,
+        'url': url,
+        'bytes': len(content),
+        'modes': {},
+        'phases_ms': time_phases(url, content, content_type, rounds),
+        'correct': True,
+    }
+
+    modes = dict(MODES)
+    if playwright:
+        modes['playwright'] = ({'fast_render': True}, ['title', 'price'])
+        modes['playwright-full'] = ({'fast_render': False}, ['title', 'price'])
+    for mode, (options, fields) in modes.items():
+        try:
+            if mode.startswith('playwright'):
+                result = run_playwright(url, **options)
+            else:
+                result = run_mode(url, options, rounds)
+        except Exception as e:
+            result = {'error': str(e)}
+        data = result.pop('data', None)
+        if 'error' not in result:
+            result['mismatches'] = check(data, expected, fields)
+            if mode == 'requests':
+                page['data'] = data
+        else:
+            result['mismatches'] = fields
+        result['correct'] = not result['mismatches']
+        page['correct'] = page['correct'] and (result['correct'] or mode.startswith('playwright'))
+        page['modes'][mode] = result
+
+    page['strategy'] = strategy_of(page['modes']['requests'].get('scrape_method'))
+    page['has_expected'] = expected is not None
+    return page
+
+
+def summarise(pages: list) -> dict:
+    """Latency of the requests tier grouped by the strategy that produced the data"""
+    by_strategy = {}
+    for page in pages:
+        by_strategy.setdefault(page['strategy'], []).append(page['modes']['requests'].get('ms_median'))
+        playwright = page['modes'].get('playwright')
+        if playwright and 'error' not in playwright:
+            by_strategy.setdefault('playwright', []).append(playwright['ms_median'])
+
+    strategies = {}
+    for strategy in STRATEGIES + sorted(set(by_strategy) - set(STRATEGIES)):
+        timings = [t for t in by_strategy.get(strategy, []) if t is not None]
+        if not timings:
+            continue
+        strategies[strategy] = {
+            'pages': len(timings),
+            'ms_median': round(statistics.median(timings), 2),
+            'ms_max': round(max(timings), 2),
+        }
+    return strategies
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def print_page(page: dict):
+    print(f"\n{page['name']} ({page['bytes'] / 1024:.0f} KB) [{page['strategy']}]")
+    for mode, result in page['modes'].items():
+        if 'error' in result:
+            print(f"  {mode:14} error: {result['error']}")
+            continue
+        status = '✓' if result['correct'] else '✗ ' + ', '.join(result['mismatches'])
+        peak = f"{result['peak_kb']:8.0f} KB peak" if 'peak_kb' in result else ''
+        print(f"  {mode:14} {result['ms_median']:8.2f} ms {peak}  {status}")
+    phases = '  '.join(f"{phase} {ms:.2f}" for phase, ms in page['phases_ms'].items())
+    print(f"  phases (ms)    {phases}")
+    if not page['has_expected']:
+        print("  (no expected data recorded; run with --update-expected)")
+
+
+def compare(report: dict, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    old_pages = {page['name']: page for page in baseline['pages']}
+
+    print(f"\nCompared with {baseline.get('commit') or baseline_path}:")
+    for page in report['pages']:
+        old = old_pages.get(page['name'])
+        if not old:
+            continue
+        for mode, result in page['modes'].items():
+            old_result = old['modes'].get(mode, {})
+            if 'ms_median' not in result or not old_result.get('ms_median'):
+                continue
+            ratio = result['ms_median'] / old_result['ms_median']
+            flag = '  SLOWER' if ratio > SLOWER_THRESHOLD else ''
+            print(f"  {page['name']:28} {mode:14} {old_result['ms_median']:8.2f} -> "
+                  f"{result['ms_median']:8.2f} ms ({(ratio - 1) * 100:+.0f}%){flag}")
+
+
+def record(name: str, url: str):
+    """Save a live page into the corpus with its current output as expected data"""
+    filename = name if name.endswith('.html') else f'{name}.html'
+    scraper = ProductScraper(url, use_cache=False, streaming=False)
+    response = http_client.get(url, headers=scraper.headers, timeout=15)
+    response.raise_for_status()
+    with open(os.path.join(FIXTURE_DIR, filename), 'wb') as f:
+        f.write(response.content)
+
+    manifest = load_manifest()
+    manifest[filename] = {
+        'url': url,
+        'content_type': response.headers.get('Content-Type', DEFAULT_CONTENT_TYPE),
+    }
+    save_manifest(manifest)
+    print(f"Recorded {url} -> scraper_fixtures/{filename} ({len(response.content) / 1024:.0f} KB)")
+    print("Check the page, then run with --update-expected to record its expected data")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline scraper benchmark and regression suite')
+    parser.add_argument('fixtures', nargs='*', help='only run fixtures whose file name contains one of these')
+    parser.add_argument('--rounds', type=int, default=ROUNDS)
+    parser.add_argument('--json', metavar='PATH', help='write results as JSON')
+    parser.add_argument('--compare', metavar='PATH', help='compare latency with an earlier --json run')
+    parser.add_argument('--playwright', action='store_true', help='also render each page in the browser pool')
+    parser.add_argument('--update-expected', action='store_true', help='store current output as expected data')
+    parser.add_argument('--record', nargs=2, metavar=('NAME', 'URL'), help='add a live page to the corpus')
+    args = parser.parse_args()
+
+    if args.record:
+        record(*args.record)
+        return
+
+    manifest = load_manifest()
+    names = [name for name in manifest if not args.fixtures or any(f in name for f in args.fixtures)]
+
+    server = ReplayServer(manifest)
+    server.start()
+    playwright = args.playwright and PLAYWRIGHT_AVAILABLE
+    if args.playwright and not PLAYWRIGHT_AVAILABLE:
+        print("Playwright is not installed; skipping browser renders")
+    if playwright:
+        browser_pool_module.LAUNCH_ARGS.append(f'--proxy-server={server.proxy_url}')
+
+    print("=" * 60)
+    print(f"Scraper benchmark: {len(names)} pages, median of {args.rounds}")
+    print("=" * 60)
+
+    pages = []
+    try:
+        for name in names:
+            page = benchmark_page(name, manifest[name], args.rounds, playwright)
+            print_page(page)
+            pages.append(page)
+    finally:
+        server.stop()
+
+    report = {
+        'generated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'rounds': args.rounds,
+        'pages': [{key: value for key, value in page.items() if key != 'data'} for page in pages],
+        'strategies': summarise(pages),
+        'summary': {
+            'pages': len(pages),
+            'correct': sum(1 for page in pages if page['correct']),
+            'unchecked': sum(1 for page in pages if not page['has_expected']),
+        },
+    }
+
+    print(f"\n{'Strategy':14} {'pages':>5} {'median ms':>10} {'max ms':>10}")
+    for strategy, row in report['strategies'].items():
+        print(f"{strategy:14} {row['pages']:5} {row['ms_median']:10.2f} {row['ms_max']:10.2f}")
+    print(f"\n{report['summary']['correct']}/{len(pages)} pages correct")
+
+    if args.compare:
+        compare(report, args.compare)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nWrote {args.json}")
+
+    if args.update_expected:
+        for page in pages:
+            manifest[page['name']]['expected'] = comparable(page['data'], FULL_FIELDS)
+        save_manifest(manifest)
+        print(f"Updated expected data for {len(pages)} pages")
+        return
+
+    sys.exit(0 if all(page['correct'] for page in pages) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Check that the lxml extraction backend returns the same data as BeautifulSoup
+on the recorded pages in scraper_fixtures/.
+
+Usage:
+    python compare_extraction_backends.py
+"""
+
+import sys
+import os
+import json
+import time
+import django
+
+# Setup Django
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+django.setup()
+
+from core.utils.scraper import ProductScraper
+from core.utils.extraction import CSSSELECT_AVAILABLE, decode_html
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'scraper_fixtures')
+
+
+def load_fixtures():
+    with open(os.path.join(FIXTURE_DIR, 'manifest.json')) as f:
+        manifest = json.load(f)
+    for name, entry in manifest.items():
+        with open(os.path.join(FIXTURE_DIR, name), 'rb') as f:
+            yield name, entry['url'], f.read()
+
+
+def extract(url, html, backend):
+    scraper = ProductScraper(url, use_cache=False, backend=backend, gallery=True)
+    start = time.perf_counter()
+    data = scraper.extract(html)
+    return data, time.perf_counter() - start
+
+
+def compare_fixture(name, url, content):
+    html = decode_html(content, 'text/html')
+    soup_data, soup_time = extract(url, html, 'bs4')
+    lxml_data, lxml_time = extract(url, html, 'lxml')
+
+    identical = soup_data == lxml_data
+    print(f"\n{name} [{soup_data.get('scrape_method')}]")
+    print(f"  bs4:  {soup_time * 1000:6.1f} ms")
+    print(f"  lxml: {lxml_time * 1000:6.1f} ms")
+    print(f"  Results identical: {'✓' if identical else '✗'}")
+    if not identical:
+        for key in soup_data:
+            if soup_data[key] != lxml_data.get(key):
+                print(f"    {key}: {soup_data[key]!r} != {lxml_data.get(key)!r}")
+    return identical
+
+
+def main():
+    print("=" * 60)
+    print("Extraction backend parity (bs4 vs lxml)")
+    print("=" * 60)
+
+    if not CSSSELECT_AVAILABLE:
+        print("\ncssselect is not installed; the lxml backend is unavailable")
+        sys.exit(1)
+
+    results = [compare_fixture(name, url, content) for name, url, content in load_fixtures()]
+    print(f"\n{sum(results)}/{len(results)} fixtures identical")
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
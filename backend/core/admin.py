@@ -5,4 +5,7 @@ from .models import *
 admin.site.register(User, UserAdmin)
 admin.site.register(WishList)
 admin.site.register(WishListItem) 
-admin.site.register(Notification)
\ No newline at end of file
+admin.site.register(Notification)
+admin.site.register(ScrapeJob)
+admin.site.register(ScrapeDomainStats)
+admin.site.register(StoredImage)
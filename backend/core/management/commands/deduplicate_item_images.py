@@ -0,0 +1,93 @@
+import os
+from django.core.management.base import BaseCommand
+from core.models import StoredImage, WishListItem
+from core.utils import image_store
+from core.utils.image_renditions import delete_renditions
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Move item images stored before content addressing into the image store, keeping one copy of each'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report the duplicates and the space they take without making changes',
+        )
+        parser.add_argument(
+            '--collect',
+            action='store_true',
+            help='Also delete stored images nothing has referenced for IMAGE_STORE_GRACE seconds',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        storage = WishListItem._meta.get_field('image').storage
+        stored_names = set(StoredImage.objects.values_list('name', flat=True))
+        items = [item for item in WishListItem.objects.exclude(image='').exclude(image__isnull=True)
+                 if item.image.name not in stored_names]
+        self.stdout.write(f"Found {len(items)} items with images outside the image store")
+
+        moved_count = 0
+        fail_count = 0
+        bytes_freed = 0
+        seen = {}  # digest -> size, for the dry run
+        for item in items:
+            old_name = item.image.name
+            try:
+                with storage.open(old_name, 'rb') as f:
+                    data = f.read()
+            except Exception as e:
+                fail_count += 1
+                self.stdout.write(self.style.ERROR(f"  ✗ {item.title} (ID: {item.id}): can't read {old_name}: {e}"))
+                continue
+
+            digest = image_store.digest_of(data)
+            duplicate = digest in seen or StoredImage.objects.filter(digest=digest, ref_count__gte=0).exists()
+            seen[digest] = len(data)
+            if dry_run:
+                if duplicate:
+                    bytes_freed += len(data)
+                    self.stdout.write(f"Would share: {item.title} - {old_name}")
+                continue
+
+            stored = image_store.store(data, os.path.splitext(old_name)[1])
+            renditions = image_store.renditions_for(stored, data)
+            if not WishListItem.objects.filter(id=item.id, image=old_name).update(
+                image=stored.name, image_renditions=renditions
+            ):
+                # Changed while we were copying it
+                image_store.release(stored.name)
+                continue
+
+            moved_count += 1
+            if not WishListItem.objects.filter(image=old_name).exists():
+                try:
+                    storage.delete(old_name)
+                    if duplicate:
+                        bytes_freed += len(data)
+                except Exception as e:
+                    logger.warning(f"Could not delete {old_name}: {e}")
+                if item.image_renditions != renditions:
+                    delete_renditions(storage, item.image_renditions)
+            self.stdout.write(self.style.SUCCESS(f"  ✓ {item.title} (ID: {item.id}): {old_name} -> {stored.name}"))
+
+        collected = image_store.collect_garbage() if options['collect'] and not dry_run else 0
+
+        # Summary
+        self.stdout.write("\n" + "=" * 50)
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes were made'))
+            self.stdout.write(f"Unique images: {len(seen)}")
+            self.stdout.write(f"Duplicate copies: {bytes_freed / 1024 / 1024:.1f} MB")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Moved into the image store: {moved_count}"))
+            self.stdout.write(self.style.SUCCESS(f"Duplicate copies removed: {bytes_freed / 1024 / 1024:.1f} MB"))
+            if collected:
+                self.stdout.write(f"Collected unreferenced images: {collected}")
+        if fail_count > 0:
+            self.stdout.write(self.style.ERROR(f"Unreadable: {fail_count}"))
+        self.stdout.write("=" * 50)
@@ -1,7 +1,9 @@
 from django.core.management.base import BaseCommand
 from core.models import WishListItem
-from core.utils.image_downloader import download_image_from_url, ImageDownloadException
-from core.utils.scraper import ProductScraper
+from core.utils.image_downloader import ImageDownloadException
+from core.utils.image_sources import fetch_image
+from core.utils import image_store
+from core.utils.batch_scraper import BatchScraper
 import logging
 
 logger = logging.getLogger(__name__)
@@ -66,6 +68,7 @@ class Command(BaseCommand):
         fail_count = 0
         skip_count = 0
         rescrape_count = 0
+        rescrape_items = []
 
         for item in items:
             # Skip if already has local image (unless force)
@@ -78,12 +81,14 @@ class Command(BaseCommand):
             # Try to download the existing image_url
             download_success = False
             try:
-                result = download_image_from_url(item.image_url)
-                if result:
-                    content_file, filename = result
+                # Unchanged images already in the image store aren't downloaded again
+                stored, data = fetch_image(item.image_url)
+                if stored:
+                    filename = stored.name
 
-                    # Save the image
-                    item.image.save(filename, content_file, save=False)
+                    # Attach the stored image; fetch_image took the item's reference to it
+                    item.image = stored.name
+                    item.image_renditions = image_store.renditions_for(stored, data)
 
                     # Clear image_url after successful download
                     old_url = item.image_url
@@ -108,82 +113,79 @@ class Command(BaseCommand):
                 )
                 logger.warning(f"Failed to download image for item {item.id}: {str(e)}")
 
-            # If download failed and rescrape is enabled and item has a link
+            # If download failed and rescrape is enabled and item has a link,
+            # queue it for the concurrent re-scrape pass below
             if not download_success and rescrape and item.link:
-                self.stdout.write(f"  → Attempting to re-scrape product page: {item.link}")
-
-                try:
-                    # Re-scrape the product page
-                    scraper = ProductScraper(item.link)
-                    scraped_data, error = scraper.scrape()
-
-                    if scraped_data and scraped_data.get('image_url'):
-                        new_image_url = scraped_data['image_url']
-                        self.stdout.write(f"  → Found new image from scrape: {new_image_url}")
-
-                        # Try to download the newly scraped image
-                        try:
-                            result = download_image_from_url(new_image_url)
-                            if result:
-                                content_file, filename = result
-
-                                # Save the image
-                                item.image.save(filename, content_file, save=False)
-
-                                # Clear old image_url
-                                item.image_url = ''
-
-                                # Save the model
-                                item.save()
-
-                                success_count += 1
-                                rescrape_count += 1
-                                self.stdout.write(
-                                    self.style.SUCCESS(
-                                        f"  ✓ Re-scraped and saved: {filename}"
-                                    )
-                                )
-                            else:
-                                fail_count += 1
-                                self.stdout.write(
-                                    self.style.ERROR(
-                                        f"  ✗ Failed to download re-scraped image"
-                                    )
+                rescrape_items.append(item)
+
+            elif not download_success:
+                # Download failed and either rescrape is disabled or item has no link
+                fail_count += 1
+                if not item.link:
+                    self.stdout.write(
+                        self.style.ERROR(
+                            "  ✗ No product link available for re-scraping"
+                        )
+                    )
+
+        if rescrape_items:
+            self.stdout.write(f"\nRe-scraping {len(rescrape_items)} product pages concurrently...")
+            batch = BatchScraper()
+            for index, url, scraped_data in batch.iter_results([item.link for item in rescrape_items]):
+                item = rescrape_items[index]
+                self.stdout.write(f"  → Re-scraped product page for {item.title} (ID: {item.id}): {url}")
+
+                if scraped_data.get('image_url'):
+                    new_image_url = scraped_data['image_url']
+                    self.stdout.write(f"  → Found new image from scrape: {new_image_url}")
+
+                    # Try to download the newly scraped image
+                    try:
+                        stored, data = fetch_image(new_image_url)
+                        if stored:
+                            filename = stored.name
+
+                            # Attach the stored image; fetch_image took the item's reference to it
+                            item.image = stored.name
+                            item.image_renditions = image_store.renditions_for(stored, data)
+
+                            # Clear old image_url
+                            item.image_url = ''
+
+                            # Save the model
+                            item.save()
+
+                            success_count += 1
+                            rescrape_count += 1
+                            self.stdout.write(
+                                self.style.SUCCESS(
+                                    f"  ✓ Re-scraped and saved: {filename}"
                                 )
-                        except (ImageDownloadException, Exception) as e:
+                            )
+                        else:
                             fail_count += 1
                             self.stdout.write(
                                 self.style.ERROR(
-                                    f"  ✗ Failed to download re-scraped image: {str(e)}"
+                                    "  ✗ Failed to download re-scraped image"
                                 )
                             )
-                    else:
+                    except (ImageDownloadException, Exception) as e:
                         fail_count += 1
-                        error_msg = error.get('error', 'No image found') if error else 'No image found'
                         self.stdout.write(
                             self.style.ERROR(
-                                f"  ✗ Re-scrape failed: {error_msg}"
+                                f"  ✗ Failed to download re-scraped image: {str(e)}"
                             )
                         )
-
-                except Exception as e:
+                        logger.error(f"Re-scrape error for item {item.id}: {str(e)}")
+                else:
                     fail_count += 1
+                    error_msg = scraped_data.get('error', 'No image found')
                     self.stdout.write(
                         self.style.ERROR(
-                            f"  ✗ Re-scrape error: {str(e)}"
-                        )
-                    )
-                    logger.error(f"Re-scrape error for item {item.id}: {str(e)}")
-
-            elif not download_success:
-                # Download failed and either rescrape is disabled or item has no link
-                fail_count += 1
-                if not item.link:
-                    self.stdout.write(
-                        self.style.ERROR(
-                            f"  ✗ No product link available for re-scraping"
+                            f"  ✗ Re-scrape failed: {error_msg}"
                         )
                     )
+            self.stdout.write(f"Re-scrape pass took {batch.stats['seconds']}s")
 
         # Summary
         self.stdout.write("\n" + "=" * 50)
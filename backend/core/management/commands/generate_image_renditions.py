@@ -0,0 +1,81 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from core.models import WishListItem
+from core.utils.image_renditions import IMAGE_RENDITION_WORKERS
+from core.utils.image_store import render_item
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _render(item, force):
+    try:
+        return render_item(item, force=force)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnail, card and detail renditions for wishlist item images that lack them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=IMAGE_RENDITION_WORKERS,
+            help='Number of images to render at once',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate renditions even for items that already have them',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be done without making changes',
+        )
+
+    def handle(self, *args, **options):
+        force = options['force']
+        items = WishListItem.objects.exclude(image='').exclude(image__isnull=True)
+        if not force:
+            items = items.filter(image_renditions={})
+        items = list(items.only('id', 'title', 'image', 'image_renditions'))
+        self.stdout.write(f"Found {len(items)} items needing renditions")
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
+            for item in items:
+                self.stdout.write(f"Would render: {item.title} - {item.image.name}")
+            return
+
+        success_count = 0
+        fail_count = 0
+        started = time.monotonic()
+        # Pillow releases the GIL while decoding, resizing and encoding, so threads render in parallel
+        with ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='image-renditions') as executor:
+            futures = {executor.submit(_render, item, force): item for item in items}
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    rendered = future.result()
+                except Exception as e:
+                    rendered = None
+                    logger.warning(f"Renditions of item {item.id} failed: {e}")
+                if rendered:
+                    success_count += 1
+                    self.stdout.write(self.style.SUCCESS(f"  ✓ {item.title} (ID: {item.id})"))
+                else:
+                    fail_count += 1
+                    self.stdout.write(self.style.ERROR(f"  ✗ {item.title} (ID: {item.id}): image unreadable or replaced"))
+
+        # Summary
+        self.stdout.write("\n" + "=" * 50)
+        self.stdout.write(self.style.SUCCESS(f"Rendered: {success_count} in {time.monotonic() - started:.1f}s"))
+        if fail_count > 0:
+            self.stdout.write(self.style.ERROR(f"Failed: {fail_count}"))
+        self.stdout.write("=" * 50)
@@ -0,0 +1,11 @@
+from core.management.worker_command import WorkerCommand
+from core.utils.image_ingest import ImageIngestWorker, IMAGE_INGEST_WORKERS, IMAGE_INGEST_POLL_INTERVAL
+
+
+class Command(WorkerCommand):
+    help = 'Download, process and attach pending wishlist item images, retrying failures with backoff'
+    worker_class = ImageIngestWorker
+    default_workers = IMAGE_INGEST_WORKERS
+    default_poll_interval = IMAGE_INGEST_POLL_INTERVAL
+    workers_help = 'Number of images to download at once'
+    once_help = 'Exit once no image is due instead of waiting for new ones'
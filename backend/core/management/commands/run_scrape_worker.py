@@ -0,0 +1,11 @@
+from core.management.worker_command import WorkerCommand
+from core.utils.scrape_jobs import ScrapeWorker, SCRAPE_JOB_WORKERS, SCRAPE_JOB_POLL_INTERVAL
+
+
+class Command(WorkerCommand):
+    help = 'Run queued product scrape jobs (from scrape_url with async=true) on a worker pool'
+    worker_class = ScrapeWorker
+    default_workers = SCRAPE_JOB_WORKERS
+    default_poll_interval = SCRAPE_JOB_POLL_INTERVAL
+    workers_help = 'Number of scrapes to run at once'
+    once_help = 'Exit once the queue is empty instead of waiting for new jobs'
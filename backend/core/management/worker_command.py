@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+
+class WorkerCommand(BaseCommand):
+    """
+    Base for commands that run a QueueWorker (core/utils/queue_worker.py)
+    in the foreground. Subclasses set worker_class, the defaults and the
+    help texts.
+    """
+
+    worker_class = None
+    default_workers = 4
+    default_poll_interval = 1.0
+    workers_help = 'Number of tasks to run at once'
+    once_help = 'Exit once nothing is due instead of waiting for new tasks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=self.default_workers,
+            help=self.workers_help,
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=self.default_poll_interval,
+            help='Seconds to wait between checks of an empty queue',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help=self.once_help,
+        )
+
+    def handle(self, *args, **options):
+        worker = self.worker_class(workers=options['workers'], poll_interval=options['poll_interval'])
+        label = worker.label.lower()
+        self.stdout.write(f"Starting {label} worker {worker.name} with {worker.workers} threads")
+        worker.run(once=options['once'])
+        self.stdout.write(self.style.SUCCESS(f"{worker.label} worker stopped"))
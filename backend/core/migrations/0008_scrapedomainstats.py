@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_scrapejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeDomainStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(max_length=255, unique=True)),
+                ('requests_attempts', models.PositiveIntegerField(default=0)),
+                ('requests_successes', models.PositiveIntegerField(default=0)),
+                ('requests_success_rate', models.FloatField(default=1.0)),
+                ('requests_latency_ms', models.FloatField(blank=True, null=True)),
+                ('playwright_attempts', models.PositiveIntegerField(default=0)),
+                ('playwright_successes', models.PositiveIntegerField(default=0)),
+                ('playwright_success_rate', models.FloatField(default=1.0)),
+                ('playwright_latency_ms', models.FloatField(blank=True, null=True)),
+                ('method_counts', models.JSONField(blank=True, default=dict)),
+                ('failure_codes', models.JSONField(blank=True, default=dict)),
+                ('preferred_tier', models.CharField(default='requests', max_length=20)),
+                ('scrapes_since_probe', models.PositiveIntegerField(default=0)),
+                ('last_probe_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Scrape domain stats',
+                'ordering': ['domain'],
+            },
+        ),
+    ]
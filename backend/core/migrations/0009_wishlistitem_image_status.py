@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:13
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def set_image_status(apps, schema_editor):
+    """Items with a file are ready; an image_url without one is queued for the ingestion worker"""
+    WishListItem = apps.get_model('core', 'WishListItem')
+    WishListItem.objects.exclude(image='').exclude(image__isnull=True).update(image_status='ready')
+    WishListItem.objects.filter(image_status='none').exclude(image_url='').update(
+        image_status='pending', image_next_attempt_at=timezone.now()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_scrapedomainstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wishlistitem',
+            name='image_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='wishlistitem',
+            name='image_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='wishlistitem',
+            name='image_next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='wishlistitem',
+            name='image_status',
+            field=models.CharField(choices=[('none', 'No image'), ('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='none', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='wishlistitem',
+            index=models.Index(fields=['image_status', 'image_next_attempt_at'], name='core_wishli_image_s_7e90fb_idx'),
+        ),
+        migrations.RunPython(set_image_status, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_wishlistitem_image_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wishlistitem',
+            name='image_renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -1,6 +1,9 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
-from .utils.image_downloader import download_image_from_url, ImageDownloadException
+from django.db import models, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+import os
 import logging
 
 logger = logging.getLogger(__name__)
@@ -43,6 +46,13 @@ class WishListItem(models.Model):
         ('Medium', 'Medium'),      # $51-100
         ('Large', 'Large'),        # $100+
     ]
+    IMAGE_STATUSES = [
+        ('none', 'No image'),
+        ('pending', 'Pending'),        # image_url waiting for the ingestion worker
+        ('processing', 'Processing'),  # Being downloaded
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),          # Gave up after IMAGE_INGEST_MAX_ATTEMPTS; image_url is kept
+    ]
     
     wishlist = models.ForeignKey(WishList, on_delete=models.CASCADE, related_name='items')
     title = models.CharField(max_length=200)
@@ -51,6 +61,11 @@ class WishListItem(models.Model):
     link = models.URLField(blank=True, max_length=2000)
     image = models.ImageField(upload_to='wishlist_items/', blank=True, null=True)
     image_url = models.URLField(blank=True, max_length=1000)
+    image_status = models.CharField(max_length=10, choices=IMAGE_STATUSES, default='none')
+    image_attempts = models.PositiveSmallIntegerField(default=0)
+    image_next_attempt_at = models.DateTimeField(null=True, blank=True)  # Retry time, or lease expiry while processing
+    image_error = models.TextField(blank=True)
+    image_renditions = models.JSONField(default=dict, blank=True)  # Resized copies of image; see core/utils/image_renditions.py
     size = models.CharField(max_length=10, choices=SIZES, default='Medium')
     priority = models.IntegerField(default=3)
     is_purchased = models.BooleanField(default=False)
@@ -59,28 +74,58 @@ class WishListItem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Columns written by the ingestion worker; a save that doesn't change the image leaves them alone
+    INGEST_FIELDS = ('image', 'image_url', 'image_status', 'image_attempts', 'image_next_attempt_at',
+                     'image_error', 'image_renditions')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_image_url = instance.__dict__.get('image_url')  # Lets save() notice a new image_url
+        instance._saved_image = instance.__dict__.get('image')  # Name of the stored image this item holds a reference to
+        return instance
+
     def save(self, *args, **kwargs):
-        # Download image from URL if image_url is provided and no image file exists
-        if self.image_url and not self.image:
-            try:
-                logger.info(f"Downloading image from URL: {self.image_url}")
-                result = download_image_from_url(self.image_url)
-                if result:
-                    content_file, filename = result
-                    self.image.save(filename, content_file, save=False)
-                    # Clear image_url after successful download
-                    self.image_url = ''
-                    logger.info(f"Successfully saved image as: {filename}")
-            except ImageDownloadException as e:
-                logger.error(f"Failed to download image from {self.image_url}: {str(e)}")
-                # Keep the image_url if download fails, but continue saving the model
-            except Exception as e:
-                logger.error(f"Unexpected error downloading image: {str(e)}")
-                # Keep the image_url if download fails, but continue saving the model
-
-        # Clear image_url if uploading a new image file
-        elif self.image and self.image_url:
-            self.image_url = ''
+        # An image_url without a file is queued for the ingestion worker
+        # (core/utils/image_ingest.py) instead of being downloaded here
+        queued = False
+        render = False
+        uploaded = bool(self.image) and not self.image._committed
+        loaded = self.pk is not None and hasattr(self, '_saved_image_url') and not kwargs.get('force_insert')
+        image_changed = (not loaded or uploaded or self.image_url != self._saved_image_url
+                         or (self.image.name if self.image else None) != (self._saved_image or None))
+        if not image_changed and 'update_fields' not in kwargs:
+            # The image may have been ingested since this instance was loaded (e.g. purchase, PATCH);
+            # write everything else so a stale copy can't undo it
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.INGEST_FIELDS]
+        if image_changed:
+            if not self.image:
+                self.image_renditions = {}
+            if uploaded:
+                # Uploaded files go into the content-addressed store (core/utils/image_store.py)
+                from .utils import image_store
+                self.image.open('rb')
+                self.image.seek(0)
+                stored = image_store.store(self.image.read(), os.path.splitext(self.image.name)[1])
+                self.image.name = stored.name
+                self.image._committed = True
+                self.image_renditions = stored.renditions
+                render = not stored.renditions
+            if self.image:
+                # Clear image_url if uploading a new image file
+                self.image_url = ''
+                self.image_status = 'ready'
+            elif self.image_url:
+                # Only a new image_url is queued; a failed one stays failed until it is retried or replaced
+                if self.image_url != getattr(self, '_saved_image_url', None):
+                    self.image_status = 'pending'
+                    self.image_attempts = 0
+                    self.image_error = ''
+                    self.image_next_attempt_at = timezone.now()
+                    queued = True
+            else:
+                self.image_status = 'none'
 
         # Size logic...
         if self.price is not None:
@@ -93,12 +138,54 @@ class WishListItem(models.Model):
             else:
                 self.size = 'Large'
         super().save(*args, **kwargs)
+        if not image_changed:
+            self.refresh_from_db(fields=self.INGEST_FIELDS)
+        self._saved_image_url = self.image_url
+        # Drop the reference to the image this item held before; store() took one for the new image
+        saved_image = getattr(self, '_saved_image', None)
+        self._saved_image = self.image.name if self.image else None
+        if image_changed and saved_image and (saved_image != self._saved_image or uploaded):
+            from .utils import image_store
+            image_store.release(saved_image)
+
+        if queued:
+            from .utils import image_ingest
+            item_id = self.id
+            transaction.on_commit(lambda: image_ingest.schedule(item_id))
+        elif render:
+            from .utils import image_ingest
+            item_id = self.id
+            transaction.on_commit(lambda: image_ingest.schedule_renditions(item_id))
     
     def __str__(self):
         return self.title
 
     class Meta:
         ordering = ['priority', '-created_at']
+        indexes = [models.Index(fields=['image_status', 'image_next_attempt_at'])]
+
+@receiver(post_delete, sender=WishListItem)
+def release_item_image(sender, instance, **kwargs):
+    """Also runs for items deleted along with their wishlist, which never call delete()"""
+    if instance.image:
+        from .utils import image_store
+        image_store.release(instance.image.name)
+
+class StoredImage(models.Model):
+    """An item image stored once under the SHA-256 of its bytes and shared by every item showing it"""
+    digest = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, unique=True)  # Path in the item image storage
+    size = models.PositiveIntegerField()
+    renditions = models.JSONField(default=dict, blank=True)  # Shared rendition map; see core/utils/image_renditions.py
+    ref_count = models.IntegerField(default=0)  # Items using it; -1 while garbage collection deletes it
+    released_at = models.DateTimeField(null=True, blank=True)  # When ref_count last dropped to 0
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+    class Meta:
+        indexes = [models.Index(fields=['ref_count', 'released_at'])]
 
 class Notification(models.Model):
     TYPES = [
@@ -114,4 +201,70 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        ordering = ['-created_at'] 
\ No newline at end of file
+        ordering = ['-created_at'] 
+class ScrapeJob(models.Model):
+    STATUSES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='scrape_jobs')
+    url = models.URLField(max_length=2000)
+    refresh = models.BooleanField(default=False)  # Skip the scrape cache
+    status = models.CharField(max_length=10, choices=STATUSES, default='queued')
+    result = models.JSONField(null=True, blank=True)  # ProductScraper.scrape() output
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed')
+
+    @property
+    def queue_seconds(self):
+        if not self.started_at:
+            return None
+        return (self.started_at - self.created_at).total_seconds()
+
+    @property
+    def run_seconds(self):
+        if not self.started_at or not self.finished_at:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
+
+    def __str__(self):
+        return f"{self.url} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+class ScrapeDomainStats(models.Model):
+    """Scrape outcomes learned per domain, used to pick the starting tier"""
+    domain = models.CharField(max_length=255, unique=True)
+    requests_attempts = models.PositiveIntegerField(default=0)
+    requests_successes = models.PositiveIntegerField(default=0)
+    requests_success_rate = models.FloatField(default=1.0)  # Exponentially weighted, recent scrapes count most
+    requests_latency_ms = models.FloatField(null=True, blank=True)
+    playwright_attempts = models.PositiveIntegerField(default=0)
+    playwright_successes = models.PositiveIntegerField(default=0)
+    playwright_success_rate = models.FloatField(default=1.0)
+    playwright_latency_ms = models.FloatField(null=True, blank=True)
+    method_counts = models.JSONField(default=dict, blank=True)  # scrape_method -> successful scrapes
+    failure_codes = models.JSONField(default=dict, blank=True)  # e.g. '403', 'timeout', 'empty' -> count
+    preferred_tier = models.CharField(max_length=20, default='requests')
+    scrapes_since_probe = models.PositiveIntegerField(default=0)
+    last_probe_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.domain} ({self.preferred_tier} first)"
+
+    class Meta:
+        ordering = ['domain']
+        verbose_name_plural = 'Scrape domain stats'
@@ -1,5 +1,7 @@
 from rest_framework import serializers
 from .models import User, Family, WishList, WishListItem, Notification
+from .utils.image_prefetch import image_prefetcher
+from .utils import image_store
 
 class UserSerializer(serializers.ModelSerializer):
     full_name = serializers.SerializerMethodField()
@@ -67,18 +69,22 @@ class FamilySerializer(serializers.ModelSerializer):
 
 class WishListItemSerializer(serializers.ModelSerializer):
     purchased_by = UserSerializer(read_only=True)
+    # Token from scrape_url or prefetch_image whose already-downloaded image_url is attached on save
+    image_token = serializers.CharField(write_only=True, required=False, allow_blank=True)
+    # {'thumbnail'|'card'|'detail': {width, height, webp, jpeg}} so clients can fetch the smallest adequate image
+    image_renditions = serializers.SerializerMethodField()
     
     class Meta:
         model = WishListItem
         fields = (
             'id', 'title', 'description', 'price', 'link', 
-            'image', 'image_url', 'size', 'priority',
+            'image', 'image_url', 'image_token', 'image_status', 'image_renditions', 'size', 'priority',
             'is_purchased', 'purchased_at', 'purchased_by',
             'created_at', 'updated_at', 'wishlist'
         )
         read_only_fields = (
             'id', 'created_at', 'updated_at', 
-            'purchased_by', 'purchased_at'
+            'purchased_by', 'purchased_at', 'image_status'
         )
 
     def to_representation(self, instance):
@@ -93,6 +99,20 @@ class WishListItemSerializer(serializers.ModelSerializer):
         
         return data
 
+    def get_image_renditions(self, obj):
+        if not obj.image or not obj.image_renditions:
+            return {}
+        storage = obj.image.storage
+        request = self.context.get('request')
+        renditions = {}
+        for name, rendition in obj.image_renditions.items():
+            entry = dict(rendition)
+            for key in ('webp', 'jpeg'):
+                url = storage.url(rendition[key])
+                entry[key] = request.build_absolute_uri(url) if request else url
+            renditions[name] = entry
+        return renditions
+
     def validate(self, data):
         """Ensure either image or image_url is provided on creation"""
         # Only validate on creation (when instance doesn't exist)
@@ -107,20 +127,39 @@ class WishListItemSerializer(serializers.ModelSerializer):
 
         return data
 
+    def _attach_prefetched_image(self, validated_data, instance=None):
+        """Attach the stored image prefetched for image_url, if image_token has one, so nothing is queued to download"""
+        token = validated_data.pop('image_token', None)
+        image_url = validated_data.get('image_url')
+        request = self.context.get('request')
+        if not token or not image_url or validated_data.get('image') or not request:
+            return
+        stored = image_prefetcher.claim(token, request.user.id, image_url)
+        if stored is None:
+            return
+        if instance is not None and instance.image and instance.image.name == stored.name:
+            # Already showing it; keep the one reference the item has
+            image_store.release(stored.name)
+        validated_data['image'] = stored.name
+        validated_data['image_renditions'] = stored.renditions
+
     def create(self, validated_data):
+        self._attach_prefetched_image(validated_data)
         # Ensure image_url is saved
         image_url = validated_data.get('image_url', '')
         instance = super().create(validated_data)
-        if image_url:
+        # Only save again if it didn't stick; a second full save would overwrite the ingestion status
+        if image_url and instance.image_url != image_url:
             instance.image_url = image_url
             instance.save()
         return instance
 
     def update(self, instance, validated_data):
+        self._attach_prefetched_image(validated_data, instance)
         # Ensure image_url is updated
         image_url = validated_data.get('image_url', instance.image_url)
         instance = super().update(instance, validated_data)
-        if image_url:
+        if image_url and instance.image_url != image_url:
             instance.image_url = image_url
             instance.save()
         return instance
@@ -0,0 +1,200 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Tuple
+from urllib.parse import urlparse
+
+from django.db import close_old_connections
+
+from .scraper import ProductScraper
+
+logger = logging.getLogger(__name__)
+
+# Batch scraping limits
+BATCH_MAX_IN_FLIGHT = int(os.getenv('BATCH_MAX_IN_FLIGHT', '16'))  # Scrapes running at once across all domains
+BATCH_PER_DOMAIN = int(os.getenv('BATCH_PER_DOMAIN', '2'))  # Scrapes running at once against one domain
+BATCH_DOMAIN_INTERVAL = float(os.getenv('BATCH_DOMAIN_INTERVAL', '1.0'))  # Min seconds between starts per domain
+
+# A result is (input index, url, scraped data)
+BatchResult = Tuple[int, str, Dict]
+
+
+def _domain_key(url: str) -> str:
+    host = urlparse(url).netloc.lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+class _DomainLimiter:
+    """Concurrency cap plus a minimum spacing between request starts for one domain"""
+
+    def __init__(self, concurrency: int, interval: float):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.interval = interval
+        self.next_start = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait_turn(self):
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            delay = self.next_start - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.next_start = loop.time() + self.interval
+
+
+class BatchScraper:
+    """
+    Scrape many product URLs concurrently.
+
+    Each URL goes through the same ProductScraper.scrape() as the add-item
+    flow (cache, JSON-LD, SITE_CONFIGS, generic, Playwright), so results are
+    identical to the synchronous path. asyncio schedules the work and enforces
+    the global in-flight cap and per-domain concurrency/rate limits; the
+    blocking scrape itself runs on a thread pool.
+    """
+
+    def __init__(self, max_in_flight: int = BATCH_MAX_IN_FLIGHT, per_domain: int = BATCH_PER_DOMAIN,
+                 domain_interval: float = BATCH_DOMAIN_INTERVAL, use_cache: bool = True):
+        self.max_in_flight = max_in_flight
+        self.per_domain = per_domain
+        self.domain_interval = domain_interval
+        self.use_cache = use_cache
+        self.stats = {'scraped': 0, 'succeeded': 0, 'failed': 0, 'seconds': 0.0}
+
+    def _scrape_one(self, url: str) -> Dict:
+        try:
+            return ProductScraper(url, use_cache=self.use_cache).scrape()
+        except Exception as e:
+            logger.error(f"Batch scrape of {url} raised: {e}")
+            return {
+                'title': None,
+                'price': None,
+                'image_url': None,
+                'description': None,
+                'all_images': [],
+                'scrape_method': 'failed',
+                'error': str(e)
+            }
+        finally:
+            # Scrapes record domain stats through the ORM; don't leave this pool thread's connection open
+            close_old_connections()
+
+    async def stream(self, urls: Iterable[str], ordered: bool = False) -> AsyncIterator[BatchResult]:
+        """
+        Yield (index, url, data) for every URL as scrapes complete.
+        With ordered=True results are yielded in input order instead, each one
+        as soon as it and everything before it has finished.
+        """
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='batch-scrape')
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        # Bound how far ahead of the running scrapes the input is consumed
+        window = asyncio.Semaphore(self.max_in_flight * 4)
+        limiters: Dict[str, _DomainLimiter] = {}
+        results: asyncio.Queue = asyncio.Queue()
+        # The loop only holds weak references to tasks; keep them so none is collected mid-run
+        tasks = set()
+        started = time.monotonic()
+
+        def spawn(coroutine) -> asyncio.Task:
+            task = asyncio.ensure_future(coroutine)
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            return task
+
+        async def run(index: int, url: str):
+            try:
+                limiter = limiters.setdefault(
+                    _domain_key(url), _DomainLimiter(self.per_domain, self.domain_interval)
+                )
+                async with limiter.semaphore:
+                    await limiter.wait_turn()
+                    async with in_flight:
+                        data = await loop.run_in_executor(executor, self._scrape_one, url)
+            except Exception as e:
+                data = {'scrape_method': 'failed', 'error': str(e)}
+            await results.put((index, url, data))
+
+        async def feed():
+            count = 0
+            for index, url in enumerate(urls):
+                await window.acquire()
+                spawn(run(index, url))
+                count += 1
+            return count
+
+        feeder = spawn(feed())
+        pending: Dict[int, BatchResult] = {}
+        next_index = 0
+        received = 0
+        try:
+            while not (feeder.done() and received == feeder.result()):
+                getter = spawn(results.get())
+                done, _ = await asyncio.wait({getter, feeder}, return_when=asyncio.FIRST_COMPLETED)
+                if getter not in done:
+                    getter.cancel()
+                    continue
+                result = getter.result()
+                received += 1
+                window.release()
+                self._record(result[2])
+
+                if not ordered:
+                    yield result
+                    continue
+                pending[result[0]] = result
+                while next_index in pending:
+                    yield pending.pop(next_index)
+                    next_index += 1
+        finally:
+            # Stopped early (consumer gone, cancelled or an error): don't leave scrapes running behind us
+            for task in list(tasks):
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.stats['seconds'] = round(time.monotonic() - started, 2)
+
+    def _record(self, data: Dict):
+        self.stats['scraped'] += 1
+        if data.get('title') or data.get('price'):
+            self.stats['succeeded'] += 1
+        else:
+            self.stats['failed'] += 1
+
+    def iter_results(self, urls: Iterable[str], ordered: bool = False) -> Iterator[BatchResult]:
+        """
+        Synchronous wrapper around stream() for scripts and management commands.
+        The event loop runs on a background thread, so each result can be
+        handled (e.g. saved with the Django ORM) as soon as it arrives.
+        """
+        handoff: queue.Queue = queue.Queue(maxsize=self.max_in_flight)
+        done = object()
+
+        async def produce():
+            async for result in self.stream(urls, ordered=ordered):
+                await asyncio.get_running_loop().run_in_executor(None, handoff.put, result)
+
+        def run_loop():
+            try:
+                asyncio.run(produce())
+            except Exception as e:
+                logger.exception(f"Batch scrape aborted: {e}")
+            finally:
+                handoff.put(done)
+
+        thread = threading.Thread(target=run_loop, name='batch-scrape-loop', daemon=True)
+        thread.start()
+        while True:
+            result = handoff.get()
+            if result is done:
+                break
+            yield result
+        thread.join()
+
+    def scrape_all(self, urls: Iterable[str]) -> List[Dict]:
+        """Scrape every URL and return the results in input order"""
+        return [data for _, _, data in self.iter_results(urls, ordered=True)]
@@ -0,0 +1,445 @@
+import atexit
+import contextvars
+import json
+import os
+import queue
+import re
+import tempfile
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+
+from . import timing
+
+logger = logging.getLogger(__name__)
+
+# Pool settings
+BROWSER_POOL_SIZE = int(os.getenv('BROWSER_POOL_SIZE', '2'))  # Warm Chromium processes (global render concurrency)
+BROWSER_MAX_PAGES = int(os.getenv('BROWSER_MAX_PAGES', '100'))  # Recycle a browser after this many pages
+BROWSER_MAX_MEMORY_MB = int(os.getenv('BROWSER_MAX_MEMORY_MB', '768'))  # Recycle when a browser grows past this
+BROWSER_CONTEXTS_PER_WORKER = int(os.getenv('BROWSER_CONTEXTS_PER_WORKER', '8'))  # Domain contexts kept open
+BROWSER_QUEUE_TIMEOUT = float(os.getenv('BROWSER_QUEUE_TIMEOUT', '60'))  # Max seconds to wait for a render
+CANCEL_POLL_INTERVAL = 0.05  # Seconds between checks of a render's cancel event
+DOMAIN_STATS_LIMIT = 200  # Domains whose render times are kept, least recently rendered dropped first
+
+LAUNCH_ARGS = ['--no-sandbox', '--disable-setuid-sandbox']  # Required for some environments
+CONTEXT_OPTIONS = {
+    'viewport': {'width': 1920, 'height': 1080},
+    'locale': 'en-US',
+}
+
+
+class BrowserPoolError(Exception):
+    """Exception raised when the pool cannot render a page"""
+    pass
+
+
+def _process_table():
+    """(parent pid -> child pids, pid -> resident pages) for every process, or None off Linux"""
+    if not os.path.isdir('/proc'):
+        return None
+    children = {}
+    rss_pages = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # Fields after the ")" that closes the command name
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        pid = int(entry)
+        children.setdefault(int(fields[1]), []).append(pid)
+        rss_pages[pid] = int(fields[21])
+    return children, rss_pages
+
+
+def _descendants(table, root: int):
+    children, _ = table
+    pending = list(children.get(root, []))
+    while pending:
+        pid = pending.pop()
+        yield pid
+        pending.extend(children.get(pid, []))
+
+
+def _is_browser_process(pid: int) -> bool:
+    """A Chromium main process, as opposed to one of its helpers or the Playwright driver"""
+    try:
+        with open(f'/proc/{pid}/cmdline', 'rb') as f:
+            args = f.read().decode(errors='replace').split('\0')
+    except OSError:
+        return False
+    executable = os.path.basename(args[0]).lower()
+    return ('chrom' in executable or 'headless_shell' in executable) and not any(
+        arg.startswith('--type=') for arg in args
+    )
+
+
+def _tree_rss_mb(root: int) -> Optional[float]:
+    """Resident memory of a process and all its descendants (Linux only)"""
+    table = _process_table()
+    if table is None:
+        return None
+    _, rss_pages = table
+    if root not in rss_pages:
+        return None
+    total = rss_pages[root] + sum(rss_pages.get(pid, 0) for pid in _descendants(table, root))
+    return total * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+class RenderJob:
+    def __init__(self, url: str, domain: str, handler: Callable, user_agent: Optional[str], mode: str = 'full'):
+        self.url = url
+        self.domain = domain
+        self.handler = handler
+        self.user_agent = user_agent
+        self.mode = mode  # 'fast' or 'full' render, for per-domain timing
+        self.context = contextvars.copy_context()  # The caller's timing trace, for phases timed on the worker
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.cancelled = False
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+
+
+class _BrowserWorker(threading.Thread):
+    """
+    Owns one Chromium process. Playwright's sync API is bound to the thread that
+    started it, so every browser lives on its own worker thread and pulls jobs
+    from the shared pool queue.
+    """
+
+    def __init__(self, pool: 'BrowserPool', index: int):
+        super().__init__(name=f'browser-pool-{index}', daemon=True)
+        self.pool = pool
+        self.playwright = None
+        self.browser = None
+        self.browser_pid = None  # Chromium's main process, to measure this browser's own memory
+        self.contexts = OrderedDict()  # domain -> BrowserContext, least recently used first
+        self.pages_served = 0
+        self.busy = False
+
+    def run(self):
+        while True:
+            job = self.pool.queue.get()
+            if job is None:
+                break
+            if job.cancelled:
+                # The caller gave up waiting; don't spend a browser on it
+                continue
+            self.busy = True
+            job.started_at = time.monotonic()
+            try:
+                job.result = job.context.run(self._render, job)
+            except Exception as e:
+                job.error = e
+            finally:
+                job.finished_at = time.monotonic()
+                self.busy = False
+                self.pool._record(job)
+                job.done.set()
+                self._recycle_if_needed()
+        self._close_browser()
+
+    def _ensure_browser(self):
+        if self.browser and self.browser.is_connected():
+            return
+        from playwright.sync_api import sync_playwright
+        # Playwright doesn't expose the browser's pid: starts and launches are serialised so
+        # this worker's Chromium is the one new browser process that appears under ours
+        with self.pool._launch_lock:
+            before = _process_table()
+            if self.playwright is None:
+                self.playwright = sync_playwright().start()
+            try:
+                self.browser = self.playwright.chromium.launch(headless=True, args=LAUNCH_ARGS)
+            except Exception as launch_error:
+                logger.error(f"Failed to launch Playwright browser: {launch_error}")
+                logger.info("Consider running: python -m playwright install chromium")
+                raise
+            self.browser_pid = self._find_browser_pid(before)
+        self.pool._incr('launches')
+        logger.info(f"{self.name}: launched Chromium (pid {self.browser_pid})")
+
+    @staticmethod
+    def _find_browser_pid(before) -> Optional[int]:
+        after = _process_table()
+        if before is None or after is None:
+            return None
+        launched = set(_descendants(after, os.getpid())) - set(_descendants(before, os.getpid()))
+        # Renders in other browsers spawn processes meanwhile, but only as --type=renderer/gpu-process/...
+        # helpers; the main browser process is the only Chromium process without a --type switch
+        roots = [pid for pid in launched if _is_browser_process(pid)]
+        if len(roots) != 1:
+            logger.warning(f"Could not identify the Chromium process ({len(roots)} candidates); "
+                           f"memory recycling is off for this browser")
+            return None
+        return roots[0]
+
+    def memory_mb(self) -> Optional[float]:
+        """Resident memory of this worker's Chromium and its renderer/GPU processes"""
+        if not self.browser or self.browser_pid is None:
+            return None
+        return _tree_rss_mb(self.browser_pid)
+
+    def _context_for(self, job: RenderJob):
+        key = (job.domain, job.user_agent)
+        context = self.contexts.get(key)
+        if context is not None:
+            self.contexts.move_to_end(key)
+            return context
+
+        options = dict(CONTEXT_OPTIONS)
+        if job.user_agent:
+            options['user_agent'] = job.user_agent
+        state_path = self.pool.state_path(job.domain)
+        if os.path.exists(state_path):
+            options['storage_state'] = state_path
+        context = self.browser.new_context(**options)
+        self.contexts[key] = context
+
+        while len(self.contexts) > BROWSER_CONTEXTS_PER_WORKER:
+            (domain, _), oldest = self.contexts.popitem(last=False)
+            self._close_context(domain, oldest)
+        return context
+
+    def _save_state(self, domain: str, context):
+        """
+        Persist the context's cookies/localStorage for domain. The file is
+        shared by every worker and process, so it is written to a temporary
+        file and swapped in; a new context never reads a half-written one.
+        """
+        path = self.pool.state_path(domain)
+        try:
+            state = context.storage_state()
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.state-', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(state, f)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except Exception as e:
+            logger.debug(f"Could not persist storage state for {domain}: {e}")
+
+    def _close_context(self, domain: str, context):
+        self._save_state(domain, context)
+        try:
+            context.close()
+        except Exception:
+            pass
+
+    def _render(self, job: RenderJob):
+        timing.record('render-queue', job.started_at - job.enqueued_at)
+        with timing.phase('browser-launch'):
+            self._ensure_browser()
+        with timing.phase('browser-context'):
+            context = self._context_for(job)
+            page = context.new_page()
+        try:
+            return job.handler(page)
+        finally:
+            self.pages_served += 1
+            try:
+                page.close()
+            except Exception:
+                pass
+            # Keep cookies/consent choices so the next visit to this domain renders faster
+            self._save_state(job.domain, context)
+
+    def _recycle_if_needed(self):
+        if not self.browser:
+            return
+        reason = None
+        if self.pages_served >= BROWSER_MAX_PAGES:
+            reason = f"served {self.pages_served} pages"
+        else:
+            memory_mb = self.memory_mb()
+            if memory_mb is not None and memory_mb > BROWSER_MAX_MEMORY_MB:
+                reason = f"using {memory_mb:.0f} MB"
+        if reason:
+            logger.info(f"{self.name}: recycling Chromium ({reason})")
+            self.pool._incr('recycles')
+            self._close_browser()
+
+    def _close_browser(self):
+        for (domain, _), context in list(self.contexts.items()):
+            self._close_context(domain, context)
+        self.contexts.clear()
+        if self.browser:
+            try:
+                self.browser.close()
+            except Exception:
+                pass
+        self.browser = None
+        self.browser_pid = None
+        self.pages_served = 0
+
+
+class BrowserPool:
+    """
+    A fixed number of warm Chromium processes shared by every scrape in the
+    process. The pool size is the global cap on concurrent renders; extra
+    requests wait in a FIFO queue.
+    """
+
+    def __init__(self, size: int = BROWSER_POOL_SIZE):
+        self.size = size
+        self.queue = queue.Queue()
+        self.workers = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._launch_lock = threading.Lock()
+        self._counters = {
+            'renders': 0,
+            'failures': 0,
+            'launches': 0,
+            'recycles': 0,
+            'cancelled': 0,
+            'queue_wait_total': 0.0,
+            'queue_wait_max': 0.0,
+            'render_total': 0.0,
+            'render_max': 0.0,
+        }
+        self._domains = OrderedDict()  # (domain, mode) -> render counters, least recently rendered first
+
+    def _start(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            # After a fork the parent's threads are gone; start fresh workers
+            self.queue = queue.Queue()
+            self.workers = [_BrowserWorker(self, i) for i in range(self.size)]
+            for worker in self.workers:
+                worker.start()
+            self._pid = pid
+            logger.info(f"Started browser pool with {self.size} workers (pid {pid})")
+
+    def state_path(self, domain: str) -> str:
+        """File holding the persisted cookies/localStorage for a domain"""
+        state_dir = settings.BROWSER_STATE_DIR
+        os.makedirs(state_dir, exist_ok=True)
+        safe_domain = re.sub(r'[^a-zA-Z0-9.-]', '_', domain.lower())
+        return os.path.join(state_dir, f"{safe_domain}.json")
+
+    def render(self, url: str, domain: str, handler: Callable, user_agent: Optional[str] = None,
+               timeout: float = BROWSER_QUEUE_TIMEOUT, cancel: Optional[threading.Event] = None,
+               mode: str = 'full'):
+        """
+        Run handler(page) on a fresh page in a warm browser context for domain
+        and return its result. Blocks until a browser is free or timeout expires.
+        Setting cancel gives up on the render: a queued job is dropped, and a
+        running one finishes in its worker with the result discarded.
+        """
+        self._start()
+        job = RenderJob(url, domain, handler, user_agent, mode)
+        self.queue.put(job)
+        give_up = time.monotonic() + timeout
+        while not job.done.wait(timeout if cancel is None else min(CANCEL_POLL_INTERVAL, timeout)):
+            if cancel is not None and cancel.is_set():
+                job.cancelled = True
+                self._incr('cancelled')
+                raise BrowserPoolError(f"Render of {url} cancelled")
+            if time.monotonic() >= give_up:
+                job.cancelled = True
+                raise BrowserPoolError(f"Timed out after {timeout}s waiting to render {url}")
+        if job.error:
+            raise job.error
+        return job.result
+
+    def browser_memory_mb(self) -> Optional[Dict[str, float]]:
+        """Resident memory of each running browser, by worker name"""
+        memory = {}
+        for worker in self.workers:
+            memory_mb = worker.memory_mb()
+            if memory_mb is not None:
+                memory[worker.name] = round(memory_mb, 1)
+        return memory or None
+
+    def _incr(self, name: str, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _record(self, job: RenderJob):
+        wait = job.started_at - job.enqueued_at
+        render = job.finished_at - job.started_at
+        with self._lock:
+            self._counters['renders'] += 1
+            if job.error:
+                self._counters['failures'] += 1
+            self._counters['queue_wait_total'] += wait
+            self._counters['queue_wait_max'] = max(self._counters['queue_wait_max'], wait)
+            self._counters['render_total'] += render
+            self._counters['render_max'] = max(self._counters['render_max'], render)
+
+            key = (job.domain.lower(), job.mode)
+            domain = self._domains.pop(key, None) or {'renders': 0, 'failures': 0, 'render_total': 0.0, 'render_max': 0.0}
+            domain['renders'] += 1
+            domain['failures'] += 1 if job.error else 0
+            domain['render_total'] += render
+            domain['render_max'] = max(domain['render_max'], render)
+            self._domains[key] = domain
+            while len(self._domains) > DOMAIN_STATS_LIMIT:
+                self._domains.popitem(last=False)
+
+    def domain_stats(self, limit: int = 50):
+        """Render time per domain and render mode, slowest total first"""
+        with self._lock:
+            rows = [(key, dict(counters)) for key, counters in self._domains.items()]
+        rows.sort(key=lambda row: row[1]['render_total'], reverse=True)
+        return [{
+            'domain': domain,
+            'mode': mode,
+            'renders': counters['renders'],
+            'failures': counters['failures'],
+            'render_ms_avg': round(counters['render_total'] / counters['renders'] * 1000, 1),
+            'render_ms_max': round(counters['render_max'] * 1000, 1),
+        } for (domain, mode), counters in rows[:limit]]
+
+    def stats(self) -> Dict:
+        """Queue wait, render time and utilisation of the pool in this process"""
+        with self._lock:
+            counters = dict(self._counters)
+        renders = counters['renders']
+        busy = sum(1 for worker in self.workers if worker.busy)
+        return {
+            'size': self.size,
+            'busy': busy,
+            'utilisation': round(busy / self.size, 2) if self.size else 0.0,
+            'queue_depth': self.queue.qsize(),
+            'renders': renders,
+            'failures': counters['failures'],
+            'launches': counters['launches'],
+            'recycles': counters['recycles'],
+            'cancelled': counters['cancelled'],
+            'queue_wait_ms_avg': round(counters['queue_wait_total'] / renders * 1000, 1) if renders else 0.0,
+            'queue_wait_ms_max': round(counters['queue_wait_max'] * 1000, 1),
+            'render_ms_avg': round(counters['render_total'] / renders * 1000, 1) if renders else 0.0,
+            'render_ms_max': round(counters['render_max'] * 1000, 1),
+            'memory_mb_per_browser': self.browser_memory_mb(),
+            'domains': self.domain_stats(),
+        }
+
+    def shutdown(self, timeout: float = 5):
+        if self._pid != os.getpid():
+            return
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join(timeout)
+
+
+browser_pool = BrowserPool()
+atexit.register(browser_pool.shutdown)
@@ -0,0 +1,270 @@
+import os
+import re
+import threading
+import time
+import logging
+from typing import Dict, Optional
+
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+# Circuit breaker settings
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '3'))  # Consecutive failures that open it
+CIRCUIT_COOLDOWN = int(os.getenv('CIRCUIT_COOLDOWN', '300'))  # Seconds a newly opened circuit stays open
+CIRCUIT_MAX_COOLDOWN = int(os.getenv('CIRCUIT_MAX_COOLDOWN', '3600'))  # Cooldown doubles per failed probe up to this
+CIRCUIT_PROBE_TIMEOUT = 60  # Seconds one half-open probe owns the circuit before another caller may probe
+
+# Failure codes that say the host is blocking or struggling (a 404 is the page, not the host)
+BREAKER_FAILURES = {'403', '429', '500', '502', '503', '504', 'timeout', 'connection'}
+
+# Bot-challenge and block page signatures, checked when a page yields no product data
+CHALLENGE_SIGNATURES = [
+    ('cloudflare', re.compile(r'cf-chl-|/cdn-cgi/challenge-platform|<title>Just a moment\.\.\.</title>|Attention Required! \| Cloudflare', re.I)),
+    ('amazon-robot-check', re.compile(r'<title[^>]*>Robot Check</title>|api-services-support@amazon\.com|/errors/validateCaptcha', re.I)),
+    ('perimeterx', re.compile(r'px-captcha|_pxCaptcha|perimeterx', re.I)),
+    ('datadome', re.compile(r'captcha-delivery\.com|datadome', re.I)),
+    ('akamai', re.compile(r"<title>Access Denied</title>[\s\S]{0,2000}Reference&#32;#|You don't have permission to access", re.I)),
+    ('captcha', re.compile(r'<title>[^<]*(captcha|are you a robot|verify you are human)[^<]*</title>', re.I)),
+]
+CHALLENGE_SCAN_BYTES = 64 * 1024  # Block pages are small; only the start of a page is checked
+
+
+def failure_code(error: Exception) -> str:
+    """Short label for why a call failed, e.g. '403', 'timeout', 'connection'"""
+    response = getattr(error, 'response', None)
+    if response is not None and getattr(response, 'status_code', None):
+        return str(response.status_code)
+    name = type(error).__name__.lower()
+    if 'timeout' in name:
+        return 'timeout'
+    if 'connection' in name:
+        return 'connection'
+    return 'error'
+
+
+def detect_challenge(html: Optional[str]) -> Optional[str]:
+    """Name of the bot-challenge page html looks like, or None"""
+    if not html:
+        return None
+    head = html[:CHALLENGE_SCAN_BYTES]
+    for name, pattern in CHALLENGE_SIGNATURES:
+        if pattern.search(head):
+            return name
+    return None
+
+
+class CircuitOpenError(Exception):
+    """Exception raised when a call is refused because the domain's circuit is open"""
+
+    def __init__(self, name: str, domain: str, retry_after: float):
+        self.domain = domain
+        self.retry_after = retry_after
+        super().__init__(f"{name} circuit for {domain} is open; retry in {retry_after:.0f}s")
+
+
+class CircuitBreaker:
+    """
+    Per-domain circuit breaker shared by all processes on the host.
+
+    After CIRCUIT_FAILURE_THRESHOLD consecutive blocking failures (403/429/5xx,
+    timeouts, challenge pages) the domain's circuit opens and allow() refuses
+    calls for the cooldown. When it expires one caller is let through as a
+    half-open probe: success closes the circuit, failure reopens it with twice
+    the cooldown. State lives in the 'scraper' cache so every worker sees it:
+    the failure count is a counter of its own, and the circuit entry is only
+    written when the circuit opens, half-opens or closes. Refused calls are
+    counted per process and never touch the cache.
+    """
+
+    def __init__(self, name: str, alias: str = 'scraper', threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 cooldown: int = CIRCUIT_COOLDOWN, max_cooldown: int = CIRCUIT_MAX_COOLDOWN):
+        self.name = name
+        self.alias = alias
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._rejected = {}  # domain -> calls refused by this process
+        self._lock = threading.Lock()  # Guards _rejected and failure counter updates
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _key(self, domain: str) -> str:
+        return f"circuit:{self.name}:{domain}"
+
+    def _failures_key(self, domain: str) -> str:
+        return f"{self._key(domain)}:failures"
+
+    def _domain(self, domain: str) -> str:
+        domain = domain.lower().split(':')[0]
+        return domain[4:] if domain.startswith('www.') else domain
+
+    def _load(self, domain: str) -> Dict:
+        try:
+            entry = self.cache.get(self._key(domain))
+        except Exception as e:
+            logger.debug(f"Circuit state read failed: {e}")
+            entry = None
+        return entry or {
+            'state': 'closed',
+            'opened_at': None,
+            'cooldown': self.cooldown,
+            'trips': 0,
+            'last_failure': None,
+        }
+
+    def _failures(self, domain: str) -> int:
+        try:
+            return self.cache.get(self._failures_key(domain)) or 0
+        except Exception as e:
+            logger.debug(f"Circuit failure count read failed: {e}")
+            return 0
+
+    def _save(self, domain: str, entry: Dict):
+        try:
+            self.cache.set(self._key(domain), entry, timeout=None)
+            if entry['trips']:
+                index = self.cache.get(f"circuit:{self.name}:index") or set()
+                if domain not in index:
+                    index.add(domain)
+                    self.cache.set(f"circuit:{self.name}:index", index, timeout=None)
+        except Exception as e:
+            logger.debug(f"Circuit state write failed: {e}")
+
+    def allow(self, domain: str) -> bool:
+        """True if a call to domain may go ahead (closed, or this caller is the half-open probe)"""
+        domain = self._domain(domain)
+        entry = self._load(domain)
+        if entry['state'] == 'closed':
+            return True
+
+        remaining = entry['opened_at'] + entry['cooldown'] - time.time()
+        if remaining <= 0:
+            # Cooldown over: the first caller to claim the probe slot tests the domain
+            try:
+                claimed = self.cache.add(f"{self._key(domain)}:probe", 1, timeout=CIRCUIT_PROBE_TIMEOUT)
+            except Exception:
+                claimed = True
+            if claimed:
+                if entry['state'] != 'half-open':
+                    entry['state'] = 'half-open'
+                    self._save(domain, entry)
+                logger.info(f"{self.name} circuit for {domain} half-open; probing")
+                return True
+
+        with self._lock:
+            self._rejected[domain] = self._rejected.get(domain, 0) + 1
+        return False
+
+    def check(self, domain: str):
+        """Raise CircuitOpenError unless allow(domain)"""
+        if not self.allow(domain):
+            entry = self._load(self._domain(domain))
+            retry_after = max(0.0, entry['opened_at'] + entry['cooldown'] - time.time())
+            raise CircuitOpenError(self.name, self._domain(domain), retry_after)
+
+    def record_success(self, domain: str):
+        domain = self._domain(domain)
+        entry = self._load(domain)
+        if entry['state'] == 'closed':
+            if self._failures(domain):
+                self._reset_failures(domain)
+            return
+        logger.info(f"{self.name} circuit for {domain} closed after successful probe")
+        entry.update(state='closed', opened_at=None, cooldown=self.cooldown)
+        self._reset_failures(domain)
+        self._save(domain, entry)
+        self._release_probe(domain)
+
+    def record_failure(self, domain: str, reason: str):
+        """Count a blocking failure (a BREAKER_FAILURES code or a challenge page)"""
+        domain = self._domain(domain)
+        failures = self._incr_failures(domain)
+        entry = self._load(domain)
+
+        if entry['state'] == 'half-open':
+            # Probe failed: back off harder before the next one
+            entry['cooldown'] = min(entry['cooldown'] * 2, self.max_cooldown)
+            self._open(domain, entry, failures, reason)
+            self._release_probe(domain)
+        elif entry['state'] == 'closed' and failures == self.threshold:
+            # Only the failure that reaches the threshold opens the circuit
+            self._open(domain, entry, failures, reason)
+
+    def _open(self, domain: str, entry: Dict, failures: int, reason: str):
+        entry['state'] = 'open'
+        entry['opened_at'] = time.time()
+        entry['trips'] += 1
+        entry['last_failure'] = reason
+        self._save(domain, entry)
+        logger.warning(f"{self.name} circuit for {domain} open for {entry['cooldown']}s "
+                       f"after {failures} failures (last: {reason})")
+
+    def _incr_failures(self, domain: str) -> int:
+        key = self._failures_key(domain)
+        try:
+            # incr is atomic on Redis/memcached; the file cache reads and writes, so serialise this process's threads
+            with self._lock:
+                self.cache.add(key, 0, timeout=None)
+                return self.cache.incr(key)
+        except Exception as e:
+            logger.debug(f"Circuit failure count write failed: {e}")
+            return 0
+
+    def _reset_failures(self, domain: str):
+        try:
+            self.cache.delete(self._failures_key(domain))
+        except Exception:
+            pass
+
+    def _release_probe(self, domain: str):
+        try:
+            self.cache.delete(f"{self._key(domain)}:probe")
+        except Exception:
+            pass
+
+    def record(self, domain: str, failure: Optional[str]):
+        """Record a call outcome from its failure code; codes outside BREAKER_FAILURES are neutral"""
+        if failure is None:
+            self.record_success(domain)
+        elif failure in BREAKER_FAILURES or failure.startswith('challenge'):
+            self.record_failure(domain, failure)
+
+    def state(self, domain: str) -> Dict:
+        domain = self._domain(domain)
+        entry = self._load(domain)
+        retry_after = None
+        if entry['state'] != 'closed':
+            retry_after = round(max(0.0, entry['opened_at'] + entry['cooldown'] - time.time()), 1)
+        with self._lock:
+            rejected = self._rejected.get(domain, 0)
+        return {
+            'domain': domain,
+            'state': entry['state'],
+            'failures': self._failures(domain),
+            'trips': entry['trips'],
+            'rejected': rejected,  # By this process
+            'last_failure': entry['last_failure'],
+            'cooldown': entry['cooldown'],
+            'retry_after': retry_after,
+        }
+
+    def stats(self) -> Dict:
+        """State of every domain whose circuit has tripped at least once"""
+        try:
+            domains = sorted(self.cache.get(f"circuit:{self.name}:index") or [])
+        except Exception:
+            domains = []
+        states = [self.state(domain) for domain in domains]
+        return {
+            'open': sum(1 for state in states if state['state'] != 'closed'),
+            'trips': sum(state['trips'] for state in states),
+            'domains': states,
+        }
+
+
+scrape_breaker = CircuitBreaker('scrape')  # requests tier of ProductScraper
+render_breaker = CircuitBreaker('render')  # Playwright tier of ProductScraper
+image_breaker = CircuitBreaker('image')  # download_image_from_url
@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from . import timing
+
+# Overall scrape_url budget, in seconds; callers may ask for less (or more, up to the max)
+SCRAPE_DEADLINE = float(os.getenv('SCRAPE_DEADLINE', '45'))
+SCRAPE_MAX_DEADLINE = float(os.getenv('SCRAPE_MAX_DEADLINE', '90'))
+SCRAPE_MIN_DEADLINE = 1.0
+
+
+class Deadline:
+    """
+    Time budget for one scrape, shared by every tier.
+
+    Each step asks timeout() for the time it may use (its own limit capped by
+    what is left) and runs inside phase() so the report shows where the budget
+    went. A Deadline with no limit never expires and only records phases.
+    A cancelled Deadline has no time left, which stops the step using it.
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds
+        self.started = time.monotonic()
+        self.phases: List[Dict] = []
+        self.exceeded = False
+        self.cancelled = threading.Event()
+        self.cancellable = False  # Branches may be cancelled, so their steps must stay interruptible
+
+    @classmethod
+    def from_request(cls, value) -> 'Deadline':
+        """Deadline from a request parameter in seconds, clamped to the allowed range"""
+        try:
+            seconds = float(value) if value not in (None, '') else SCRAPE_DEADLINE
+        except (TypeError, ValueError):
+            seconds = SCRAPE_DEADLINE
+        return cls(min(max(seconds, SCRAPE_MIN_DEADLINE), SCRAPE_MAX_DEADLINE))
+
+    def branch(self) -> 'Deadline':
+        """Same budget and phase log, but cancelling the branch doesn't affect this deadline"""
+        branch = Deadline(self.seconds)
+        branch.started = self.started
+        branch.phases = self.phases
+        branch.cancellable = True
+        return branch
+
+    def cancel(self):
+        self.cancelled.set()
+
+    @property
+    def bounded(self) -> bool:
+        """True if steps must be able to stop early (a time limit, or cancellable)"""
+        return self.seconds is not None or self.cancellable
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self) -> float:
+        if self.cancelled.is_set():
+            return 0.0
+        if self.seconds is None:
+            return float('inf')
+        return max(0.0, self.seconds - self.elapsed())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, limit: float) -> float:
+        """limit, or the time left if that is shorter"""
+        return min(limit, self.remaining())
+
+    def has(self, seconds: float) -> bool:
+        """True if at least `seconds` of the budget are left"""
+        return self.remaining() >= seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a step against the budget (and in the active timing trace)"""
+        entry = {'phase': name, 'start_ms': round(self.elapsed() * 1000, 1)}
+        started = time.monotonic()
+        try:
+            with timing.phase(name):
+                yield entry
+        finally:
+            entry['ms'] = round((time.monotonic() - started) * 1000, 1)
+            self.phases.append(entry)
+
+    def skip(self, name: str, reason: str):
+        """Record a step that was not run"""
+        self.phases.append({'phase': name, 'start_ms': round(self.elapsed() * 1000, 1), 'ms': 0.0, 'skipped': reason})
+
+    def report(self) -> Dict:
+        """How the budget was spent"""
+        return {
+            'deadline_ms': round(self.seconds * 1000) if self.seconds is not None else None,
+            'elapsed_ms': round(self.elapsed() * 1000, 1),
+            'remaining_ms': round(self.remaining() * 1000, 1) if self.seconds is not None else None,
+            'exceeded': self.exceeded,
+            'phases': list(self.phases),
+        }
@@ -0,0 +1,476 @@
+import codecs
+import json
+import os
+import re
+import logging
+from typing import Dict, List, Optional
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup, Tag
+import soupsieve
+import lxml.html
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+# cssselect is needed to run CSS selectors against lxml trees (optional dependency)
+CSSSELECT_AVAILABLE = False
+try:
+    from lxml.cssselect import CSSSelector
+    CSSSELECT_AVAILABLE = True
+except ImportError:
+    logger.info("cssselect not available - lxml extraction backend disabled")
+
+PRICE_PATTERNS = [
+    re.compile(r'\$\s*(\d+(?:,\d{3})*(?:\.\d{2})?)'),  # $299.00 or $1,299.00
+    re.compile(r'(\d+(?:,\d{3})*(?:\.\d{2})?)\s*(?:dollars?|USD)'),
+    re.compile(r'Price:\s*\$?\s*(\d+(?:,\d{3})*(?:\.\d{2})?)'),
+    re.compile(r'(?:^|\s)(\d+(?:,\d{3})*\.\d{2})(?:\s|$)'),  # Just the number with cents
+]
+
+TITLE_RE = re.compile(r'product.*title|title|name', re.I)
+PRICE_CLASS_RE = re.compile(r'.*price.*', re.I)
+IMAGE_RE = re.compile(r'product.*image|main.*image', re.I)
+DESCRIPTION_RE = re.compile(r'.*description.*', re.I)
+
+
+def extract_price_from_text(text: str) -> Optional[float]:
+    """Extract price from text using various patterns"""
+    for pattern in PRICE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            try:
+                price_str = match.group(1).replace(',', '')
+                return float(price_str)
+            except (ValueError, IndexError):
+                continue
+    return None
+
+
+def json_ld_image(value) -> Optional[str]:
+    """First URL of a JSON-LD image value (a string, a list or an ImageObject)"""
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if isinstance(value, dict):
+        value = value.get('url') or value.get('contentUrl')
+    return value if isinstance(value, str) else None
+
+
+def parse_structured_product(data) -> Optional[Dict]:
+    """Turn one parsed JSON-LD object into product fields if it describes a Product"""
+    if isinstance(data, list):
+        data = data[0]
+
+    if data.get('@type') in ['Product', 'IndividualProduct']:
+        price = None
+        if 'offers' in data:
+            offers = data['offers']
+            if isinstance(offers, list):
+                offers = offers[0]
+            price = offers.get('price')
+
+        return {
+            'title': data.get('name'),
+            'price': float(price) if price else None,
+            'image_url': json_ld_image(data.get('image')),
+            'description': data.get('description')
+        }
+    return None
+
+
+# Elements whose contents BeautifulSoup leaves out of .text
+NON_TEXT_TAGS = {'script', 'style', 'template'}
+
+CHARSET_META_RE = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.I)
+XML_DECLARATION_RE = re.compile(r'^\s*<\?xml[^>]*\?>')
+
+
+def decode_html(content: bytes, content_type: str = '') -> str:
+    """
+    Decode a page once: BOM, then the Content-Type charset, then a <meta>
+    charset in the first 4 KB, then UTF-8, falling back to Windows-1252.
+    """
+    for bom, encoding in ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'),
+                          (codecs.BOM_UTF16_BE, 'utf-16')):
+        if content.startswith(bom):
+            return content.decode(encoding, errors='replace')
+
+    declared = []
+    match = re.search(r'charset=["\']?([\w-]+)', content_type or '', re.I)
+    if match:
+        declared.append(match.group(1))
+    match = CHARSET_META_RE.search(content[:4096])
+    if match:
+        declared.append(match.group(1).decode('ascii'))
+
+    for encoding in declared:
+        try:
+            return content.decode(encoding, errors='replace')
+        except LookupError:
+            continue
+    try:
+        return content.decode('utf-8')
+    except UnicodeDecodeError:
+        return content.decode('windows-1252', errors='replace')
+
+
+class SoupBackend:
+    """Extraction on a BeautifulSoup tree (lxml parser underneath)"""
+
+    name = 'bs4'
+
+    def parse(self, html: str):
+        return BeautifulSoup(html, 'lxml')
+
+    def elements(self, document):
+        for element in document.descendants:
+            if isinstance(element, Tag):
+                yield element
+
+    def tag(self, element) -> str:
+        return element.name
+
+    def text(self, element) -> str:
+        return element.text
+
+    def stripped_strings(self, element):
+        return element.stripped_strings
+
+    def script_text(self, element) -> Optional[str]:
+        return element.string
+
+    def compile(self, selector: str):
+        return soupsieve.compile(selector)
+
+    def select_one(self, document, compiled):
+        return compiled.select_one(document)
+
+
+class LxmlBackend:
+    """
+    Extraction directly on an lxml.html tree, skipping BeautifulSoup's Python
+    object tree. Text is gathered the way BeautifulSoup does it so both
+    backends return identical results.
+    """
+
+    name = 'lxml'
+
+    def parse(self, html: str):
+        html = XML_DECLARATION_RE.sub('', html, count=1)
+        try:
+            return lxml.html.document_fromstring(html)
+        except etree.ParserError:
+            # Empty document
+            return lxml.html.document_fromstring('<html></html>')
+
+    def elements(self, document):
+        for element in document.iter():
+            if isinstance(element.tag, str):
+                yield element
+
+    def tag(self, element) -> str:
+        return element.tag
+
+    def _strings(self, root):
+        if root.text:
+            yield root.text
+        if root.tag in NON_TEXT_TAGS:
+            return
+        # Depth-first walk yielding each element's text before its children
+        # and its tail after them; comments only contribute their tail
+        stack = [(iter(root), None)]
+        while stack:
+            children, tail = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                if tail:
+                    yield tail
+                continue
+            if isinstance(child.tag, str) and child.tag not in NON_TEXT_TAGS:
+                if child.text:
+                    yield child.text
+                stack.append((iter(child), child.tail))
+            elif child.tail:
+                yield child.tail
+
+    def text(self, element) -> str:
+        return ''.join(self._strings(element))
+
+    def stripped_strings(self, element):
+        for string in self._strings(element):
+            string = string.strip()
+            if string:
+                yield string
+
+    def script_text(self, element) -> Optional[str]:
+        return element.text
+
+    def compile(self, selector: str):
+        return CSSSelector(selector, translator='html')
+
+    def select_one(self, document, compiled):
+        matches = compiled(document)
+        return matches[0] if matches else None
+
+
+BACKENDS = {'bs4': SoupBackend(), 'lxml': LxmlBackend()}
+
+
+def get_backend(name: Optional[str] = None):
+    """Backend by name (default: SCRAPER_BACKEND), falling back to bs4 if unavailable"""
+    name = (name or SCRAPER_BACKEND).lower()
+    if name == 'lxml' and not CSSSELECT_AVAILABLE:
+        logger.warning("SCRAPER_BACKEND=lxml requires cssselect; using bs4")
+        name = 'bs4'
+    return BACKENDS.get(name, BACKENDS['bs4'])
+
+
+# Extraction backend for this deployment: 'bs4' or 'lxml'
+SCRAPER_BACKEND = os.getenv('SCRAPER_BACKEND', 'bs4')
+
+
+def compile_site_selectors(site_configs: Dict, backend) -> Dict:
+    """Compile every SITE_CONFIGS selector once for backend"""
+    compiled = {}
+    for domain, config in site_configs.items():
+        compiled[domain] = {}
+        for key in ('title_selectors', 'price_selectors', 'image_selectors'):
+            compiled[domain][key] = []
+            for selector in config.get(key, []):
+                try:
+                    compiled[domain][key].append(backend.compile(selector))
+                except Exception as e:
+                    logger.warning(f"Invalid selector {selector!r} for {domain}: {e}")
+    return compiled
+
+
+class Rule:
+    """
+    One selector: a tag name plus an optional attribute that must equal a
+    string or match a regex. Class matching follows BeautifulSoup: any single
+    class or the whole class string may match.
+    """
+
+    def __init__(self, tag: str, attr: Optional[str] = None, value=None, all_matches: bool = False):
+        self.tag = tag
+        self.attr = attr
+        self.value = value
+        self.all_matches = all_matches  # Keep every match, not just the first
+
+    def matches(self, element) -> bool:
+        if self.attr is None:
+            return True
+        actual = element.get(self.attr)
+        if actual is None:
+            return False
+        if self.attr == 'class' and isinstance(actual, str):
+            # lxml gives the raw attribute; BeautifulSoup splits it
+            actual = actual.split()
+        candidates = [actual] if isinstance(actual, str) else list(actual) + [' '.join(actual)]
+        if isinstance(self.value, str):
+            return self.value in candidates
+        return any(self.value.search(candidate) for candidate in candidates)
+
+
+# Selectors per field, highest priority first
+FIELD_RULES = {
+    'title': [
+        # Common meta tags
+        Rule('meta', 'property', 'og:title'),
+        Rule('meta', 'name', 'twitter:title'),
+        # Common title elements
+        Rule('h1', 'class', TITLE_RE),
+        Rule('h1', 'id', TITLE_RE),
+        Rule('span', 'id', 'productTitle'),  # Amazon
+        Rule('h1', 'itemprop', 'name'),  # Schema.org
+        Rule('h1'),  # Any h1 as last resort
+    ],
+    'price_meta': [
+        Rule('meta', 'property', 'product:price:amount'),
+        Rule('meta', 'property', 'og:price:amount'),
+        Rule('meta', 'name', 'price'),
+        Rule('meta', 'itemprop', 'price'),
+        Rule('meta', 'name', 'product:price:amount'),
+    ],
+    'price': [
+        Rule('span', 'class', PRICE_CLASS_RE, all_matches=True),
+        Rule('div', 'class', PRICE_CLASS_RE, all_matches=True),
+        Rule('span', 'itemprop', 'price', all_matches=True),
+        Rule('p', 'class', PRICE_CLASS_RE, all_matches=True),
+    ],
+    'image': [
+        Rule('meta', 'property', 'og:image'),
+        Rule('meta', 'property', 'product:image'),
+        Rule('meta', 'name', 'twitter:image'),
+        Rule('img', 'class', IMAGE_RE),
+        Rule('img', 'id', IMAGE_RE),
+    ],
+    'description': [
+        Rule('meta', 'property', 'og:description'),
+        Rule('meta', 'name', 'description'),
+        Rule('div', 'class', DESCRIPTION_RE),
+        Rule('div', 'id', DESCRIPTION_RE),
+    ],
+}
+
+_RULES_BY_TAG = {}
+for _field, _rules in FIELD_RULES.items():
+    for _index, _rule in enumerate(_rules):
+        _RULES_BY_TAG.setdefault(_rule.tag, []).append((_field, _index, _rule))
+
+
+class SinglePassExtractor:
+    """
+    Collects candidates for every scraper field in one walk over the document,
+    then resolves each field by trying its candidates in priority order.
+
+    Results are identical to running the per-field extractors in
+    benchmark_extraction.py (one soup.find per selector) one after another,
+    without re-walking the tree for every selector. Works on either
+    a BeautifulSoup or an lxml document through its backend.
+    """
+
+    def __init__(self, document, base_url: str, backend=None):
+        self.base_url = base_url
+        self.backend = backend or BACKENDS['bs4']
+        self.matches = {field: [[] for _ in rules] for field, rules in FIELD_RULES.items()}
+        self.images = []
+        self.json_ld_scripts = []
+        self._json_ld = None
+        self._collect(document)
+
+    def _collect(self, document):
+        for element in self.backend.elements(document):
+            name = self.backend.tag(element)
+            if name == 'img':
+                self.images.append(element)
+            elif name == 'script' and element.get('type') == 'application/ld+json':
+                self.json_ld_scripts.append(element)
+            for field, index, rule in _RULES_BY_TAG.get(name, ()):
+                found = self.matches[field][index]
+                if (rule.all_matches or not found) and rule.matches(element):
+                    found.append(element)
+
+    def _first_matches(self, field: str):
+        """Yield (rule, element) for the first match of each rule, in priority order"""
+        for rule, found in zip(FIELD_RULES[field], self.matches[field]):
+            if found:
+                yield rule, found[0]
+
+    @property
+    def json_ld(self) -> List:
+        """Parsed JSON-LD blocks in document order (None where parsing failed)"""
+        if self._json_ld is None:
+            self._json_ld = []
+            for script in self.json_ld_scripts:
+                try:
+                    self._json_ld.append(json.loads(self.backend.script_text(script)))
+                except Exception:
+                    self._json_ld.append(None)
+        return self._json_ld
+
+    def structured_data(self) -> Optional[Dict]:
+        """Extract product info from JSON-LD structured data if available"""
+        for data in self.json_ld:
+            if data is None:
+                continue
+            try:
+                product = parse_structured_product(data)
+                if product:
+                    return product
+            except Exception:
+                continue
+        return None
+
+    def title(self) -> Optional[str]:
+        for rule, element in self._first_matches('title'):
+            if rule.tag == 'meta':
+                return element.get('content')
+            text = self.backend.text(element).strip()
+            if text:
+                return text
+        return None
+
+    def price(self) -> Optional[float]:
+        # Try meta tags first
+        for rule, element in self._first_matches('price_meta'):
+            content = element.get('content', '')
+            try:
+                # Clean and convert
+                price_str = content.replace(',', '').replace('$', '').strip()
+                return float(price_str)
+            except ValueError:
+                continue
+
+        # Then every element whose class/itemprop looks like a price
+        for found in self.matches['price']:
+            for element in found:
+                price_text = ' '.join(self.backend.stripped_strings(element))
+                price = extract_price_from_text(price_text)
+                if price:
+                    return price
+        return None
+
+    def image(self) -> Optional[str]:
+        for rule, element in self._first_matches('image'):
+            if rule.tag == 'meta':
+                url = element.get('content')
+            else:
+                url = element.get('src') or element.get('data-src')
+
+            if url and not url.startswith('data:'):
+                return urljoin(self.base_url, url)
+        return None
+
+    def description(self) -> Optional[str]:
+        for rule, element in self._first_matches('description'):
+            if rule.tag == 'meta':
+                return element.get('content', '').strip()
+            text = self.backend.text(element).strip()
+            if text and len(text) > 20:  # Avoid short/empty descriptions
+                return text[:500]  # Limit length
+        return None
+
+    def all_images(self) -> List[str]:
+        """Get all product images from the page"""
+        images = set()
+
+        for img in self.images:
+            src = img.get('src') or img.get('data-src')
+            if src and not src.startswith('data:'):
+                full_url = urljoin(self.base_url, src)
+                # Filter out tiny images (likely icons)
+                if 'icon' not in full_url.lower() and 'logo' not in full_url.lower():
+                    images.add(full_url)
+
+        # Also check JSON-LD for images
+        for data in self.json_ld:
+            if data is None:
+                continue
+            try:
+                if isinstance(data, list):
+                    data = data[0]
+                if 'image' in data:
+                    if isinstance(data['image'], str):
+                        images.add(urljoin(self.base_url, data['image']))
+                    elif isinstance(data['image'], list):
+                        for img in data['image']:
+                            if isinstance(img, str):
+                                images.add(urljoin(self.base_url, img))
+            except Exception:
+                continue
+
+        return list(images)[:20]  # Limit to 20 images
+
+    def generic(self, gallery: bool = True) -> Dict:
+        """All generic fields at once (all_images only with gallery)"""
+        data = {
+            'title': self.title(),
+            'price': self.price(),
+            'image_url': self.image(),
+            'description': self.description(),
+        }
+        if gallery:
+            data['all_images'] = self.all_images()
+        return data
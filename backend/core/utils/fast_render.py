@@ -0,0 +1,137 @@
+import os
+import logging
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Fast-render mode for the Playwright tier: stop at DOMContentLoaded plus the product markup
+PLAYWRIGHT_FAST_RENDER = os.getenv('PLAYWRIGHT_FAST_RENDER', 'true').lower() == 'true'
+FAST_RENDER_WAIT = float(os.getenv('FAST_RENDER_WAIT', '10'))  # Max seconds to wait for product markup after DOMContentLoaded
+
+# Playwright resource types never fetched in fast mode
+BLOCK_RESOURCE_TYPES = set(filter(None, os.getenv(
+    'PLAYWRIGHT_BLOCK_RESOURCES', 'image,media,font,stylesheet,texttrack,manifest'
+).split(',')))
+
+# Analytics, ad and tag-manager hosts never fetched in fast mode (subdomains included)
+BLOCK_DOMAINS = set(filter(None, os.getenv('PLAYWRIGHT_BLOCK_DOMAINS', ','.join([
+    'google-analytics.com', 'googletagmanager.com', 'googlesyndication.com', 'googleadservices.com',
+    'doubleclick.net', 'adservice.google.com', 'amazon-adsystem.com', 'facebook.net', 'connect.facebook.com',
+    'hotjar.com', 'clarity.ms', 'segment.com', 'segment.io', 'optimizely.com', 'nr-data.net', 'newrelic.com',
+    'criteo.com', 'criteo.net', 'taboola.com', 'outbrain.com', 'adsrvr.org', 'bat.bing.com',
+    'analytics.tiktok.com', 'scorecardresearch.com', 'quantserve.com', 'krxd.net', 'demdex.net',
+    'omtrdc.net', 'ct.pinterest.com', 'sc-static.net',
+])).split(',')))
+
+# Resource types blocked in full-render mode (the original behaviour)
+FULL_RENDER_BLOCK_PATTERN = "**/*.{png,jpg,jpeg,gif,svg,webp,woff,woff2,ttf,eot}"
+
+# Markup the extractor can use; covers FIELD_RULES in extraction.py plus JSON-LD and every <img>
+GENERIC_KEEP_SELECTORS = [
+    'meta', 'title', 'script[type="application/ld+json"]', 'img', 'h1', 'span#productTitle',
+    'span[class*="price" i]', 'div[class*="price" i]', 'p[class*="price" i]', 'span[itemprop="price"]',
+    'div[class*="description" i]', 'div[id*="description" i]',
+]
+GENERIC_TITLE_SELECTOR = 'h1, meta[property="og:title"]'
+GENERIC_PRICE_SELECTOR = ('[class*="price" i], [itemprop="price"], '
+                          'meta[property="product:price:amount"], meta[property="og:price:amount"]')
+
+# True once the page has a Product JSON-LD block, or both a title and a price element
+READY_SCRIPT = """([title, price]) => {
+    for (const script of document.querySelectorAll('script[type="application/ld+json"]')) {
+        if (/"@type"\\s*:\\s*\\[?\\s*"Product"/.test(script.textContent)) return true;
+    }
+    return !!(document.querySelector(title) && document.querySelector(price));
+}"""
+
+# Drop everything the extractor won't look at and return what is left. Kept elements
+# keep their whole subtree and their ancestors (so descendant selectors still match).
+PRUNE_SCRIPT = """(selector) => {
+    const keep = new Set(document.querySelectorAll(selector));
+    const prune = (element) => {
+        if (keep.has(element)) return true;
+        let needed = false;
+        for (const child of Array.from(element.children)) {
+            if (prune(child)) needed = true;
+            else child.remove();
+        }
+        return needed;
+    };
+    if (document.head) prune(document.head);
+    if (document.body) prune(document.body);
+    return '<!DOCTYPE html>' + document.documentElement.outerHTML;
+}"""
+
+
+def _host(url: str) -> str:
+    return (urlparse(url).hostname or '').lower()
+
+
+def _site_domain(host: str) -> str:
+    """Last two labels of a host, good enough to tell first-party frames from third-party ones"""
+    return '.'.join(host.split('.')[-2:])
+
+
+def is_blocked(url: str, resource_type: str) -> bool:
+    """True if fast mode shouldn't fetch url (a blocked resource type or host)"""
+    if resource_type in BLOCK_RESOURCE_TYPES:
+        return True
+    host = _host(url)
+    return any(host == domain or host.endswith('.' + domain) for domain in BLOCK_DOMAINS)
+
+
+def route_handler(page_url: str):
+    """Playwright route handler for fast mode: blocks listed resources and third-party iframes"""
+    site = _site_domain(_host(page_url))
+
+    def handle(route):
+        request = route.request
+        try:
+            blocked = is_blocked(request.url, request.resource_type)
+            if not blocked and request.resource_type == 'document':
+                # Sub-frame documents from other sites are ads, widgets and trackers
+                try:
+                    subframe = request.frame.parent_frame is not None
+                except Exception:
+                    subframe = False
+                blocked = subframe and _site_domain(_host(request.url)) != site
+            if blocked:
+                route.abort()
+            else:
+                route.continue_()
+        except Exception:
+            pass
+
+    return handle
+
+
+def selectors_for(site_config: Optional[Dict]) -> Dict[str, str]:
+    """Ready-check and pruning selectors for a page, including its SITE_CONFIGS selectors"""
+    site_config = site_config or {}
+    keep = list(GENERIC_KEEP_SELECTORS)
+    for key in ('title_selectors', 'price_selectors', 'image_selectors'):
+        keep.extend(site_config.get(key, []))
+    return {
+        'title': ', '.join(site_config.get('title_selectors') or [GENERIC_TITLE_SELECTOR]),
+        'price': ', '.join(site_config.get('price_selectors') or [GENERIC_PRICE_SELECTOR]),
+        'keep': ', '.join(keep),
+    }
+
+
+def wait_for_product(page, selectors: Dict[str, str], timeout: float) -> bool:
+    """Wait up to timeout seconds for the product markup; False if it never showed up"""
+    try:
+        page.wait_for_function(READY_SCRIPT, arg=[selectors['title'], selectors['price']],
+                               timeout=max(timeout, 0.001) * 1000)
+        return True
+    except Exception as e:
+        if type(e).__name__ != 'TimeoutError':
+            raise
+        logger.info(f"Product markup not found within {timeout:.1f}s of DOMContentLoaded: {page.url}")
+        return False
+
+
+def product_html(page, selectors: Dict[str, str]) -> str:
+    """The rendered page pruned in the browser to the parts the extractor reads"""
+    return page.evaluate(PRUNE_SCRIPT, selectors['keep'])
@@ -0,0 +1,221 @@
+import os
+import socket
+import threading
+import time
+import logging
+from http import cookiejar
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.request import ACCEPT_ENCODING
+
+from . import timing
+
+logger = logging.getLogger(__name__)
+
+# Connection pool settings
+POOL_HOSTS = int(os.getenv('HTTP_POOL_HOSTS', '32'))  # Number of per-host pools kept alive
+POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '8'))  # Keep-alive connections per host
+DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', '300'))  # Seconds to reuse a DNS answer
+
+# Advertise only the encodings urllib3 can actually decode
+# (includes br when the brotli package is installed)
+DEFAULT_HEADERS = {
+    'Accept-Encoding': ACCEPT_ENCODING,
+    'Connection': 'keep-alive',
+}
+
+
+class PoolStats:
+    """Thread-safe counters describing how well connections are being reused"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.connections_opened = 0
+            self.handshake_seconds = 0.0
+            self.dns_hits = 0
+            self.dns_misses = 0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_connection(self, seconds: float):
+        with self._lock:
+            self.connections_opened += 1
+            self.handshake_seconds += seconds
+
+    def record_dns(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.dns_hits += 1
+            else:
+                self.dns_misses += 1
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            reused = max(self.requests - self.connections_opened, 0)
+            return {
+                'requests': self.requests,
+                'connections_opened': self.connections_opened,
+                'connections_reused': reused,
+                'reuse_rate': round(reused / self.requests, 3) if self.requests else 0.0,
+                'handshake_seconds_total': round(self.handshake_seconds, 3),
+                'handshake_ms_avg': round(self.handshake_seconds / self.connections_opened * 1000, 1)
+                if self.connections_opened else 0.0,
+                'dns_hits': self.dns_hits,
+                'dns_misses': self.dns_misses,
+            }
+
+
+stats = PoolStats()
+
+
+class DNSCache:
+    """Small TTL cache in front of socket.getaddrinfo"""
+
+    def __init__(self, ttl: int = DNS_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, int], Tuple[float, str]] = {}
+
+    def resolve(self, host: str, port: int) -> str:
+        """Return a cached address for host, resolving it if needed"""
+        key = (host, port)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                stats.record_dns(hit=True)
+                return entry[1]
+
+        stats.record_dns(hit=False)
+        with timing.phase('dns'):
+            infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        address = infos[0][4][0]
+        with self._lock:
+            self._entries[key] = (now + self.ttl, address)
+        return address
+
+    def invalidate(self, host: str, port: int):
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+
+dns_cache = DNSCache()
+
+
+class _PooledConnectionMixin:
+    """Resolve through the DNS cache and time every new connection's handshake"""
+
+    def _new_conn(self):
+        start = time.perf_counter()
+        host = self._dns_host
+        try:
+            self._dns_host = dns_cache.resolve(host, self.port)
+        except socket.gaierror:
+            # Let urllib3 raise its usual NameResolutionError
+            return super()._new_conn()
+        try:
+            with timing.phase('connect'):
+                return super()._new_conn()
+        except Exception:
+            # The cached address may be stale; resolve again next time
+            dns_cache.invalidate(host, self.port)
+            raise
+        finally:
+            self._dns_host = host
+            self._tcp_seconds = time.perf_counter() - start
+
+    def connect(self):
+        start = time.perf_counter()
+        self._tcp_seconds = 0.0
+        super().connect()
+        seconds = time.perf_counter() - start
+        if isinstance(self, HTTPSConnection):
+            # DNS and TCP connect are timed in _new_conn; the rest of the handshake is TLS
+            timing.record('tls', seconds - self._tcp_seconds)
+        stats.record_connection(seconds)
+
+
+class PooledHTTPConnection(_PooledConnectionMixin, HTTPConnection):
+    pass
+
+
+class PooledHTTPSConnection(_PooledConnectionMixin, HTTPSConnection):
+    pass
+
+
+class PooledHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = PooledHTTPConnection
+
+
+class PooledHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = PooledHTTPSConnection
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose per-host pools use the instrumented connection classes"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': PooledHTTPConnectionPool,
+            'https': PooledHTTPSConnectionPool,
+        }
+
+
+def _count_response(response, *args, **kwargs):
+    stats.record_request()
+
+
+def _create_session() -> requests.Session:
+    session = requests.Session()
+    adapter = PooledHTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_MAXSIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    # The session is shared between users; never carry cookies from one scrape to the next
+    session.cookies.set_policy(cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    session.hooks['response'].append(_count_response)
+    return session
+
+
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Return the process-wide pooled session used for all outbound scraping
+    and image downloads. A new session is created after a fork so workers
+    never share sockets.
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = _create_session()
+                _session_pid = pid
+                logger.info(f"Created pooled HTTP session (pid {pid})")
+    return _session
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """GET through the shared pooled session"""
+    return get_session().get(url, **kwargs)
+
+
+def pool_stats() -> Dict:
+    """Connection reuse, handshake and DNS cache statistics for this process"""
+    return stats.as_dict()
@@ -1,19 +1,178 @@
 import requests
+import io
+import threading
+import warnings
 from io import BytesIO
 from django.core.files.base import ContentFile
-from django.core.files.uploadedfile import InMemoryUploadedFile
 from urllib.parse import urlparse
 import os
-from typing import Optional, Tuple
+from typing import Dict, Optional, Tuple
 import logging
 from PIL import Image
+from . import http_client, timing
+from .circuit_breaker import CircuitOpenError, failure_code, image_breaker
 
 logger = logging.getLogger(__name__)
 
+# Streaming download limits; together they bound the memory one image can take
+IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', str(20 * 1024 * 1024)))  # Larger downloads are refused
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', str(25_000_000)))  # Decompression-bomb limit (width x height)
+IMAGE_HEADER_BYTES = 64 * 1024  # A body that isn't a recognisable image by here is refused
+IMAGE_CHUNK_SIZE = 64 * 1024
+
 class ImageDownloadException(Exception):
     """Exception raised when image download fails"""
     pass
 
+
+class MemoryReader(io.RawIOBase):
+    """Seekable read-only file over a memoryview, so Pillow can decode the download without copying it"""
+
+    def __init__(self, view: memoryview):
+        self.view = view
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer) -> int:
+        start = min(self.position, len(self.view))
+        end = min(start + len(buffer), len(self.view))
+        count = end - start
+        buffer[:count] = self.view[start:end]
+        self.position = end
+        return count
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += len(self.view)
+        self.position = max(0, offset)
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+
+class ImageMemoryStats:
+    """
+    Per-process counters of downloaded bytes and the estimated peak memory of
+    each image (download buffer + decoded pixels + converted copy + encoded
+    output), plus downloads refused by the size and pixel limits.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.bytes_downloaded = 0
+        self.peak_bytes_total = 0
+        self.peak_bytes_max = 0
+        self.rejected: Dict[str, int] = {}
+
+    def record(self, downloaded: int, peak: int):
+        with self._lock:
+            self.images += 1
+            self.bytes_downloaded += downloaded
+            self.peak_bytes_total += peak
+            self.peak_bytes_max = max(self.peak_bytes_max, peak)
+
+    def reject(self, reason: str):
+        with self._lock:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            return {
+                'images': self.images,
+                'bytes_downloaded': self.bytes_downloaded,
+                'peak_bytes_avg': self.peak_bytes_total // self.images if self.images else 0,
+                'peak_bytes_max': self.peak_bytes_max,
+                'rejected': dict(self.rejected),
+                'max_bytes': IMAGE_MAX_BYTES,
+                'max_pixels': IMAGE_MAX_PIXELS,
+            }
+
+
+memory_stats = ImageMemoryStats()
+
+
+def _pixel_bytes(img: Image.Image) -> int:
+    """Memory Pillow uses for the decoded pixels of img (multi-band modes are stored 4 bytes per pixel)"""
+    width, height = img.size
+    if len(img.getbands()) > 1 or img.mode in ('I', 'F', 'I;16'):
+        return width * height * 4
+    return width * height
+
+
+def sniff_image(data) -> Optional[Tuple[str, Tuple[int, int]]]:
+    """
+    (format, (width, height)) from the start of an image file, or None if
+    Pillow can't identify it from this much data. Only the header is parsed;
+    no pixel memory is allocated, so it is safe on decompression bombs.
+    """
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(BytesIO(data)) as img:
+                return img.format, img.size
+    except Image.DecompressionBombError:
+        return 'bomb', (IMAGE_MAX_PIXELS + 1, 1)
+    except Exception:
+        return None
+
+
+def _refuse(reason: str, message: str):
+    memory_stats.reject(reason)
+    raise ImageDownloadException(message)
+
+
+def _check_pixels(size: Tuple[int, int]):
+    if size[0] * size[1] > IMAGE_MAX_PIXELS:
+        _refuse('pixels', f"Image is {size[0]}x{size[1]}, over the {IMAGE_MAX_PIXELS} pixel limit")
+
+
+def _read_body(response) -> Tuple[memoryview, str]:
+    """
+    Read the response into one buffer, preallocated from Content-Length when
+    the server sends it. Stops as soon as the body passes IMAGE_MAX_BYTES, the
+    header turns out not to be an image, or the header declares more than
+    IMAGE_MAX_PIXELS. Returns (view of the body, image format).
+    """
+    length = response.headers.get('Content-Length', '')
+    length = int(length) if length.isdigit() and not response.headers.get('Content-Encoding') else None
+    if length is not None and length > IMAGE_MAX_BYTES:
+        _refuse('bytes', f"Image is {length} bytes, over the {IMAGE_MAX_BYTES} byte limit")
+
+    buffer = bytearray(length or 0)
+    size = 0
+    image_format = None
+    for chunk in response.iter_content(IMAGE_CHUNK_SIZE):
+        end = size + len(chunk)
+        if end > IMAGE_MAX_BYTES:
+            _refuse('bytes', f"Image is over the {IMAGE_MAX_BYTES} byte limit")
+        if end <= len(buffer):
+            buffer[size:end] = chunk
+        else:
+            del buffer[size:]
+            buffer += chunk
+        size = end
+
+        if image_format is None:
+            header = sniff_image(memoryview(buffer)[:min(size, IMAGE_HEADER_BYTES)])
+            if header:
+                image_format, dimensions = header
+                _check_pixels(dimensions)
+            elif size >= IMAGE_HEADER_BYTES:
+                _refuse('not-image', 'Response is not an image')
+
+    if image_format is None:
+        _refuse('not-image', 'Response is not an image')
+    return memoryview(buffer)[:size], image_format
+
 def download_image_from_url(url: str, timeout: int = 10) -> Optional[Tuple[ContentFile, str]]:
     """
     Download an image from a URL and return a Django ContentFile along with filename.
@@ -31,13 +190,68 @@ def download_image_from_url(url: str, timeout: int = 10) -> Optional[Tuple[Conte
     if not url:
         return None
 
+    with timing.trace('image') as image_trace:
+        try:
+            content_file, filename, _ = _download_image(url, timeout)
+            return content_file, filename
+        finally:
+            timing.image_timings.observe(image_trace, urlparse(url).netloc)
+
+
+def download_image_if_changed(url: str, etag: Optional[str] = None, last_modified: Optional[str] = None,
+                              timeout: int = 10) -> Optional[Tuple[ContentFile, str, Dict]]:
+    """
+    Like download_image_from_url, but asks the server to skip the body if
+    the image still matches the ETag/Last-Modified validators given.
+
+    Returns None if the server answered 304 Not Modified, otherwise
+    (ContentFile, filename, info) where info holds the response's 'etag'
+    and 'last_modified' validators and the 'bytes' downloaded.
+    """
+    with timing.trace('image') as image_trace:
+        try:
+            return _download_image(url, timeout, etag=etag, last_modified=last_modified)
+        finally:
+            timing.image_timings.observe(image_trace, urlparse(url).netloc)
+
+
+def _download_image(url: str, timeout: int, etag: Optional[str] = None,
+                    last_modified: Optional[str] = None) -> Optional[Tuple[ContentFile, str, Dict]]:
+    """download_image_if_changed without the timing trace"""
+    # Fail fast instead of waiting out the timeout on a host that is blocking us
+    domain = urlparse(url).netloc
+    try:
+        image_breaker.check(domain)
+    except CircuitOpenError as e:
+        logger.warning(f"Not downloading image from {url}: {e}")
+        raise ImageDownloadException(str(e))
+
     try:
         # Download the image
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
-        response = requests.get(url, headers=headers, timeout=timeout, stream=True)
-        response.raise_for_status()
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        try:
+            with timing.phase('fetch'):
+                response = http_client.get(url, headers=headers, timeout=timeout, stream=True)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            image_breaker.record(domain, failure_code(e))
+            raise
+        image_breaker.record_success(domain)
+
+        if response.status_code == 304 and (etag or last_modified):
+            response.close()
+            logger.info(f"Image unchanged (304 Not Modified): {url}")
+            return None
+        info = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
 
         # Check content type
         content_type = response.headers.get('content-type', '')
@@ -45,48 +259,62 @@ def download_image_from_url(url: str, timeout: int = 10) -> Optional[Tuple[Conte
             logger.warning(f"URL does not point to an image. Content-Type: {content_type}")
             # Still try to process it in case the content-type is wrong
 
-        # Read the image content
-        image_content = BytesIO(response.content)
+        # Stream the body into one buffer, checking the limits and the header as it arrives
+        with timing.phase('read'):
+            try:
+                body, source_format = _read_body(response)
+            finally:
+                response.close()
 
-        # Verify it's a valid image and get format
+        # Decode once, straight from the download buffer
+        peak = len(body)
         try:
-            img = Image.open(image_content)
-            img.verify()  # Verify it's a valid image
-
-            # Reopen for actual processing (verify() closes the file)
-            image_content = BytesIO(response.content)
-            img = Image.open(image_content)
-
-            # Convert RGBA to RGB if necessary (for JPEG compatibility)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                # Create a white background
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                img = background
-
-            # Save to BytesIO with optimization
-            output = BytesIO()
-            img_format = img.format or 'JPEG'
-
-            # Use JPEG for most images to save space
-            if img_format.upper() in ('PNG', 'JPEG', 'JPG', 'WEBP'):
-                if img_format.upper() == 'PNG' and img.mode == 'RGBA':
-                    img_format = 'PNG'  # Keep PNG for transparency
-                else:
-                    img_format = 'JPEG'
-                    img = img.convert('RGB')
-
-            img.save(output, format=img_format, quality=85, optimize=True)
-            output.seek(0)
+            with timing.phase('decode'):
+                img = Image.open(MemoryReader(body))
+                _check_pixels(img.size)
+                img.load()
+            peak += _pixel_bytes(img)
+
+            with timing.phase('convert'):
+                # Convert RGBA to RGB if necessary (for JPEG compatibility)
+                if img.mode in ('RGBA', 'LA', 'P'):
+                    # Create a white background
+                    background = Image.new('RGB', img.size, (255, 255, 255))
+                    if img.mode == 'P':
+                        img = img.convert('RGBA')
+                    background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+                    img = background
+                    peak += _pixel_bytes(img)
+
+                # Save to BytesIO with optimization
+                output = BytesIO()
+                img_format = img.format or 'JPEG'
+
+                # Use JPEG for most images to save space
+                if img_format.upper() in ('PNG', 'JPEG', 'JPG', 'WEBP'):
+                    if img_format.upper() == 'PNG' and img.mode == 'RGBA':
+                        img_format = 'PNG'  # Keep PNG for transparency
+                    else:
+                        img_format = 'JPEG'
+                        if img.mode != 'RGB':
+                            img = img.convert('RGB')
+                            peak += _pixel_bytes(img)
 
+            with timing.phase('encode'):
+                img.save(output, format=img_format, quality=85, optimize=True)
+            content = output.getvalue()
+
+        except ImageDownloadException:
+            raise
         except Exception as e:
-            logger.warning(f"Image verification/processing failed: {str(e)}. Using raw content.")
-            # If processing fails, use the raw content
-            image_content.seek(0)
-            output = image_content
-            img_format = 'JPEG'
+            logger.warning(f"Image processing failed: {str(e)}. Using raw content.")
+            # If processing fails, keep the downloaded file as it is
+            content = bytes(body)
+            img_format = source_format
+        peak += len(content)
+        memory_stats.record(len(body), peak)
+        info['bytes'] = len(body)
+        del body
 
         # Generate filename from URL
         parsed_url = urlparse(url)
@@ -104,14 +332,22 @@ def download_image_from_url(url: str, timeout: int = 10) -> Optional[Tuple[Conte
         filename = f"{name_without_ext}.{extension}"
 
         # Create ContentFile
-        content_file = ContentFile(output.read(), name=filename)
+        content_file = ContentFile(content, name=filename)
 
         logger.info(f"Successfully downloaded image from {url} as {filename}")
-        return content_file, filename
+        return content_file, filename, info
 
+    except ImageDownloadException as e:
+        logger.error(f"Refused image from {url}: {str(e)}")
+        raise
     except requests.exceptions.RequestException as e:
         logger.error(f"Failed to download image from {url}: {str(e)}")
         raise ImageDownloadException(f"Network error downloading image: {str(e)}")
     except Exception as e:
         logger.error(f"Error processing image from {url}: {str(e)}")
         raise ImageDownloadException(f"Error processing image: {str(e)}")
+
+
+def image_memory_stats() -> Dict:
+    """Bytes downloaded, estimated peak memory per image and refused downloads for this process"""
+    return memory_stats.as_dict()
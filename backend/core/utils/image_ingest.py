@@ -0,0 +1,217 @@
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, Optional
+
+from django.db import close_old_connections
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from ..models import WishListItem
+from . import image_store
+from .queue_worker import QueueWorker
+from .image_sources import fetch_image
+
+logger = logging.getLogger(__name__)
+
+# Image ingestion settings
+IMAGE_INGEST_WORKERS = int(os.getenv('IMAGE_INGEST_WORKERS', '4'))  # Downloads run at once by one process
+IMAGE_INGEST_IN_PROCESS = os.getenv('IMAGE_INGEST_IN_PROCESS', 'true').lower() == 'true'  # Start right after the save
+IMAGE_INGEST_MAX_ATTEMPTS = int(os.getenv('IMAGE_INGEST_MAX_ATTEMPTS', '5'))  # Attempts before an image is failed
+IMAGE_INGEST_BACKOFF = int(os.getenv('IMAGE_INGEST_BACKOFF', '30'))  # Seconds before the first retry; doubles each time
+IMAGE_INGEST_MAX_BACKOFF = int(os.getenv('IMAGE_INGEST_MAX_BACKOFF', '3600'))
+IMAGE_INGEST_TIMEOUT = int(os.getenv('IMAGE_INGEST_TIMEOUT', '120'))  # Processing items older than this are requeued
+IMAGE_INGEST_POLL_INTERVAL = float(os.getenv('IMAGE_INGEST_POLL_INTERVAL', '1.0'))  # Seconds between queue checks
+
+
+def backoff(attempts: int) -> int:
+    """Seconds to wait before retrying an image that has failed `attempts` times"""
+    return min(IMAGE_INGEST_BACKOFF * 2 ** (attempts - 1), IMAGE_INGEST_MAX_BACKOFF)
+
+
+def claim(item_id: int) -> Optional[WishListItem]:
+    """Mark a due pending item as processing and return it, or None if it isn't due or another worker has it"""
+    now = timezone.now()
+    # Conditional update so two workers never download the same image
+    claimed = WishListItem.objects.filter(
+        id=item_id, image_status='pending', image_next_attempt_at__lte=now
+    ).update(image_status='processing', image_next_attempt_at=now + timedelta(seconds=IMAGE_INGEST_TIMEOUT))
+    if not claimed:
+        return None
+    return WishListItem.objects.get(id=item_id)
+
+
+def claim_next() -> Optional[WishListItem]:
+    """Claim the pending item that has been due longest"""
+    candidates = WishListItem.objects.filter(
+        image_status='pending', image_next_attempt_at__lte=timezone.now()
+    ).order_by('image_next_attempt_at').values_list('id', flat=True)[:5]
+    for item_id in candidates:
+        item = claim(item_id)
+        if item:
+            return item
+    return None
+
+
+def _requeue(item: WishListItem):
+    """The item changed while its image was downloading; fetch its new image_url from scratch"""
+    WishListItem.objects.filter(id=item.id, image_status='processing').update(
+        image_status='pending', image_attempts=0, image_error='', image_next_attempt_at=timezone.now()
+    )
+
+
+def ingest(item: WishListItem) -> str:
+    """
+    Download, process and attach the image of a claimed item. An image_url
+    in the image source cache is attached without downloading it again.
+    The result is only written if the item still has the image_url that was
+    downloaded; otherwise the reference to the stored image is dropped.
+    Returns the item's new image_status.
+    """
+    url = item.image_url
+    current = WishListItem.objects.filter(id=item.id, image_status='processing', image_url=url)
+    try:
+        stored, data = fetch_image(url)
+    except Exception as e:
+        attempts = item.image_attempts + 1
+        if attempts >= IMAGE_INGEST_MAX_ATTEMPTS:
+            new_status, retry_at = 'failed', None
+            logger.error(f"Giving up on image for item {item.id} after {attempts} attempts: {e}")
+        else:
+            new_status, retry_at = 'pending', timezone.now() + timedelta(seconds=backoff(attempts))
+            logger.warning(f"Image for item {item.id} failed (attempt {attempts}), retrying in {backoff(attempts)}s: {e}")
+        if not current.update(image_status=new_status, image_attempts=attempts, image_error=str(e)[:1000],
+                              image_next_attempt_at=retry_at):
+            _requeue(item)
+        return new_status
+
+    # A new image's renditions come from the processed bytes still in memory rather than the stored file
+    renditions = image_store.renditions_for(stored, data)
+    if not current.update(image=stored.name, image_renditions=renditions, image_url='', image_status='ready',
+                          image_error='', image_next_attempt_at=None, updated_at=timezone.now()):
+        image_store.release(stored.name)
+        _requeue(item)
+        return 'pending'
+    logger.info(f"Ingested image for item {item.id} as {stored.name}")
+    return 'ready'
+
+
+def ingest_now(item: WishListItem) -> str:
+    """Queue item's image_url (if not already) and ingest it in this thread, ignoring any backoff"""
+    WishListItem.objects.filter(id=item.id, image_status__in=('pending', 'failed')).exclude(image_url='').update(
+        image_status='pending', image_next_attempt_at=timezone.now()
+    )
+    claimed = claim(item.id)
+    if claimed is None:
+        return WishListItem.objects.filter(id=item.id).values_list('image_status', flat=True).first()
+    return ingest(claimed)
+
+
+def requeue_stale() -> int:
+    """Put back items whose worker went away mid-download"""
+    return WishListItem.objects.filter(
+        image_status='processing', image_next_attempt_at__lt=timezone.now()
+    ).update(image_status='pending', image_next_attempt_at=timezone.now())
+
+
+def ingest_stats() -> Dict:
+    """Items per image_status, plus how overdue the oldest pending image is"""
+    counts = {image_status: 0 for image_status, _ in WishListItem.IMAGE_STATUSES}
+    for image_status, count in WishListItem.objects.order_by().values_list('image_status').annotate(count=Count('id')):
+        counts[image_status] = count
+    oldest = WishListItem.objects.filter(
+        image_status='pending', image_next_attempt_at__lte=timezone.now()
+    ).aggregate(oldest=Min('image_next_attempt_at'))['oldest']
+    return dict(counts, oldest_due_seconds=round((timezone.now() - oldest).total_seconds(), 1) if oldest else None,
+                in_process=IMAGE_INGEST_IN_PROCESS)
+
+
+class _InProcessIngester:
+    """Thread pool in the web process that ingests newly queued images straight after their save"""
+
+    def __init__(self, workers: int = IMAGE_INGEST_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        pid = os.getpid()
+        if self._executor is None or self._pid != pid:
+            with self._lock:
+                if self._executor is None or self._pid != pid:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image-ingest')
+                    self._pid = pid
+        return self._executor
+
+    def _run(self, item_id: int):
+        try:
+            item = claim(item_id)
+            if item:
+                ingest(item)
+        except Exception:
+            logger.exception(f"Image ingestion of item {item_id} raised")
+        finally:
+            close_old_connections()
+
+    def _render(self, item_id: int):
+        try:
+            item = WishListItem.objects.filter(id=item_id).first()
+            if item:
+                image_store.render_item(item)
+        except Exception:
+            logger.exception(f"Renditions of item {item_id} raised")
+        finally:
+            close_old_connections()
+
+
+_in_process = _InProcessIngester()
+
+
+def schedule(item_id: int):
+    """
+    Called once an item with a new image_url is committed. With
+    IMAGE_INGEST_IN_PROCESS the download starts at once on a background
+    thread; otherwise (and for retries) run_image_worker picks it up.
+    """
+    if IMAGE_INGEST_IN_PROCESS:
+        _in_process.executor.submit(_in_process._run, item_id)
+
+
+def schedule_renditions(item_id: int):
+    """
+    Called once an item with an uploaded image file is committed.
+    Renditions are made on the in-process pool whatever
+    IMAGE_INGEST_IN_PROCESS says, since nothing has to be downloaded;
+    generate_image_renditions catches any that are missed.
+    """
+    _in_process.executor.submit(_in_process._render, item_id)
+
+
+class ImageIngestWorker(QueueWorker):
+    """
+    Pulls pending item images from the database and ingests them on a
+    fixed-size thread pool, retrying failures with exponential backoff.
+    Several worker processes can share the queue.
+    """
+
+    label = 'Image'
+    thread_name_prefix = 'image-ingest'
+
+    def __init__(self, workers: int = IMAGE_INGEST_WORKERS, poll_interval: float = IMAGE_INGEST_POLL_INTERVAL):
+        super().__init__(workers, poll_interval)
+
+    def claim_next(self) -> Optional[WishListItem]:
+        return claim_next()
+
+    def process(self, item: WishListItem):
+        ingest(item)
+
+    def maintain(self):
+        stale = requeue_stale()
+        collected = image_store.collect_garbage()
+        if stale or collected:
+            logger.info(f"Requeued {stale} stale image downloads, collected {collected} unreferenced images")
@@ -0,0 +1,161 @@
+import os
+import secrets
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from django.core.cache import caches
+from django.db import close_old_connections
+
+from ..models import StoredImage
+from . import image_store
+from .image_sources import fetch_image, image_source_cache
+
+logger = logging.getLogger(__name__)
+
+# Speculative image prefetch settings
+IMAGE_PREFETCH = os.getenv('IMAGE_PREFETCH', 'true').lower() == 'true'  # Start the image download at scrape time
+IMAGE_PREFETCH_TTL = int(os.getenv('IMAGE_PREFETCH_TTL', '900'))  # Seconds an unclaimed prefetch is kept
+IMAGE_PREFETCH_WORKERS = int(os.getenv('IMAGE_PREFETCH_WORKERS', '4'))  # Downloads running at once per process
+
+
+class ImagePrefetcher:
+    """
+    Downloads and processes an item's image while the user is still reviewing
+    the scraped form, and keeps the result under a random token.
+
+    The image goes through fetch_image, so it lands in the content-addressed
+    image store (with its renditions) and the image source cache like any
+    ingested image. The state of each prefetch (pending, ready or failed, with
+    the image URL, the user it belongs to and the stored image's digest)
+    lives in the 'scraper' cache so any worker can claim it. Creating the item
+    with the token attaches the stored image instead of downloading again.
+    A prefetch holds no reference of its own, so an unclaimed image is
+    collected by the store like any other unreferenced one.
+    """
+
+    STATS_KEYS = ('started', 'skipped', 'ready', 'failed', 'claimed', 'missed')
+
+    def __init__(self, workers: int = IMAGE_PREFETCH_WORKERS, ttl: int = IMAGE_PREFETCH_TTL):
+        self.workers = workers
+        self.ttl = ttl
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches['scraper']
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        pid = os.getpid()
+        if self._executor is None or self._pid != pid:
+            with self._lock:
+                if self._executor is None or self._pid != pid:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image-prefetch')
+                    self._pid = pid
+        return self._executor
+
+    def _key(self, token: str) -> str:
+        return f"image-prefetch:{token}"
+
+    def _save(self, token: str, entry: Dict):
+        try:
+            self.cache.set(self._key(token), entry, timeout=self.ttl)
+        except Exception as e:
+            logger.warning(f"Image prefetch state write failed: {e}")
+
+    def start(self, user_id: int, url: str) -> Optional[str]:
+        """
+        Start downloading url for user_id in the background; returns the
+        token to claim it with, or None if there is nothing to prefetch.
+        """
+        if not url:
+            return None
+        entry = image_source_cache.get(url)
+        if entry and entry['fresh']:
+            # Already stored; ingestion attaches it without downloading
+            self.incr('skipped')
+            return None
+        token = secrets.token_urlsafe(16)
+        self._save(token, {'state': 'pending', 'url': url, 'user_id': user_id, 'started_at': time.time()})
+        self.executor.submit(self._run, token, user_id, url)
+        self.incr('started')
+        return token
+
+    def _run(self, token: str, user_id: int, url: str):
+        entry = {'url': url, 'user_id': user_id}
+        try:
+            stored, data = fetch_image(url)
+            try:
+                image_store.renditions_for(stored, data)
+            finally:
+                # claim() takes the item's own reference; until then only the store's grace period keeps it
+                image_store.release(stored.name)
+            entry.update(state='ready', digest=stored.digest)
+            self.incr('ready')
+        except Exception as e:
+            logger.info(f"Image prefetch of {url} failed: {e}")
+            entry.update(state='failed', error=str(e))
+            self.incr('failed')
+        finally:
+            close_old_connections()
+        self._save(token, entry)
+
+    def claim(self, token: str, user_id: int, url: str) -> Optional[StoredImage]:
+        """
+        A reference to the prefetched stored image for token, or None if it
+        is still downloading, has expired or failed, belongs to someone else
+        or was for a different URL. Never waits: an image that isn't ready is
+        left to ingestion, which finds it in the image source cache if the
+        prefetch has finished by then.
+        """
+        try:
+            entry = self.cache.get(self._key(token))
+        except Exception as e:
+            logger.warning(f"Image prefetch state read failed: {e}")
+            entry = None
+
+        if not entry or entry['user_id'] != user_id or entry['url'] != url or entry['state'] != 'ready':
+            self.incr('missed')
+            return None
+
+        stored = image_store.acquire(entry['digest'])
+        if stored is None:
+            logger.warning(f"Prefetched image for {url} is gone")
+            self.incr('missed')
+            return None
+        self.discard(token)
+        self.incr('claimed')
+        return stored
+
+    def discard(self, token: str):
+        try:
+            self.cache.delete(self._key(token))
+        except Exception:
+            pass
+
+    def incr(self, name: str, amount: int = 1):
+        key = f"prefetch-stats:{name}"
+        try:
+            self.cache.add(key, 0, timeout=None)
+            self.cache.incr(key, amount)
+        except Exception:
+            pass
+
+    def stats(self) -> Dict:
+        """How many prefetches were started, finished and attached to an item"""
+        try:
+            values = self.cache.get_many([f"prefetch-stats:{name}" for name in self.STATS_KEYS])
+        except Exception:
+            values = {}
+        stats = {name: values.get(f"prefetch-stats:{name}", 0) for name in self.STATS_KEYS}
+        stats['claim_rate'] = round(stats['claimed'] / stats['started'], 3) if stats['started'] else 0.0
+        stats['enabled'] = IMAGE_PREFETCH
+        return stats
+
+
+image_prefetcher = ImagePrefetcher()
@@ -0,0 +1,211 @@
+import os
+import re
+import threading
+import time
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from django.core.cache import caches
+
+from . import http_client
+from .circuit_breaker import failure_code, image_breaker
+from .image_downloader import sniff_image
+
+logger = logging.getLogger(__name__)
+
+# Candidate image probing: only the first bytes of each image are fetched to read its header
+IMAGE_PROBE_BYTES = int(os.getenv('IMAGE_PROBE_BYTES', str(16 * 1024)))  # Give up on a header not parsed by here
+IMAGE_PROBE_TIMEOUT = float(os.getenv('IMAGE_PROBE_TIMEOUT', '2'))  # Seconds for ranking all candidates
+IMAGE_PROBE_WORKERS = int(os.getenv('IMAGE_PROBE_WORKERS', '8'))  # Probes running at once per process
+IMAGE_MAX_CANDIDATES = int(os.getenv('IMAGE_MAX_CANDIDATES', '12'))  # Candidates probed per ranking
+IMAGE_PROBE_CACHE_TTL = int(os.getenv('IMAGE_PROBE_CACHE_TTL', '86400'))  # Seconds a parsed header is reused
+
+# Ranking rules
+IMAGE_RANKING = os.getenv('IMAGE_RANKING', 'true').lower() == 'true'  # Rank the gallery whenever it is returned
+IMAGE_MIN_SIDE = int(os.getenv('IMAGE_MIN_SIDE', '100'))  # Smaller images are icons, trackers or thumbnails
+IMAGE_MAX_ASPECT = float(os.getenv('IMAGE_MAX_ASPECT', '3'))  # Wider or taller than this is a banner or sprite
+IMAGE_TARGET_PIXELS = 1200 * 1200  # Beyond this, bigger doesn't rank higher; the scraper's order decides
+
+PROBE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
+    'Accept': 'image/avif,image/webp,image/apng,image/*,*/*;q=0.8',
+    'Range': f'bytes=0-{IMAGE_PROBE_BYTES - 1}',
+}
+
+PROBE_CHUNK_SIZE = 4096
+
+
+def _total_bytes(response) -> Optional[int]:
+    """Full size of the image from Content-Range (206) or Content-Length (200)"""
+    match = re.match(r'bytes \d+-\d+/(\d+)', response.headers.get('Content-Range', ''))
+    if match:
+        return int(match.group(1))
+    if response.status_code == 200 and response.headers.get('Content-Length', '').isdigit():
+        return int(response.headers['Content-Length'])
+    return None
+
+
+def probe_image(url: str, timeout: float = IMAGE_PROBE_TIMEOUT) -> Dict:
+    """
+    Width, height and format of an image read from its first bytes.
+
+    Asks for the first IMAGE_PROBE_BYTES with a Range request and reads the
+    body until Pillow can parse the header from what has arrived.
+    Servers that ignore Range send the whole image; reading stops at the same
+    point and the connection is dropped.
+    """
+    probe = {'url': url, 'width': None, 'height': None, 'format': None, 'bytes': None, 'read_bytes': 0,
+             'error': None}
+    domain = urlparse(url).netloc
+    if not image_breaker.allow(domain):
+        probe['error'] = 'circuit-open'
+        return probe
+
+    started = time.perf_counter()
+    try:
+        response = http_client.get(url, headers=PROBE_HEADERS, timeout=timeout, stream=True)
+        try:
+            response.raise_for_status()
+            probe['bytes'] = _total_bytes(response)
+            data = bytearray()
+            header = None
+            for chunk in response.iter_content(PROBE_CHUNK_SIZE):
+                data += chunk
+                probe['read_bytes'] = len(data)
+                header = sniff_image(data)
+                if header or len(data) >= IMAGE_PROBE_BYTES:
+                    break
+                if time.perf_counter() - started > timeout:
+                    probe['error'] = 'timeout'
+                    break
+        finally:
+            response.close()
+    except requests.exceptions.RequestException as e:
+        image_breaker.record(domain, failure_code(e))
+        probe['error'] = failure_code(e)
+        return probe
+    image_breaker.record_success(domain)
+
+    if header:
+        probe['format'], (probe['width'], probe['height']) = header
+    elif not probe['error']:
+        probe['error'] = 'no-header'
+    return probe
+
+
+def score(probe: Dict) -> Optional[float]:
+    """
+    How good a product photo the probed image is likely to be, or None if it
+    should be dropped (unreadable, an icon or tracker, or a banner shape).
+    """
+    width, height = probe['width'], probe['height']
+    if not width or not height:
+        return None
+    if min(width, height) < IMAGE_MIN_SIDE:
+        return None
+    aspect = max(width, height) / min(width, height)
+    if aspect > IMAGE_MAX_ASPECT:
+        return None
+    # Product photos are close to square; each step away from it costs a little
+    return min(width * height, IMAGE_TARGET_PIXELS) / aspect ** 0.5
+
+
+class ImageProber:
+    """
+    Probes candidate images concurrently on a shared thread pool. Probes still
+    running when a ranking's time is up are left to finish in the background
+    rather than holding up the request.
+    """
+
+    def __init__(self, workers: int = IMAGE_PROBE_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        pid = os.getpid()
+        if self._executor is None or self._pid != pid:
+            with self._lock:
+                if self._executor is None or self._pid != pid:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image-probe')
+                    self._pid = pid
+        return self._executor
+
+    def _probe(self, url: str, timeout: float) -> Dict:
+        probe = probe_image(url, timeout)
+        if probe['width']:
+            try:
+                caches['scraper'].set(f"image-probe:{url}", probe, timeout=IMAGE_PROBE_CACHE_TTL)
+            except Exception as e:
+                logger.warning(f"Image probe cache write failed: {e}")
+        return probe
+
+    def _cached(self, urls: List[str]) -> Dict[str, Dict]:
+        """Earlier probes of any of urls, by URL"""
+        try:
+            found = caches['scraper'].get_many([f"image-probe:{url}" for url in urls])
+        except Exception as e:
+            logger.warning(f"Image probe cache read failed: {e}")
+            return {}
+        return {key[len('image-probe:'):]: probe for key, probe in found.items()}
+
+    def rank(self, urls: Iterable[str], timeout: float = IMAGE_PROBE_TIMEOUT) -> Dict:
+        """
+        Probe candidate image URLs and rank them, best first.
+
+        Returns a dict with 'images' (kept candidates with their dimensions,
+        best first, followed by any not probed in time in their original
+        order) and 'dropped' (icons, trackers, banners and unreadable URLs).
+        """
+        # Anything but a URL string (e.g. a JSON-LD image object that slipped through) is skipped
+        candidates = list(dict.fromkeys(url for url in urls
+                                        if isinstance(url, str) and url and not url.startswith('data:')))
+        candidates = candidates[:IMAGE_MAX_CANDIDATES]
+        if not candidates:
+            return {'images': [], 'dropped': []}
+
+        cached = self._cached(candidates)
+        deadline = time.monotonic() + timeout
+        futures = {url: self.executor.submit(self._probe, url, timeout) for url in candidates if url not in cached}
+        pending = set(futures.values())
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            _, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+
+        probes, unprobed = [], []
+        for index, url in enumerate(candidates):
+            if url in cached:
+                probe = dict(cached[url], cached=True)
+            elif futures[url] in pending:
+                unprobed.append({'url': url, 'error': 'timeout'})
+                continue
+            else:
+                probe = futures[url].result()
+            probe['score'] = score(probe)
+            probe['index'] = index
+            probes.append(probe)
+
+        kept = sorted((probe for probe in probes if probe['score'] is not None),
+                      key=lambda probe: (-probe['score'], probe['index']))
+        dropped = [probe for probe in probes if probe['score'] is None]
+        for probe in probes:
+            del probe['index']
+        if unprobed:
+            logger.info(f"{len(unprobed)} of {len(candidates)} image probes didn't finish in {timeout}s")
+        return {'images': kept + unprobed, 'dropped': dropped}
+
+
+image_prober = ImageProber()
+
+
+def best_image(urls: List[str], timeout: float = IMAGE_PROBE_TIMEOUT) -> Optional[str]:
+    """URL of the best-ranked candidate image, or None if every candidate was dropped"""
+    ranked = image_prober.rank(urls, timeout)['images']
+    return ranked[0]['url'] if ranked else None
@@ -0,0 +1,135 @@
+import os
+import logging
+import warnings
+from io import BytesIO
+from typing import Dict, Optional
+
+from django.core.files.base import ContentFile
+from PIL import Image
+
+from .image_downloader import IMAGE_MAX_PIXELS, MemoryReader
+
+logger = logging.getLogger(__name__)
+
+# Image rendition settings
+IMAGE_RENDITIONS = os.getenv('IMAGE_RENDITIONS', 'true').lower() == 'true'  # Make renditions when an image is stored
+IMAGE_RENDITION_QUALITY = int(os.getenv('IMAGE_RENDITION_QUALITY', '80'))  # WebP and JPEG quality
+IMAGE_RENDITION_WORKERS = int(os.getenv('IMAGE_RENDITION_WORKERS', '4'))  # Images rendered at once by the backfill
+
+# Longest side of each rendition in pixels; smaller images are never upscaled
+RENDITION_SIZES = {
+    'thumbnail': 256,  # Wishlist previews
+    'card': 640,       # Item cards
+    'detail': 1280,    # Full-width and high-DPI views
+}
+RENDITION_FORMATS = (('webp', 'WEBP'), ('jpeg', 'JPEG'))  # (map key, Pillow format); JPEG is the fallback
+
+
+def _fit(size, side: int):
+    """size scaled down so its longest side is at most side"""
+    width, height = size
+    scale = side / max(width, height)
+    if scale >= 1:
+        return width, height
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def make_renditions(data) -> Dict[str, Dict]:
+    """
+    Encode every rendition of the image in data from a single decode.
+
+    JPEGs are decoded with Pillow's draft mode, which lets libjpeg scale by
+    1/2, 1/4 or 1/8 during the decode; the reduction stops before the image
+    gets smaller than the largest rendition. Each rendition is then resized
+    from the next larger one rather than from the full image.
+
+    Returns {name: {'width', 'height', 'webp': bytes, 'jpeg': bytes}}.
+    Renditions that would be the same size as a larger one are left out.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+        img = Image.open(MemoryReader(memoryview(data)))
+    if img.size[0] * img.size[1] > IMAGE_MAX_PIXELS:
+        raise ValueError(f"Image is {img.size[0]}x{img.size[1]}, over the {IMAGE_MAX_PIXELS} pixel limit")
+
+    if img.format == 'JPEG':
+        img.draft('RGB', _fit(img.size, max(RENDITION_SIZES.values())))
+    img.load()
+
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    renditions = {}
+    current = img
+    for name, side in sorted(RENDITION_SIZES.items(), key=lambda rendition: -rendition[1]):
+        size = _fit(current.size, side)
+        if size == current.size and renditions:
+            continue
+        if size != current.size:
+            current = current.resize(size, Image.LANCZOS, reducing_gap=3.0)
+        rendition = {'width': size[0], 'height': size[1]}
+        for key, image_format in RENDITION_FORMATS:
+            output = BytesIO()
+            current.save(output, format=image_format, quality=IMAGE_RENDITION_QUALITY,
+                         **({'method': 4} if image_format == 'WEBP' else {'optimize': True, 'progressive': True}))
+            rendition[key] = output.getvalue()
+        renditions[name] = rendition
+    return renditions
+
+
+def store_renditions(storage, image_name: str, renditions: Dict[str, Dict]) -> Dict[str, Dict]:
+    """
+    Save renditions next to image_name (under its renditions/ directory) and
+    return the map kept on the item: {name: {'width', 'height', 'webp': path, 'jpeg': path}}.
+    A rendition left out by make_renditions points at the next larger one.
+    Paths depend only on image_name, so rendering again replaces the files.
+    """
+    directory, basename = os.path.split(image_name)
+    stem = os.path.splitext(basename)[0]
+    stored, larger = {}, None
+    for name, side in sorted(RENDITION_SIZES.items(), key=lambda rendition: -rendition[1]):
+        rendition = renditions.get(name)
+        if rendition is not None:
+            larger = {'width': rendition['width'], 'height': rendition['height']}
+            for key, _ in RENDITION_FORMATS:
+                extension = 'jpg' if key == 'jpeg' else key
+                path = os.path.join(directory, 'renditions', f"{stem}_{name}.{extension}")
+                if storage.exists(path):
+                    storage.delete(path)
+                larger[key] = storage.save(path, ContentFile(rendition[key]))
+        stored[name] = larger
+    return stored
+
+
+def create_renditions(storage, image_name: str, data: Optional[bytes] = None) -> Dict[str, Dict]:
+    """
+    Make and store the renditions of the stored image image_name, decoding
+    data if given instead of reading the file back. Returns {} (clients fall
+    back to the full image) if renditions are off or the image can't be read.
+    """
+    if not IMAGE_RENDITIONS or not image_name:
+        return {}
+    try:
+        if data is None:
+            with storage.open(image_name, 'rb') as f:
+                data = f.read()
+        return store_renditions(storage, image_name, make_renditions(data))
+    except Exception as e:
+        logger.warning(f"Could not make renditions of {image_name}: {e}")
+        return {}
+
+
+def delete_renditions(storage, rendition_map: Dict[str, Dict]):
+    """Remove the files of a rendition map from storage"""
+    paths = {entry[key] for entry in (rendition_map or {}).values() for key, _ in RENDITION_FORMATS if entry.get(key)}
+    for path in paths:
+        try:
+            storage.delete(path)
+        except Exception as e:
+            logger.warning(f"Could not delete rendition {path}: {e}")
+
@@ -0,0 +1,160 @@
+import os
+import time
+import logging
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from django.core.cache import caches
+
+from ..models import StoredImage
+from . import image_store
+from .image_downloader import download_image_if_changed, sniff_image
+
+logger = logging.getLogger(__name__)
+
+# Image source cache settings (seconds)
+IMAGE_SOURCE_TTL = int(os.getenv('IMAGE_SOURCE_TTL', '86400'))  # Reuse without revalidating for a day
+IMAGE_SOURCE_MAX_AGE = int(os.getenv('IMAGE_SOURCE_MAX_AGE', str(90 * 86400)))  # Keep for revalidation this long
+
+
+def normalize_image_url(url: str) -> str:
+    """
+    Normalize an image URL for the cache key: lowercase scheme and host and
+    drop the fragment. Unlike product URLs the query is kept as it is, since
+    image CDNs use it for the size, crop, format or version of the image.
+    """
+    parsed = urlparse(url.strip())
+    return parsed._replace(scheme=parsed.scheme.lower(), netloc=parsed.netloc.lower(), fragment='').geturl()
+
+
+class ImageSourceCache:
+    """
+    Persistent map from a normalized image URL to the stored image it was
+    processed into (see image_store.py).
+
+    Entries hold the digest and name of the stored image, its metadata and
+    the ETag/Last-Modified validators of the response it came from. A fresh
+    entry attaches the stored image without touching the network; a stale
+    one is revalidated with a conditional GET, and the image is only
+    downloaded and processed again if the server sends a new one. Storage
+    and eviction are handled by the 'scraper' Django cache.
+    """
+
+    STATS_KEYS = ('hits', 'misses', 'revalidated', 'refreshed', 'bytes_saved')
+
+    def __init__(self, alias: str = 'scraper', ttl: int = IMAGE_SOURCE_TTL, max_age: int = IMAGE_SOURCE_MAX_AGE):
+        self.alias = alias
+        self.ttl = ttl
+        self.max_age = max_age
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def _key(self, url: str) -> str:
+        return f"image-source:{normalize_image_url(url)}"
+
+    def get(self, url: str) -> Optional[Dict]:
+        """Return the cached entry for url (fresh or stale), or None"""
+        try:
+            entry = self.backend.get(self._key(url))
+        except Exception as e:
+            logger.warning(f"Image source cache read failed: {e}")
+            return None
+        if entry:
+            entry['fresh'] = time.time() - entry['fetched_at'] < self.ttl
+        return entry
+
+    def set(self, url: str, stored: StoredImage, data: bytes, info: Dict):
+        """Record that url was processed into stored; info is the download's validators and size"""
+        header = sniff_image(data)
+        entry = {
+            'digest': stored.digest,
+            'name': stored.name,
+            'size': len(data),
+            'format': header[0] if header else None,
+            'width': header[1][0] if header else None,
+            'height': header[1][1] if header else None,
+            'source_bytes': info.get('bytes', 0),  # What a download costs; counted as saved on every reuse
+            'etag': info.get('etag'),
+            'last_modified': info.get('last_modified'),
+            'fetched_at': time.time(),
+        }
+        try:
+            self.backend.set(self._key(url), entry, timeout=self.max_age)
+        except Exception as e:
+            logger.warning(f"Image source cache write failed: {e}")
+
+    def touch(self, url: str, entry: Dict):
+        """Mark a stale entry as fresh again after a 304 Not Modified"""
+        entry = {key: value for key, value in entry.items() if key != 'fresh'}
+        entry['fetched_at'] = time.time()
+        try:
+            self.backend.set(self._key(url), entry, timeout=self.max_age)
+        except Exception as e:
+            logger.warning(f"Image source cache write failed: {e}")
+
+    def incr(self, name: str, amount: int = 1):
+        key = f"image-source-stats:{name}"
+        try:
+            self.backend.add(key, 0, timeout=None)
+            self.backend.incr(key, amount)
+        except Exception:
+            pass
+
+    def stats(self) -> Dict:
+        """Hit/miss counters; hits and revalidations are image downloads we didn't repeat"""
+        try:
+            values = self.backend.get_many([f"image-source-stats:{name}" for name in self.STATS_KEYS])
+        except Exception:
+            values = {}
+        stats = {name: values.get(f"image-source-stats:{name}", 0) for name in self.STATS_KEYS}
+        lookups = stats['hits'] + stats['revalidated'] + stats['refreshed'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['revalidated']) / lookups, 3) if lookups else 0.0
+        return stats
+
+
+image_source_cache = ImageSourceCache()
+
+
+def fetch_image(url: str) -> Tuple[StoredImage, Optional[bytes]]:
+    """
+    A reference to the stored image for url, downloading and storing it only
+    if it isn't cached or the server has a new version.
+
+    Returns (stored image, processed bytes); the bytes are None when nothing
+    was downloaded. Raises ImageDownloadException if the image can't be had.
+    """
+    entry = image_source_cache.get(url)
+    # Hold a reference while revalidating so the stored image can't be collected meanwhile
+    cached = image_store.acquire(entry['digest']) if entry else None
+    if cached and entry['fresh']:
+        image_source_cache.incr('hits')
+        image_source_cache.incr('bytes_saved', entry['source_bytes'])
+        return cached, None
+
+    try:
+        if cached:
+            result = download_image_if_changed(url, etag=entry['etag'], last_modified=entry['last_modified'])
+        else:
+            result = download_image_if_changed(url)
+    except Exception:
+        image_store.release(cached.name if cached else None)
+        raise
+
+    if result is None:
+        logger.info(f"Reusing stored image {cached.name} for {url}")
+        image_source_cache.touch(url, entry)
+        image_source_cache.incr('revalidated')
+        image_source_cache.incr('bytes_saved', entry['source_bytes'])
+        return cached, None
+
+    content_file, filename, info = result
+    data = content_file.read()
+    try:
+        stored = image_store.store(data, os.path.splitext(filename)[1])
+    finally:
+        image_store.release(cached.name if cached else None)
+    image_source_cache.set(url, stored, data, info)
+    image_source_cache.incr('refreshed' if entry else 'misses')
+    return stored, data
@@ -0,0 +1,199 @@
+import os
+import time
+import hashlib
+import logging
+from datetime import timedelta
+from typing import Dict, Optional
+
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from ..models import StoredImage, WishListItem
+from .image_renditions import create_renditions, delete_renditions
+
+logger = logging.getLogger(__name__)
+
+# Content-addressed image store settings
+IMAGE_STORE_GRACE = int(os.getenv('IMAGE_STORE_GRACE', '3600'))  # Seconds an unreferenced image is kept before deletion
+
+ACQUIRE_RETRIES = 100  # Waits for an image being garbage collected before taking it over
+ACQUIRE_WAIT = 0.05
+STATS_KEYS = ('written', 'deduplicated', 'bytes_deduplicated', 'collected')
+
+
+def _storage():
+    return WishListItem._meta.get_field('image').storage
+
+
+def digest_of(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def image_name(digest: str, extension: str) -> str:
+    """Where the image with this digest is stored; the first two hex digits shard the directory"""
+    extension = extension.lower().lstrip('.') or 'jpg'
+    if extension == 'jpeg':
+        extension = 'jpg'
+    return f"wishlist_items/{digest[:2]}/{digest}.{extension}"
+
+
+def incr(name: str, amount: int = 1):
+    key = f"image-store-stats:{name}"
+    try:
+        caches['scraper'].add(key, 0, timeout=None)
+        caches['scraper'].incr(key, amount)
+    except Exception:
+        pass
+
+
+def _acquire(digest: str) -> Optional[StoredImage]:
+    """Take a reference to the stored image with digest, or None if there is none (or it is being deleted)"""
+    if not StoredImage.objects.filter(digest=digest, ref_count__gte=0).update(
+        ref_count=F('ref_count') + 1, released_at=None
+    ):
+        return None
+    return StoredImage.objects.get(digest=digest)
+
+
+def store(data, extension: str) -> StoredImage:
+    """
+    Take a reference to the stored copy of data, writing it under its digest
+    first if this is the first time these bytes have been seen.
+    """
+    digest = digest_of(data)
+    for attempt in range(ACQUIRE_RETRIES + 2):
+        StoredImage.objects.get_or_create(
+            digest=digest, defaults={'name': image_name(digest, extension), 'size': len(data)}
+        )
+        stored = _acquire(digest)
+        if stored:
+            break
+        if attempt < ACQUIRE_RETRIES:
+            time.sleep(ACQUIRE_WAIT)
+        else:
+            # A garbage collection died mid-way; its files may be partly gone, so take it over and rewrite them
+            StoredImage.objects.filter(digest=digest, ref_count=-1).update(ref_count=0, renditions={})
+    else:
+        raise RuntimeError(f"Could not take a reference to stored image {digest}")
+
+    storage = _storage()
+    if storage.exists(stored.name):
+        incr('deduplicated')
+        incr('bytes_deduplicated', len(data))
+    else:
+        saved = storage.save(stored.name, ContentFile(data))
+        if saved != stored.name:
+            # Another thread wrote the same bytes first
+            storage.delete(saved)
+        incr('written')
+    return stored
+
+
+def release(name: Optional[str]):
+    """Drop one item's reference to the stored image name; unreferenced images are collected after IMAGE_STORE_GRACE"""
+    if not name:
+        return
+    StoredImage.objects.filter(name=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+    StoredImage.objects.filter(name=name, ref_count=0, released_at__isnull=True).update(released_at=timezone.now())
+
+
+def acquire(digest: str) -> Optional[StoredImage]:
+    """
+    A reference to the image already stored under digest, or None if it is
+    gone. Lets a known image be attached without processing it again.
+    """
+    stored = _acquire(digest)
+    if stored is None:
+        return None
+    if not _storage().exists(stored.name):
+        release(stored.name)
+        return None
+    return stored
+
+
+def renditions_for(stored: StoredImage, data=None) -> Dict[str, Dict]:
+    """The renditions shared by every item using stored, made from data (or the file) the first time"""
+    if stored.renditions:
+        return stored.renditions
+    renditions = create_renditions(_storage(), stored.name, data)
+    if renditions:
+        StoredImage.objects.filter(pk=stored.pk).update(renditions=renditions)
+        stored.renditions = renditions
+    return renditions
+
+
+def render_item(item, force: bool = False) -> Optional[Dict[str, Dict]]:
+    """
+    Attach the renditions of item's image to item, unless it has them
+    already (or force). Images in the store share one set of renditions,
+    so only the first item showing an image renders it. The map is only
+    written if the item still has the same image. Returns the map written,
+    or None if nothing was.
+    """
+    if not item.image or (item.image_renditions and not force):
+        return None
+    stored = StoredImage.objects.filter(name=item.image.name, ref_count__gte=0).first()
+    if stored:
+        if force:
+            stored.renditions = {}
+        rendition_map = renditions_for(stored)
+    else:
+        # Stored before content addressing (see deduplicate_item_images); its renditions are its own
+        rendition_map = create_renditions(_storage(), item.image.name)
+    if not rendition_map:
+        return None
+    if not WishListItem.objects.filter(id=item.id, image=item.image.name).update(image_renditions=rendition_map):
+        return None
+    item.image_renditions = rendition_map
+    return rendition_map
+
+
+def collect_garbage(grace: int = IMAGE_STORE_GRACE) -> int:
+    """Delete stored images (and their renditions) unreferenced for longer than grace seconds"""
+    storage = _storage()
+    removed = 0
+    candidates = StoredImage.objects.filter(ref_count=0, released_at__lt=timezone.now() - timedelta(seconds=grace))
+    for stored in candidates:
+        references = WishListItem.objects.filter(image=stored.name).count()
+        if references:
+            # The count drifted (e.g. a save that failed after releasing); trust the items
+            StoredImage.objects.filter(pk=stored.pk, ref_count=0).update(ref_count=references, released_at=None)
+            continue
+        # -1 marks it as being deleted so store() can't take a reference while the files go
+        if not StoredImage.objects.filter(pk=stored.pk, ref_count=0).update(ref_count=-1):
+            continue
+        delete_renditions(storage, stored.renditions)
+        try:
+            storage.delete(stored.name)
+        except Exception as e:
+            logger.warning(f"Could not delete stored image {stored.name}: {e}")
+        StoredImage.objects.filter(pk=stored.pk, ref_count=-1).delete()
+        removed += 1
+    if removed:
+        logger.info(f"Collected {removed} unreferenced stored images")
+        incr('collected', removed)
+    return removed
+
+
+def store_stats() -> Dict:
+    """Unique images and bytes on disk, references to them, and the writes deduplication saved"""
+    totals = StoredImage.objects.filter(ref_count__gte=0).aggregate(
+        images=Count('id'), bytes=Sum('size'), references=Sum('ref_count')
+    )
+    shared_bytes = StoredImage.objects.filter(ref_count__gt=1).aggregate(
+        saved=Sum(F('size') * (F('ref_count') - 1))
+    )['saved']
+    try:
+        values = caches['scraper'].get_many([f"image-store-stats:{name}" for name in STATS_KEYS])
+    except Exception:
+        values = {}
+    stats = {name: values.get(f"image-store-stats:{name}", 0) for name in STATS_KEYS}
+    stats.update(
+        images=totals['images'],
+        bytes_stored=totals['bytes'] or 0,
+        references=totals['references'] or 0,
+        bytes_shared=shared_bytes or 0,  # Disk a copy per item would take on top of bytes_stored
+    )
+    return stats
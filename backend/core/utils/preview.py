@@ -0,0 +1,128 @@
+import os
+import re
+import logging
+from typing import Dict, Optional
+from urllib.parse import urljoin, urlparse
+
+import requests
+from django.core.cache import caches
+
+from . import http_client, timing
+from .circuit_breaker import failure_code, scrape_breaker
+from .deadline import Deadline
+from .scraper import normalize_url, scrape_cache
+from .streaming import EarlyParser, read_head
+
+logger = logging.getLogger(__name__)
+
+# Link preview settings: only the <head> of the page is fetched
+PREVIEW_MAX_BYTES = int(os.getenv('PREVIEW_MAX_BYTES', str(64 * 1024)))  # Stop reading here if </head> hasn't closed
+PREVIEW_TIMEOUT = float(os.getenv('PREVIEW_TIMEOUT', '3'))  # Seconds for the whole preview, connecting included
+PREVIEW_CACHE_TTL = int(os.getenv('PREVIEW_CACHE_TTL', '3600'))
+
+PREVIEW_FIELDS = ('title', 'image_url', 'description', 'price', 'site_name')
+
+PREVIEW_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': http_client.ACCEPT_ENCODING,
+    'Connection': 'keep-alive',
+}
+
+
+def _empty_preview(method: str, error: Optional[str] = None) -> Dict:
+    data = {field: None for field in PREVIEW_FIELDS}
+    data['preview_method'] = method
+    if error:
+        data['error'] = error
+    return data
+
+
+def _parser_for(url: str, response) -> EarlyParser:
+    match = re.search(r'charset=["\']?([\w-]+)', response.headers.get('Content-Type', ''), re.I)
+    if match:
+        try:
+            return EarlyParser(url, encoding=match.group(1))
+        except LookupError:
+            pass
+    return EarlyParser(url)
+
+
+def _preview_data(url: str, parser: EarlyParser) -> Dict:
+    """Preview fields from what the parser saw: Product JSON-LD, then meta tags, then <title>"""
+    data = parser.meta_data()
+    data['site_name'] = parser.meta.get('og:site_name')
+    method = 'meta-tags' if any(data.values()) else None
+    if parser.product:
+        method = 'json-ld'
+        for field in ('title', 'price', 'description'):
+            data[field] = parser.product.get(field) or data[field]
+        image = parser.product.get('image_url')
+        if image:
+            data['image_url'] = urljoin(url, image)
+    if not data['title'] and parser.title_text:
+        data['title'] = parser.title_text
+        method = method or 'title-tag'
+    data['preview_method'] = method or 'empty'
+    return data
+
+
+def preview_url(url: str, timeout: float = PREVIEW_TIMEOUT) -> Dict:
+    """
+    Title, image and description (plus price when the head has it) of a page,
+    read from its <head> only, for prefilling the add-item form while the full
+    scrape runs. A cached full scrape of the URL is used when there is one.
+    """
+    with timing.trace('preview') as preview_trace:
+        data = _preview(url, Deadline(timeout))
+    timing.preview_timings.observe(preview_trace, urlparse(url).netloc)
+    return data
+
+
+def _preview(url: str, deadline: Deadline) -> Dict:
+    entry = scrape_cache.get(url)
+    if entry:
+        # Even a stale full scrape has everything the form needs
+        data = {field: entry['data'].get(field) for field in PREVIEW_FIELDS}
+        data['preview_method'] = 'scrape-cache'
+        return data
+
+    key = f"preview:{normalize_url(url)}"
+    try:
+        cached = caches['scraper'].get(key)
+    except Exception as e:
+        logger.warning(f"Preview cache read failed: {e}")
+        cached = None
+    if cached:
+        return dict(cached, cached=True)
+
+    domain = urlparse(url).netloc
+    if not scrape_breaker.allow(domain):
+        return _empty_preview('circuit-open', 'This site is temporarily blocking automated requests.')
+
+    try:
+        with deadline.phase('fetch'):
+            response = http_client.get(url, headers=PREVIEW_HEADERS, timeout=deadline.timeout(deadline.seconds),
+                                       stream=True)
+        if response.status_code >= 400:
+            response.close()
+        response.raise_for_status()
+        parser = _parser_for(response.url, response)
+        with deadline.phase('read'):
+            complete = read_head(response, parser, PREVIEW_MAX_BYTES, deadline)
+    except requests.exceptions.RequestException as e:
+        scrape_breaker.record(domain, failure_code(e))
+        logger.warning(f"Preview of {url} failed: {e}")
+        return _empty_preview('failed', str(e))
+    scrape_breaker.record_success(domain)
+
+    data = _preview_data(response.url, parser)
+    data['complete'] = complete  # False if the head was cut short by the byte cap or the timeout
+    logger.info(f"Previewed {url} from {parser.bytes_fed} bytes using {data['preview_method']}")
+    if complete and (data['title'] or data['image_url']):
+        try:
+            caches['scraper'].set(key, data, timeout=PREVIEW_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Preview cache write failed: {e}")
+    return data
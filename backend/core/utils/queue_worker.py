@@ -0,0 +1,96 @@
+import os
+import signal
+import socket
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+MAINTENANCE_INTERVAL = 60  # Seconds between maintenance sweeps
+
+
+class QueueWorker:
+    """
+    Pulls tasks from a database-backed queue and runs them on a fixed-size
+    thread pool. Several worker processes can share one queue, as long as
+    claim_next() claims with a conditional update.
+
+    Subclasses set `label` and `thread_name_prefix` and implement
+    claim_next(), process() and maintain(); maintain() runs at most once
+    every `maintenance_interval` seconds.
+    """
+
+    label = 'Queue'  # For log messages, e.g. 'Scrape' -> "Scrape worker host:123 started"
+    thread_name_prefix = 'queue-worker'
+    maintenance_interval = MAINTENANCE_INTERVAL
+
+    def __init__(self, workers: int, poll_interval: float):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.last_maintenance = 0.0
+
+    def claim_next(self):
+        """Claim the next due task, or None if there is none"""
+        raise NotImplementedError
+
+    def process(self, task):
+        """Run one claimed task"""
+        raise NotImplementedError
+
+    def maintain(self):
+        """Periodic upkeep such as requeuing tasks whose worker went away"""
+
+    def stop(self, *args):
+        logger.info(f"{self.label} worker {self.name} stopping after {self.in_flight} running tasks")
+        self.stopping.set()
+
+    def _run(self, task):
+        try:
+            self.process(task)
+        except Exception:
+            logger.exception(f"{self.label} task {getattr(task, 'id', task)} raised")
+        finally:
+            close_old_connections()
+            with self.lock:
+                self.in_flight -= 1
+
+    def _maintain(self):
+        if time.monotonic() - self.last_maintenance < self.maintenance_interval:
+            return
+        self.last_maintenance = time.monotonic()
+        self.maintain()
+
+    def run(self, once: bool = False):
+        """Process tasks until stopped; with once=True, exit when nothing is due"""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.thread_name_prefix)
+        logger.info(f"{self.label} worker {self.name} started with {self.workers} threads")
+        try:
+            while not self.stopping.is_set():
+                self._maintain()
+                claimed = 0
+                while self.in_flight < self.workers:
+                    task = self.claim_next()
+                    if task is None:
+                        break
+                    with self.lock:
+                        self.in_flight += 1
+                    executor.submit(self._run, task)
+                    claimed += 1
+
+                if once and not claimed and not self.in_flight:
+                    break
+                if not claimed:
+                    self.stopping.wait(self.poll_interval)
+        finally:
+            executor.shutdown(wait=True)
+            close_old_connections()
@@ -0,0 +1,150 @@
+import os
+import logging
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from django.utils import timezone
+
+from ..models import ScrapeJob
+from .queue_worker import QueueWorker
+from .scraper import ProductScraper
+
+logger = logging.getLogger(__name__)
+
+# Background scrape job settings
+SCRAPE_JOB_WORKERS = int(os.getenv('SCRAPE_JOB_WORKERS', '4'))  # Scrapes run at once by one worker process
+SCRAPE_JOB_MAX_QUEUED = int(os.getenv('SCRAPE_JOB_MAX_QUEUED', '100'))  # New jobs are refused past this depth
+SCRAPE_JOB_POLL_INTERVAL = float(os.getenv('SCRAPE_JOB_POLL_INTERVAL', '0.5'))  # Seconds between queue checks
+SCRAPE_JOB_TIMEOUT = int(os.getenv('SCRAPE_JOB_TIMEOUT', '300'))  # Running jobs older than this are failed
+SCRAPE_JOB_RETENTION = int(os.getenv('SCRAPE_JOB_RETENTION', str(24 * 3600)))  # Finished jobs are deleted after this
+SCRAPE_JOB_STATS_WINDOW = int(os.getenv('SCRAPE_JOB_STATS_WINDOW', '3600'))  # Seconds of finished jobs in stats
+
+
+class QueueFullError(Exception):
+    """Exception raised when the scrape job queue is at capacity"""
+    pass
+
+
+def enqueue(user, url: str, refresh: bool = False) -> ScrapeJob:
+    """
+    Queue a scrape of url for user. An unfinished job for the same user and
+    URL is returned instead of queuing a duplicate.
+    """
+    if not refresh:
+        existing = ScrapeJob.objects.filter(user=user, url=url, status__in=('queued', 'running')).first()
+        if existing:
+            return existing
+
+    depth = ScrapeJob.objects.filter(status='queued').count()
+    if depth >= SCRAPE_JOB_MAX_QUEUED:
+        raise QueueFullError(f"{depth} scrape jobs already queued")
+    return ScrapeJob.objects.create(user=user, url=url, refresh=refresh)
+
+
+def claim_next(worker: str) -> Optional[ScrapeJob]:
+    """Mark the oldest queued job as running for worker and return it"""
+    candidates = ScrapeJob.objects.filter(status='queued').order_by('created_at').values_list('id', flat=True)[:5]
+    for job_id in candidates:
+        # Conditional update so two workers never run the same job
+        claimed = ScrapeJob.objects.filter(id=job_id, status='queued').update(
+            status='running', started_at=timezone.now(), worker=worker
+        )
+        if claimed:
+            return ScrapeJob.objects.get(id=job_id)
+    return None
+
+
+def run_job(job: ScrapeJob) -> ScrapeJob:
+    """Scrape the job's URL and store the result"""
+    try:
+        data = ProductScraper(job.url, use_cache=not job.refresh).scrape()
+        job.result = data
+        job.status = 'succeeded' if data and (data.get('title') or data.get('price')) else 'failed'
+        job.error = (data or {}).get('error') or ''
+    except Exception as e:
+        logger.exception(f"Scrape job {job.id} for {job.url} raised")
+        job.status = 'failed'
+        job.error = str(e)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['result', 'status', 'error', 'finished_at'])
+    logger.info(f"Scrape job {job.id} {job.status}: queued {job.queue_seconds:.1f}s, ran {job.run_seconds:.1f}s")
+    return job
+
+
+def fail_stale_jobs() -> int:
+    """Fail running jobs whose worker has gone away"""
+    cutoff = timezone.now() - timedelta(seconds=SCRAPE_JOB_TIMEOUT)
+    return ScrapeJob.objects.filter(status='running', started_at__lt=cutoff).update(
+        status='failed', error='Worker stopped before the scrape finished', finished_at=timezone.now()
+    )
+
+
+def purge_finished_jobs() -> int:
+    cutoff = timezone.now() - timedelta(seconds=SCRAPE_JOB_RETENTION)
+    deleted, _ = ScrapeJob.objects.filter(status__in=('succeeded', 'failed'), finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def _summary(values: List[float]) -> Dict:
+    if not values:
+        return {'avg': None, 'p50': None, 'p95': None, 'max': None}
+    values = sorted(values)
+    return {
+        'avg': round(sum(values) / len(values), 2),
+        'p50': round(values[len(values) // 2], 2),
+        'p95': round(values[min(len(values) - 1, int(len(values) * 0.95))], 2),
+        'max': round(values[-1], 2),
+    }
+
+
+def job_stats() -> Dict:
+    """Queue depth plus queue time vs. run time of recently finished jobs"""
+    now = timezone.now()
+    oldest = ScrapeJob.objects.filter(status='queued').order_by('created_at').values_list('created_at', flat=True).first()
+    finished = ScrapeJob.objects.filter(
+        finished_at__gte=now - timedelta(seconds=SCRAPE_JOB_STATS_WINDOW), started_at__isnull=False
+    ).values_list('status', 'created_at', 'started_at', 'finished_at')
+
+    queue_times, run_times, failed = [], [], 0
+    for job_status, created_at, started_at, finished_at in finished:
+        queue_times.append((started_at - created_at).total_seconds())
+        run_times.append((finished_at - started_at).total_seconds())
+        failed += job_status == 'failed'
+
+    return {
+        'queued': ScrapeJob.objects.filter(status='queued').count(),
+        'running': ScrapeJob.objects.filter(status='running').count(),
+        'max_queued': SCRAPE_JOB_MAX_QUEUED,
+        'oldest_queued_seconds': round((now - oldest).total_seconds(), 1) if oldest else None,
+        'window_seconds': SCRAPE_JOB_STATS_WINDOW,
+        'finished': len(queue_times),
+        'failed': failed,
+        'queue_seconds': _summary(queue_times),
+        'run_seconds': _summary(run_times),
+    }
+
+
+class ScrapeWorker(QueueWorker):
+    """
+    Pulls queued ScrapeJobs from the database and runs them on a fixed-size
+    thread pool, so slow scrapes never occupy web request workers. Several
+    worker processes can share one queue.
+    """
+
+    label = 'Scrape'
+    thread_name_prefix = 'scrape-job'
+
+    def __init__(self, workers: int = SCRAPE_JOB_WORKERS, poll_interval: float = SCRAPE_JOB_POLL_INTERVAL):
+        super().__init__(workers, poll_interval)
+
+    def claim_next(self) -> Optional[ScrapeJob]:
+        return claim_next(self.name)
+
+    def process(self, job: ScrapeJob):
+        run_job(job)
+
+    def maintain(self):
+        stale = fail_stale_jobs()
+        purged = purge_finished_jobs()
+        if stale or purged:
+            logger.info(f"Failed {stale} stale scrape jobs, purged {purged} finished jobs")
@@ -1,11 +1,30 @@
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse, urljoin
+from urllib.parse import urlparse, urljoin, urlencode, parse_qsl
 import re
-from typing import Dict, Optional, List
-import json
+from typing import Dict, Optional, List, Tuple
+import contextvars
+import copy
 import logging
 import os
+import queue
+import threading
+import time
+import zlib
+from django.core.cache import caches
+from . import http_client
+from .browser_pool import BROWSER_QUEUE_TIMEOUT, browser_pool
+from .extraction import (
+    BACKENDS, CSSSELECT_AVAILABLE, SinglePassExtractor, compile_site_selectors, decode_html,
+    extract_price_from_text, get_backend,
+)
+from . import strategy, timing
+from .circuit_breaker import detect_challenge, failure_code, render_breaker, scrape_breaker
+from .deadline import Deadline
+from .fast_render import (
+    FAST_RENDER_WAIT, FULL_RENDER_BLOCK_PATTERN, PLAYWRIGHT_FAST_RENDER, product_html, route_handler,
+    selectors_for, wait_for_product,
+)
+from .single_flight import scrape_flights
+from .streaming import EarlyParser, read_body, read_with_early_exit
 
 logger = logging.getLogger(__name__)
 
@@ -64,10 +83,17 @@ SITE_CONFIGS = {
     },
 }
 
+# SITE_CONFIGS selectors compiled once per extraction backend
+COMPILED_SITE_SELECTORS = {
+    name: compile_site_selectors(SITE_CONFIGS, backend)
+    for name, backend in BACKENDS.items()
+    if name != 'lxml' or CSSSELECT_AVAILABLE
+}
+
 # Try to import Playwright (optional dependency)
 PLAYWRIGHT_AVAILABLE = False
 try:
-    from playwright.sync_api import sync_playwright
+    import playwright.sync_api  # noqa: F401
     PLAYWRIGHT_AVAILABLE = True
     logger.info("Playwright is available for JavaScript rendering")
 except ImportError:
@@ -76,29 +102,242 @@ except ImportError:
 # Check if Playwright is enabled via environment variable
 USE_PLAYWRIGHT = os.getenv('USE_PLAYWRIGHT', 'true').lower() == 'true' and PLAYWRIGHT_AVAILABLE
 
+# Stream product pages and stop reading once JSON-LD or the meta tags have been seen
+SCRAPER_STREAMING = os.getenv('SCRAPER_STREAMING', 'true').lower() == 'true'
+
+# Least time left (seconds) worth starting each tier with; below this the tier is skipped
+REQUESTS_MIN_SECONDS = 0.5
+PLAYWRIGHT_MIN_SECONDS = 3.0
+
+# Fields that make a deadline-truncated result worth returning
+PARTIAL_FIELDS = ('title', 'price', 'image_url', 'description')
+
+# Scrape result cache settings (seconds)
+SCRAPE_CACHE_TTL = int(os.getenv('SCRAPE_CACHE_TTL', '21600'))  # Serve without revalidating for 6 hours
+SCRAPE_CACHE_MAX_AGE = int(os.getenv('SCRAPE_CACHE_MAX_AGE', '604800'))  # Keep stale entries for revalidation for 7 days
+
+# Gallery (all_images) extraction is opt-in; otherwise the page is kept so a later gallery request needn't refetch it
+SCRAPER_GALLERY = os.getenv('SCRAPER_GALLERY', 'false').lower() == 'true'  # Extract all_images in every scrape
+SCRAPE_PAGE_CACHE_TTL = int(os.getenv('SCRAPE_PAGE_CACHE_TTL', '3600'))  # Seconds a scraped page is kept for its gallery
+SCRAPE_PAGE_CACHE_MAX_BYTES = int(os.getenv('SCRAPE_PAGE_CACHE_MAX_BYTES', str(2 * 1024 * 1024)))  # Compressed size limit
+
+# Query parameters that only track the visitor and never change the product (plus utm_* and mc_*).
+# Site parameters such as Amazon's th/psc (which pick a variant) or tag/ref are kept.
+TRACKING_PARAMS = {'fbclid', 'gclid', 'msclkid'}
+TRACKING_PREFIXES = ('utm_', 'mc_')
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalize a product URL so the same product shared from different places
+    maps to the same cache key: lowercase scheme/host, drop the fragment,
+    tracking parameters and trailing slash, and sort the remaining query.
+    """
+    parsed = urlparse(url.strip())
+    host = parsed.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+
+    query = [
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    ]
+    path = parsed.path.rstrip('/') or '/'
+
+    normalized = f"{parsed.scheme.lower()}://{host}{path}"
+    if query:
+        normalized += '?' + urlencode(sorted(query))
+    return normalized
+
+
+class ScrapeCache:
+    """
+    Persistent cache of scrape results keyed by normalized URL.
+
+    Entries hold the extracted data plus the ETag/Last-Modified validators of
+    the response it came from. Fresh entries are served as-is; stale entries are
+    kept around so the next scrape can revalidate them with a conditional GET.
+    Storage and size-bounded eviction are handled by the 'scraper' Django cache.
+    """
+
+    STATS_KEYS = ('hits', 'misses', 'revalidated', 'refreshed', 'stores')
+
+    def __init__(self, alias: str = 'scraper', ttl: int = SCRAPE_CACHE_TTL, max_age: int = SCRAPE_CACHE_MAX_AGE):
+        self.alias = alias
+        self.ttl = ttl
+        self.max_age = max_age
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def _key(self, url: str) -> str:
+        return f"scrape:{normalize_url(url)}"
+
+    def get(self, url: str) -> Optional[Dict]:
+        """Return the cached entry for url (fresh or stale), or None"""
+        try:
+            entry = self.backend.get(self._key(url))
+        except Exception as e:
+            logger.warning(f"Scrape cache read failed: {e}")
+            return None
+        if entry:
+            entry['fresh'] = time.time() - entry['fetched_at'] < self.ttl
+        return entry
+
+    def set(self, url: str, data: Dict, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """Store a successful scrape result with its response validators"""
+        entry = {
+            'data': data,
+            'etag': etag,
+            'last_modified': last_modified,
+            'fetched_at': time.time(),
+        }
+        try:
+            self.backend.set(self._key(url), entry, timeout=self.max_age)
+            self.incr('stores')
+        except Exception as e:
+            logger.warning(f"Scrape cache write failed: {e}")
+
+    def touch(self, url: str, entry: Dict):
+        """Mark a stale entry as fresh again after a 304 Not Modified"""
+        entry = {key: value for key, value in entry.items() if key != 'fresh'}
+        entry['fetched_at'] = time.time()
+        try:
+            self.backend.set(self._key(url), entry, timeout=self.max_age)
+        except Exception as e:
+            logger.warning(f"Scrape cache write failed: {e}")
+
+    def set_gallery(self, url: str, entry: Dict, images: List[str]):
+        """Add a gallery extracted later to a cached entry, keeping its age"""
+        entry = {key: value for key, value in entry.items() if key != 'fresh'}
+        entry['data'] = dict(entry['data'], all_images=images)
+        try:
+            self.backend.set(self._key(url), entry, timeout=self.max_age)
+        except Exception as e:
+            logger.warning(f"Scrape cache write failed: {e}")
+
+    def set_page(self, url: str, content: bytes, content_type: str):
+        """Keep the source of a scraped page (compressed) for a later gallery request"""
+        compressed = zlib.compress(content, 1)
+        if len(compressed) > SCRAPE_PAGE_CACHE_MAX_BYTES:
+            return
+        try:
+            self.backend.set(f"page:{normalize_url(url)}", (compressed, content_type), timeout=SCRAPE_PAGE_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Page cache write failed: {e}")
+
+    def get_page(self, url: str) -> Optional[Tuple[bytes, str]]:
+        """(content, content_type) of the page kept by set_page, or None"""
+        try:
+            page = self.backend.get(f"page:{normalize_url(url)}")
+        except Exception as e:
+            logger.warning(f"Page cache read failed: {e}")
+            return None
+        if page is None:
+            return None
+        compressed, content_type = page
+        return zlib.decompress(compressed), content_type
+
+    def incr(self, name: str):
+        key = f"scrape-stats:{name}"
+        try:
+            self.backend.add(key, 0, timeout=None)
+            self.backend.incr(key)
+        except Exception:
+            pass
+
+    def stats(self) -> Dict:
+        """Hit/miss counters; hits and revalidations are scrapes we didn't repeat"""
+        try:
+            values = self.backend.get_many([f"scrape-stats:{name}" for name in self.STATS_KEYS])
+        except Exception:
+            values = {}
+        stats = {name: values.get(f"scrape-stats:{name}", 0) for name in self.STATS_KEYS}
+        lookups = stats['hits'] + stats['revalidated'] + stats['refreshed'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['revalidated']) / lookups, 3) if lookups else 0.0
+        return stats
+
+
+scrape_cache = ScrapeCache()
+
+
+class HedgeStats:
+    """
+    Counters for hedged scrapes, kept in the 'scraper' cache so every worker
+    adds to the same totals: how often the hedge fired and which tier won.
+    """
+
+    KEYS = ('eligible', 'fired', 'won_requests', 'won_playwright', 'no_winner', 'cancelled')
+
+    def __init__(self, alias: str = 'scraper'):
+        self.alias = alias
+
+    def incr(self, name: str):
+        key = f"hedge-stats:{name}"
+        try:
+            caches[self.alias].add(key, 0, timeout=None)
+            caches[self.alias].incr(key)
+        except Exception:
+            pass
+
+    def stats(self) -> Dict:
+        try:
+            values = caches[self.alias].get_many([f"hedge-stats:{name}" for name in self.KEYS])
+        except Exception:
+            values = {}
+        stats = {name: values.get(f"hedge-stats:{name}", 0) for name in self.KEYS}
+        stats['fire_rate'] = round(stats['fired'] / stats['eligible'], 3) if stats['eligible'] else 0.0
+        stats['enabled'] = strategy.SCRAPE_HEDGE and USE_PLAYWRIGHT
+        stats['delay_seconds'] = strategy.SCRAPE_HEDGE_DELAY
+        return stats
+
+
+hedge_stats = HedgeStats()
+
+
 class ProductScraper:
-    def __init__(self, url: str):
+    def __init__(self, url: str, use_cache: bool = True, streaming: Optional[bool] = None,
+                 backend: Optional[str] = None, adaptive: Optional[bool] = None,
+                 deadline: Optional[Deadline] = None, hedge: Optional[bool] = None,
+                 fast_render: Optional[bool] = None, gallery: Optional[bool] = None):
         self.url = url
+        self.deadline = deadline or Deadline()  # Unbounded unless the caller sets a budget
+        self.use_cache = use_cache
+        self.adaptive = strategy.SCRAPER_ADAPTIVE if adaptive is None else adaptive
+        self.hedge = strategy.SCRAPE_HEDGE if hedge is None else hedge
+        self.fast_render = PLAYWRIGHT_FAST_RENDER if fast_render is None else fast_render
+        self.gallery = SCRAPER_GALLERY if gallery is None else gallery  # Include all_images
+        self.extraction_order = strategy.EXTRACTION_ORDER
+        self.last_failure = None
+        self.streaming = SCRAPER_STREAMING if streaming is None else streaming
+        self.backend = get_backend(backend)
         self.domain = urlparse(url).netloc
+        self.site_key = None
         self.site_config = self._get_site_config()
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
             'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate, br',
+            'Accept-Encoding': http_client.ACCEPT_ENCODING,
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
             'Sec-Fetch-Dest': 'document',
             'Sec-Fetch-Mode': 'navigate',
             'Sec-Fetch-Site': 'none',
         }
+        self.trace = None  # Phase timings of the last scrape()
         self.scrape_method = 'unknown'  # Track which method succeeded
+        self.cached_entry = None  # Stale cache entry being revalidated
+        self.validators = {}  # ETag/Last-Modified of the last response
+        self.page = None  # (content, content_type) of the last page extracted, for the page cache
 
     def _get_site_config(self) -> Optional[Dict]:
         """Get site-specific configuration if available"""
         for domain, config in SITE_CONFIGS.items():
             if domain in self.domain:
                 logger.info(f"Using site-specific config for {domain}")
+                self.site_key = domain
                 return config
         return None
 
@@ -108,206 +347,534 @@ class ProductScraper:
         1. Try requests + BeautifulSoup (fast)
         2. If that fails and Playwright is available, try browser rendering
 
+        Results are served from the scrape cache when fresh; stale entries are
+        revalidated with a conditional request before re-extracting. Concurrent
+        scrapes of the same URL wait for the first one and share its result.
+
+        Every step draws on self.deadline; when it runs out, whatever was
+        extracted so far is returned with partial=True (and not cached).
+
+        all_images (the gallery) is only included when self.gallery is set. It
+        is then taken from the cache entry or the cached page source if either
+        has it, so asking for the gallery after a plain scrape needn't refetch.
+
         Returns dict with title, price, image_url, description, all_images, scrape_method, error
         """
-        # Try regular scraping first (fast)
-        data = self._scrape_with_requests()
+        with timing.trace('scrape') as self.trace:
+            data = self._scrape()
+        timing.scrape_timings.observe(self.trace, self.domain, self.scrape_method)
+        return data
 
-        # If we got good data, return it
-        if data.get('title') or data.get('price'):
+    def _scrape(self) -> Dict:
+        with self.deadline.phase('cache'):
+            cached = self._cached_result()
+        if cached is not None:
+            return cached
+
+        # Concurrent scrapes of the same URL (in this or another process) share one fetch; only
+        # scrapes asking for the same thing do, so none gets a cached or deadline-cut result it didn't accept
+        flight = normalize_url(self.url) + (' gallery' if self.gallery else '') + ('' if self.use_cache else ' refresh')
+        if self.deadline.seconds is not None:
+            flight += f" deadline={self.deadline.seconds:g}"
+        data = scrape_flights.run(flight, self._scrape_and_store, recheck=self._cached_result,
+                                  timeout=self.deadline.timeout(scrape_flights.timeout))
+        self.scrape_method = data.get('scrape_method', self.scrape_method)
+        return data
+
+    def _cached_result(self) -> Optional[Dict]:
+        """Fresh cached data for the URL, remembering a stale entry for revalidation"""
+        if not self.use_cache:
+            return None
+        entry = scrape_cache.get(self.url)
+        if entry and self.gallery and 'all_images' not in entry['data']:
+            images = self._cached_gallery(entry)
+            if images is None:
+                # The page is gone from the page cache; rescrape it in full (not a 304)
+                return None
+            entry['data']['all_images'] = images
+        if entry and entry['fresh']:
+            logger.info(f"Scrape cache hit for {self.url}")
+            scrape_cache.incr('hits')
+            self.scrape_method = entry['data'].get('scrape_method', 'unknown')
+            data = dict(entry['data'])
+            if not self.gallery:
+                data.pop('all_images', None)
             return data
+        self.cached_entry = entry
+        return None
+
+    def _cached_gallery(self, entry: Dict) -> Optional[List[str]]:
+        """all_images from the page cache, saved into the cache entry; None if the page isn't cached"""
+        page = scrape_cache.get_page(self.url)
+        if page is None:
+            return None
+        with self.deadline.phase('gallery'):
+            content, content_type = page
+            document = self.backend.parse(decode_html(content, content_type))
+            images = SinglePassExtractor(document, self.url, self.backend).all_images()
+        scrape_cache.set_gallery(self.url, entry, images)
+        return images
+
+    def _scrape_and_store(self) -> Dict:
+        data = self._scrape_uncached()
+
+        if data.get('partial'):
+            # Cut short by the deadline; the next scrape should get the whole page
+            pass
+        elif self.use_cache and not data.get('error') and (data.get('title') or data.get('price')):
+            if data.get('revalidated'):
+                data.pop('revalidated')
+                scrape_cache.incr('revalidated')
+                scrape_cache.touch(self.url, self.cached_entry)
+            else:
+                scrape_cache.incr('refreshed' if self.cached_entry else 'misses')
+                scrape_cache.set(self.url, data, **self.validators)
+                if not self.gallery and self.page:
+                    scrape_cache.set_page(self.url, *self.page)
+        elif self.use_cache:
+            scrape_cache.incr('misses')
+        return data
+
+    def _scrape_uncached(self) -> Dict:
+        """Run the scraping tiers without consulting the cache, in the order learned for the domain"""
+        plan = strategy.plan_for(self.domain) if self.adaptive else strategy.ScrapePlan(hedge_after=strategy.hedge_after())
+        self.extraction_order = plan.extraction_order
+        if plan.reason not in ('default', 'requests first'):
+            logger.info(f"Scrape plan for {self.domain}: {plan}")
+
+        data = None
+        attempts = []
+        blocked = []
+        ran = set()
+        try:
+            for tier in plan.tiers:
+                if tier in ran:
+                    # Already run as the hedge of the tier before it
+                    continue
+                if tier == 'playwright':
+                    # Skip browser rendering unless Playwright is available and enabled
+                    if not USE_PLAYWRIGHT:
+                        continue
+                    if data is not None:
+                        logger.info("Regular scraping failed, trying Playwright browser rendering...")
+
+                # Don't start a tier that can't finish in the time left
+                min_seconds = REQUESTS_MIN_SECONDS if tier == 'requests' else PLAYWRIGHT_MIN_SECONDS
+                if not self.deadline.has(min_seconds):
+                    logger.warning(f"Skipping {tier} tier for {self.url}: "
+                                   f"{self.deadline.remaining():.1f}s of the deadline left")
+                    self.deadline.skip(tier, 'deadline')
+                    self.deadline.exceeded = True
+                    continue
+
+                # Fail fast on domains that have been blocking this tier
+                breaker = scrape_breaker if tier == 'requests' else render_breaker
+                if not breaker.allow(self.domain):
+                    logger.warning(f"Skipping {tier} tier for {self.domain}: circuit open")
+                    self.deadline.skip(tier, 'circuit-open')
+                    blocked.append(tier)
+                    continue
 
-        # If Playwright is available and enabled, try browser rendering
-        if USE_PLAYWRIGHT and not (data.get('title') and data.get('price')):
-            logger.info("Regular scraping failed, trying Playwright browser rendering...")
-            browser_data = self._scrape_with_playwright()
-            if browser_data and (browser_data.get('title') or browser_data.get('price')):
-                return browser_data
+                if tier == 'requests' and self._can_hedge(plan):
+                    outcomes = self._race_tiers(plan.hedge_after)
+                else:
+                    outcomes = [self._run_tier(tier)]
+
+                for result, attempt in outcomes:
+                    ran.add(attempt.tier)
+                    if attempt.tier == 'requests':
+                        data = result
+                    # Running out of our own budget says nothing about the domain
+                    if attempt.failure not in ('deadline', 'cancelled'):
+                        attempts.append(attempt)
+
+                    # If we got good data, return it
+                    if attempt.success:
+                        if self.deadline.exceeded:
+                            result['partial'] = True
+                        return result
+        finally:
+            strategy.record(self.domain, plan, attempts)
 
         # Return whatever we have (might be empty)
+        if self.deadline.exceeded:
+            data = data or self._empty_result()
+            data['partial'] = True
+            if not any(data.get(field) for field in PARTIAL_FIELDS):
+                data['error'] = 'Ran out of time before product information could be extracted. Please enter details manually.'
+            return data
+        if data is None and blocked:
+            data = self._empty_result()
+            data['scrape_method'] = 'circuit-open'
+            data['error'] = 'This site is temporarily blocking automated requests. Please enter details manually.'
+            return data
+        data = data or self._empty_result()
         data['error'] = 'Could not extract product information. Please enter details manually.'
         return data
 
+    def _run_tier(self, tier: str) -> Tuple[Optional[Dict], strategy.TierAttempt]:
+        """Run one tier, feed its outcome to the tier's circuit breaker, and return (result, attempt)"""
+        breaker = scrape_breaker if tier == 'requests' else render_breaker
+        started = time.monotonic()
+        self.last_failure = None
+        with self.deadline.phase(tier) as phase:
+            if tier == 'requests':
+                result = self._scrape_with_requests()
+            else:
+                result = self._scrape_with_playwright()
+            if self.deadline.cancelled.is_set():
+                phase['cancelled'] = True
+        breaker.record(self.domain, self.last_failure)
+        success = bool(result) and bool(result.get('title') or result.get('price'))
+        return result, strategy.TierAttempt(
+            tier, success, time.monotonic() - started,
+            scrape_method=result.get('scrape_method') if success else None,
+            failure=None if success else (self.last_failure or 'empty'),
+        )
+
+    def _can_hedge(self, plan: strategy.ScrapePlan) -> bool:
+        return self.hedge and USE_PLAYWRIGHT and plan.hedge_after is not None and 'playwright' in plan.tiers
+
+    def _race_tiers(self, delay: float) -> List[Tuple[Optional[Dict], strategy.TierAttempt]]:
+        """
+        Hedged requests tier: if it hasn't produced a title/price within delay
+        seconds, start Playwright alongside it and keep whichever valid result
+        arrives first. The slower tier is cancelled and counted as a lost
+        attempt, so the adaptive stats learn which tier wins on the domain.
+
+        Returns the (result, attempt) outcomes of both tiers, winner last.
+        """
+        finished = queue.Queue()
+        runners = {}
+
+        def start(tier):
+            # Each tier runs on its own copy so scrape_method/last_failure/validators don't mix
+            runner = copy.copy(self)
+            runner.deadline = self.deadline.branch()
+            runners[tier] = (runner, time.monotonic())
+            context = contextvars.copy_context()  # Keeps the phases in this scrape's timing trace
+            threading.Thread(
+                target=lambda: finished.put((runner, context.run(runner._run_tier, tier))),
+                name=f'hedge-{tier}', daemon=True,
+            ).start()
+
+        hedge_stats.incr('eligible')
+        start('requests')
+        done = []
+        try:
+            done.append(finished.get(timeout=min(delay, self.deadline.remaining())))
+        except queue.Empty:
+            if self.deadline.has(PLAYWRIGHT_MIN_SECONDS) and render_breaker.allow(self.domain):
+                logger.info(f"No result from requests tier for {self.url} after {delay}s; hedging with Playwright")
+                hedge_stats.incr('fired')
+                start('playwright')
+
+        # Wait until one tier succeeds or every started tier has finished
+        while len(done) < len(runners):
+            if done and done[-1][1][1].success:
+                break
+            done.append(finished.get())
+
+        winner = done[-1][0] if done[-1][1][1].success else None
+        lost = []
+        for tier, (runner, started) in runners.items():
+            if any(runner is finished_runner for finished_runner, _ in done):
+                continue
+            runner.deadline.cancel()
+            hedge_stats.incr('cancelled')
+            logger.info(f"{winner.scrape_method} won the race for {self.url}; cancelling {tier} tier")
+            lost.append((None, strategy.TierAttempt(tier, False, time.monotonic() - started, failure='hedge-lost')))
+        if 'playwright' in runners:
+            hedge_stats.incr(f"won_{'requests' if winner is runners['requests'][0] else 'playwright'}"
+                             if winner else 'no_winner')
+
+        # Carry the state of the tier whose result is used back to this scraper
+        for runner, _ in done:
+            self.deadline.exceeded |= runner.deadline.exceeded
+        source = done[-1][0]
+        self.scrape_method = source.scrape_method
+        self.validators = source.validators
+        self.page = source.page
+        self.last_failure = source.last_failure
+        return lost + [outcome for _, outcome in done]
+
+    def _failure_code(self, error: Exception) -> str:
+        """
+        failure_code(error), or 'deadline'/'cancelled' when the call was cut
+        short by our own budget or a won race rather than by the site
+        """
+        if self.deadline.cancelled.is_set():
+            return 'cancelled'
+        if self.deadline.expired:
+            self.deadline.exceeded = True
+            return 'deadline'
+        return failure_code(error)
+
+    def _check_challenge(self, html: str, data: Dict):
+        """Flag an empty result that came from a bot-challenge page as a failure"""
+        if data.get('title') or data.get('price'):
+            return
+        challenge = detect_challenge(html)
+        if challenge:
+            logger.warning(f"Got a {challenge} challenge page from {self.domain}")
+            self.last_failure = f'challenge:{challenge}'
+
+    def _empty_result(self, error: Optional[str] = None) -> Dict:
+        return {
+            'title': None,
+            'price': None,
+            'image_url': None,
+            'description': None,
+            'all_images': [],
+            'scrape_method': 'failed',
+            'error': error
+        }
+
     def _scrape_with_requests(self) -> Dict:
         """
         Standard scraping using requests + BeautifulSoup
         """
         try:
             logger.info(f"Scraping URL with requests: {self.url}")
-            response = requests.get(self.url, headers=self.headers, timeout=15)
+            headers = dict(self.headers)
+            if self.cached_entry:
+                # Revalidate the stale cache entry instead of refetching blindly
+                if self.cached_entry.get('etag'):
+                    headers['If-None-Match'] = self.cached_entry['etag']
+                if self.cached_entry.get('last_modified'):
+                    headers['If-Modified-Since'] = self.cached_entry['last_modified']
+
+            # A bounded deadline (a time limit, or a hedge that may be cancelled) always streams so the read can stop early
+            bounded = self.deadline.bounded
+            with self.deadline.phase('fetch'):
+                response = http_client.get(self.url, headers=headers, timeout=self.deadline.timeout(15),
+                                           stream=self.streaming or bounded)
+            if response.status_code == 304 and self.cached_entry:
+                response.close()
+                logger.info(f"Cached scrape still valid (304 Not Modified): {self.url}")
+                data = dict(self.cached_entry['data'])
+                self.scrape_method = data.get('scrape_method', 'unknown')
+                data['revalidated'] = True
+                return data
             response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'lxml')
-
-            logger.info(f"Got response, status: {response.status_code}, size: {len(response.text)}")
-
-            # Try to extract structured data first (JSON-LD)
-            structured_data = self._get_structured_data(soup)
-            if structured_data and (structured_data.get('title') or structured_data.get('price')):
-                logger.info("Using structured data (JSON-LD)")
-                self.scrape_method = 'json-ld'
-                structured_data['all_images'] = self._get_all_images(soup)
-                structured_data['scrape_method'] = self.scrape_method
-                return structured_data
-
-            # Try site-specific selectors if available
-            if self.site_config:
-                site_data = self._scrape_with_site_config(soup)
-                if site_data and (site_data.get('title') or site_data.get('price')):
-                    logger.info("Using site-specific selectors")
-                    self.scrape_method = 'site-specific'
-                    site_data['scrape_method'] = self.scrape_method
-                    return site_data
-
-            # Fallback to generic HTML scraping
-            logger.info("Using generic HTML parsing")
-            self.scrape_method = 'generic-html'
-            data = {
-                'title': self._get_title(soup),
-                'price': self._get_price(soup),
-                'image_url': self._get_image(soup),
-                'description': self._get_description(soup),
-                'all_images': self._get_all_images(soup),
-                'scrape_method': self.scrape_method
+            self.validators = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
             }
 
+            with self.deadline.phase('read'):
+                if self.streaming and not self.gallery:
+                    # Most product pages put JSON-LD/OpenGraph early; stop reading once we have it. The gallery
+                    # needs every <img>, so gallery scrapes read the whole page
+                    early_data = read_with_early_exit(response, self._early_parser(response), deadline=self.deadline,
+                                                      gallery=False)
+                    if early_data:
+                        # Only part of the page was read; don't keep it for a later gallery request
+                        self.page = None
+                        self.scrape_method = early_data['scrape_method']
+                        logger.info(f"Using early {self.scrape_method} data from partial page")
+                        return early_data
+                    truncated = self.deadline.expired
+                elif self.streaming or bounded:
+                    truncated = read_body(response, self.deadline)
+                else:
+                    truncated = False
+            if self.deadline.cancelled.is_set():
+                # Lost a hedged race; the other tier's result is being used
+                self.last_failure = 'cancelled'
+                return self._empty_result('cancelled')
+            if truncated:
+                # Out of time mid-body: extract what arrived rather than nothing
+                logger.warning(f"Deadline reached while reading {self.url}; extracting from partial page")
+                self.deadline.exceeded = True
+
+            # Decode once, honouring the declared charset
+            with timing.phase('decode'):
+                html = decode_html(response.content, response.headers.get('Content-Type', ''))
+            self.page = (response.content, response.headers.get('Content-Type', ''))
+            logger.info(f"Got response, status: {response.status_code}, size: {len(html)}")
+
+            with self.deadline.phase('extract'):
+                data = self.extract(html)
             logger.info(f"Scraped data: title={'Yes' if data.get('title') else 'No'}, price={'Yes' if data.get('price') else 'No'}")
+            self._check_challenge(html, data)
             return data
 
         except Exception as e:
             logger.error(f"Error scraping {self.url}: {str(e)}")
-            return {
-                'title': None,
-                'price': None,
-                'image_url': None,
-                'description': None,
-                'all_images': [],
-                'scrape_method': 'failed',
-                'error': str(e)
-            }
+            self.last_failure = self._failure_code(e)
+            return self._empty_result(str(e))
 
-    def _scrape_with_playwright(self) -> Optional[Dict]:
+    def extract(self, html: str, method_prefix: str = '') -> Dict:
         """
-        Scrape using Playwright for JavaScript-heavy sites
-        This is slower but handles dynamic content
+        Extract product data from page HTML: JSON-LD first, then site-specific
+        selectors, then generic selectors (the first two swap on domains where
+        site selectors are what usually works). Sets scrape_method (with
+        method_prefix, e.g. 'playwright-') to the tier that produced the data.
         """
-        try:
-            logger.info(f"Attempting Playwright scraping for {self.url}")
+        log_prefix = 'Playwright: ' if method_prefix else ''
+        with timing.phase('parse'):
+            document = self.backend.parse(html)
+
+        # Collect candidates for every field in a single pass over the page
+        with timing.phase('collect'):
+            extractor = SinglePassExtractor(document, self.url, self.backend)
+
+        for step in self.extraction_order:
+            if step == 'json-ld':
+                # Try to extract structured data (JSON-LD)
+                with timing.phase('json-ld'):
+                    structured_data = extractor.structured_data()
+                if structured_data and (structured_data.get('title') or structured_data.get('price')):
+                    logger.info(f"{log_prefix}Using structured data (JSON-LD)")
+                    self.scrape_method = f'{method_prefix}json-ld'
+                    if self.gallery:
+                        structured_data['all_images'] = extractor.all_images()
+                    structured_data['scrape_method'] = self.scrape_method
+                    return structured_data
 
-            with sync_playwright() as p:
-                try:
-                    browser = p.chromium.launch(
-                        headless=True,
-                        args=['--no-sandbox', '--disable-setuid-sandbox']  # Required for some environments
-                    )
-                except Exception as launch_error:
-                    logger.error(f"Failed to launch Playwright browser: {launch_error}")
-                    logger.info("Consider running: python -m playwright install chromium")
-                    return None
+            elif step == 'site-specific' and self.site_config:
+                # Try site-specific selectors if available
+                with timing.phase('site-specific'):
+                    site_data = self._scrape_with_site_config(document, extractor)
+                if site_data and (site_data.get('title') or site_data.get('price')):
+                    logger.info(f"{log_prefix}Using site-specific selectors")
+                    self.scrape_method = f'{method_prefix}site-specific'
+                    site_data['scrape_method'] = self.scrape_method
+                    return site_data
 
-                try:
-                    # Create context with realistic settings
-                    context = browser.new_context(
-                        user_agent=self.headers['User-Agent'],
-                        viewport={'width': 1920, 'height': 1080},
-                        locale='en-US',
-                    )
-
-                    page = context.new_page()
-
-                    # Block unnecessary resources to speed up loading
-                    def handle_route(route):
-                        try:
-                            route.abort()
-                        except:
-                            pass
+        # Fallback to generic HTML scraping
+        logger.info(f"{log_prefix}Using generic HTML parsing")
+        self.scrape_method = f'{method_prefix}generic' if method_prefix else 'generic-html'
+        with timing.phase('generic'):
+            data = extractor.generic(gallery=self.gallery)
+        data['scrape_method'] = self.scrape_method
+        return data
 
-                    try:
-                        page.route("**/*.{png,jpg,jpeg,gif,svg,webp,woff,woff2,ttf,eot}", handle_route)
-                    except:
-                        pass  # Route blocking not critical
+    def _early_parser(self, response) -> EarlyParser:
+        """Incremental parser for the streamed body, using the declared charset if any"""
+        match = re.search(r'charset=["\']?([\w-]+)', response.headers.get('Content-Type', ''), re.I)
+        # Bare meta tags would skip SITE_CONFIGS selectors, so only JSON-LD can end early there,
+        # and not even that once the domain has learned to try its site selectors first
+        allow_meta = not self.site_config
+        order = list(self.extraction_order)
+        allow_json_ld = not (self.site_config and 'site-specific' in order
+                             and order.index('site-specific') < order.index('json-ld'))
+        if match:
+            try:
+                return EarlyParser(self.url, allow_meta=allow_meta, allow_json_ld=allow_json_ld,
+                                   encoding=match.group(1))
+            except LookupError:
+                pass
+        return EarlyParser(self.url, allow_meta=allow_meta, allow_json_ld=allow_json_ld)
 
-                    # Navigate and wait for network to be idle
-                    page.goto(self.url, wait_until='networkidle', timeout=30000)
+    def _scrape_with_playwright(self) -> Optional[Dict]:
+        """
+        Scrape using Playwright for JavaScript-heavy sites
+        This is slower but handles dynamic content
 
-                    # Get the rendered HTML
-                    html = page.content()
+        In fast-render mode, analytics/ads/styles/media are blocked, navigation
+        stops at DOMContentLoaded plus the product markup instead of network
+        idle, and the page is pruned in the browser to the parts the extractor
+        reads before it is sent back.
+        """
+        try:
+            logger.info(f"Attempting {'fast ' if self.fast_render else ''}Playwright scraping for {self.url}")
+            timed_out = []
+            selectors = selectors_for(self.site_config)
 
-                finally:
+            def render(page):
+                # Block unnecessary resources to speed up loading
+                def handle_route(route):
                     try:
-                        browser.close()
+                        route.abort()
                     except:
                         pass
 
-                # Parse with BeautifulSoup
-                soup = BeautifulSoup(html, 'lxml')
-
-                # Try structured data first
-                structured_data = self._get_structured_data(soup)
-                if structured_data and (structured_data.get('title') or structured_data.get('price')):
-                    logger.info("Playwright: Found structured data")
-                    self.scrape_method = 'playwright-json-ld'
-                    structured_data['all_images'] = self._get_all_images(soup)
-                    structured_data['scrape_method'] = self.scrape_method
-                    return structured_data
-
-                # Try site-specific selectors
-                if self.site_config:
-                    site_data = self._scrape_with_site_config(soup)
-                    if site_data and (site_data.get('title') or site_data.get('price')):
-                        logger.info("Playwright: Using site-specific selectors")
-                        self.scrape_method = 'playwright-site-specific'
-                        site_data['scrape_method'] = self.scrape_method
-                        return site_data
-
-                # Generic fallback
-                logger.info("Playwright: Using generic parsing")
-                self.scrape_method = 'playwright-generic'
-                data = {
-                    'title': self._get_title(soup),
-                    'price': self._get_price(soup),
-                    'image_url': self._get_image(soup),
-                    'description': self._get_description(soup),
-                    'all_images': self._get_all_images(soup),
-                    'scrape_method': self.scrape_method
-                }
-
-                return data
+                try:
+                    if self.fast_render:
+                        page.route("**/*", route_handler(self.url))
+                    else:
+                        page.route(FULL_RENDER_BLOCK_PATTERN, handle_route)
+                except:
+                    pass  # Route blocking not critical
+
+                # Navigate, within the time left
+                try:
+                    with self.deadline.phase('render-navigate'):
+                        if self.fast_render:
+                            page.goto(self.url, wait_until='domcontentloaded', timeout=self.deadline.timeout(30) * 1000)
+                        else:
+                            page.goto(self.url, wait_until='networkidle', timeout=self.deadline.timeout(30) * 1000)
+                    if self.fast_render:
+                        with self.deadline.phase('render-wait'):
+                            wait_for_product(page, selectors, self.deadline.timeout(FAST_RENDER_WAIT))
+                except Exception as e:
+                    if type(e).__name__ != 'TimeoutError' or self.deadline.seconds is None:
+                        raise
+                    # Out of time: keep whatever has rendered so far
+                    timed_out.append(True)
+
+                # Get the rendered HTML
+                with self.deadline.phase('render-serialize'):
+                    if self.fast_render:
+                        return product_html(page, selectors)
+                    return page.content()
+
+            # Render in a warm browser from the shared pool
+            html = browser_pool.render(self.url, self.domain, render, user_agent=self.headers['User-Agent'],
+                                       timeout=self.deadline.timeout(BROWSER_QUEUE_TIMEOUT),
+                                       cancel=self.deadline.cancelled,
+                                       mode='fast' if self.fast_render else 'full')
+            self.page = (html.encode('utf-8'), 'text/html; charset=utf-8')
+            if timed_out:
+                logger.warning(f"Deadline reached while rendering {self.url}; extracting from partial page")
+                self.deadline.exceeded = True
+
+            with self.deadline.phase('extract'):
+                data = self.extract(html, method_prefix='playwright-')
+            self._check_challenge(html, data)
+            return data
 
         except Exception as e:
             logger.error(f"Playwright scraping failed: {str(e)}")
+            self.last_failure = self._failure_code(e)
             logger.info("Falling back to manual entry")
             return None
 
-    def _scrape_with_site_config(self, soup: BeautifulSoup) -> Optional[Dict]:
-        """Use site-specific selectors to extract data"""
+    def _scrape_with_site_config(self, document, extractor: Optional[SinglePassExtractor] = None) -> Optional[Dict]:
+        """Use site-specific selectors (precompiled for the backend) to extract data"""
         if not self.site_config:
             return None
+        if extractor is None:
+            extractor = SinglePassExtractor(document, self.url, self.backend)
+        selectors = COMPILED_SITE_SELECTORS[self.backend.name][self.site_key]
+        backend = self.backend
 
         data = {
             'title': None,
             'price': None,
             'image_url': None,
             'description': None,
-            'all_images': []
         }
 
         # Try title selectors
-        for selector in self.site_config.get('title_selectors', []):
+        for selector in selectors['title_selectors']:
             try:
-                element = soup.select_one(selector)
-                if element and element.text.strip():
-                    data['title'] = element.text.strip()
+                element = backend.select_one(document, selector)
+                if element is not None and backend.text(element).strip():
+                    data['title'] = backend.text(element).strip()
                     break
             except:
                 continue
 
         # Try price selectors
-        for selector in self.site_config.get('price_selectors', []):
+        for selector in selectors['price_selectors']:
             try:
-                element = soup.select_one(selector)
-                if element:
-                    price_text = element.text.strip()
-                    price = self._extract_price_from_text(price_text)
+                element = backend.select_one(document, selector)
+                if element is not None:
+                    price_text = backend.text(element).strip()
+                    price = extract_price_from_text(price_text)
                     if price:
                         data['price'] = price
                         break
@@ -315,10 +882,10 @@ class ProductScraper:
                 continue
 
         # Try image selectors
-        for selector in self.site_config.get('image_selectors', []):
+        for selector in selectors['image_selectors']:
             try:
-                element = soup.select_one(selector)
-                if element:
+                element = backend.select_one(document, selector)
+                if element is not None:
                     url = element.get('src') or element.get('data-src')
                     if url and not url.startswith('data:'):
                         data['image_url'] = urljoin(self.url, url)
@@ -327,191 +894,8 @@ class ProductScraper:
                 continue
 
         # Get description using generic method
-        data['description'] = self._get_description(soup)
-        data['all_images'] = self._get_all_images(soup)
+        data['description'] = extractor.description()
+        if self.gallery:
+            data['all_images'] = extractor.all_images()
 
         return data if (data['title'] or data['price']) else None
-
-    def _get_structured_data(self, soup: BeautifulSoup) -> Optional[Dict]:
-        """Extract product info from JSON-LD structured data if available"""
-        for script in soup.find_all('script', type='application/ld+json'):
-            try:
-                data = json.loads(script.string)
-                if isinstance(data, list):
-                    data = data[0]
-
-                if data.get('@type') in ['Product', 'IndividualProduct']:
-                    price = None
-                    if 'offers' in data:
-                        offers = data['offers']
-                        if isinstance(offers, list):
-                            offers = offers[0]
-                        price = offers.get('price')
-
-                    return {
-                        'title': data.get('name'),
-                        'price': float(price) if price else None,
-                        'image_url': data.get('image'),
-                        'description': data.get('description')
-                    }
-            except:
-                continue
-        return None
-
-    def _get_title(self, soup: BeautifulSoup) -> Optional[str]:
-        """Get product title using various selectors"""
-        selectors = [
-            # Common meta tags
-            ('meta', {'property': 'og:title'}),
-            ('meta', {'name': 'twitter:title'}),
-
-            # Common title elements
-            ('h1', {'class': re.compile(r'product.*title|title|name', re.I)}),
-            ('h1', {'id': re.compile(r'product.*title|title|name', re.I)}),
-            ('span', {'id': 'productTitle'}),    # Amazon
-            ('h1', {'itemprop': 'name'}),       # Schema.org
-            ('h1', {}),  # Any h1 as last resort
-        ]
-
-        for tag, attrs in selectors:
-            element = soup.find(tag, attrs)
-            if element:
-                if tag == 'meta':
-                    return element.get('content')
-                text = element.text.strip()
-                if text:
-                    return text
-        return None
-
-    def _extract_price_from_text(self, text: str) -> Optional[float]:
-        """Extract price from text using various patterns"""
-        price_patterns = [
-            r'\$\s*(\d+(?:,\d{3})*(?:\.\d{2})?)',  # $299.00 or $1,299.00
-            r'(\d+(?:,\d{3})*(?:\.\d{2})?)\s*(?:dollars?|USD)',
-            r'Price:\s*\$?\s*(\d+(?:,\d{3})*(?:\.\d{2})?)',
-            r'(?:^|\s)(\d+(?:,\d{3})*\.\d{2})(?:\s|$)',  # Just the number with cents
-        ]
-
-        for pattern in price_patterns:
-            match = re.search(pattern, text)
-            if match:
-                try:
-                    price_str = match.group(1).replace(',', '')
-                    return float(price_str)
-                except (ValueError, IndexError):
-                    continue
-        return None
-
-    def _get_price(self, soup: BeautifulSoup) -> Optional[float]:
-        """Get product price using various selectors"""
-        # Enhanced meta tag selectors
-        meta_selectors = [
-            ('meta', {'property': 'product:price:amount'}),
-            ('meta', {'property': 'og:price:amount'}),
-            ('meta', {'name': 'price'}),
-            ('meta', {'itemprop': 'price'}),
-            ('meta', {'name': 'product:price:amount'}),
-        ]
-
-        # Try meta tags first
-        for tag, attrs in meta_selectors:
-            element = soup.find(tag, attrs)
-            if element:
-                content = element.get('content', '')
-                try:
-                    # Clean and convert
-                    price_str = content.replace(',', '').replace('$', '').strip()
-                    return float(price_str)
-                except ValueError:
-                    continue
-
-        # HTML element selectors
-        selectors = [
-            ('span', {'class': re.compile(r'.*price.*', re.I)}),
-            ('div', {'class': re.compile(r'.*price.*', re.I)}),
-            ('span', {'itemprop': 'price'}),
-            ('p', {'class': re.compile(r'.*price.*', re.I)}),
-        ]
-
-        # Try HTML elements
-        for tag, attrs in selectors:
-            elements = soup.find_all(tag, attrs)
-            for element in elements:
-                price_text = ' '.join(element.stripped_strings)
-                price = self._extract_price_from_text(price_text)
-                if price:
-                    return price
-
-        return None
-
-    def _get_image(self, soup: BeautifulSoup) -> Optional[str]:
-        """Get product image URL using various selectors"""
-        selectors = [
-            ('meta', {'property': 'og:image'}),
-            ('meta', {'property': 'product:image'}),
-            ('meta', {'name': 'twitter:image'}),
-            ('img', {'class': re.compile(r'product.*image|main.*image', re.I)}),
-            ('img', {'id': re.compile(r'product.*image|main.*image', re.I)}),
-        ]
-
-        for tag, attrs in selectors:
-            element = soup.find(tag, attrs)
-            if element:
-                if tag == 'meta':
-                    url = element.get('content')
-                else:
-                    url = element.get('src') or element.get('data-src')
-
-                if url and not url.startswith('data:'):
-                    return urljoin(self.url, url)
-        return None
-
-    def _get_description(self, soup: BeautifulSoup) -> Optional[str]:
-        """Get product description using various selectors"""
-        selectors = [
-            ('meta', {'property': 'og:description'}),
-            ('meta', {'name': 'description'}),
-            ('div', {'class': re.compile(r'.*description.*', re.I)}),
-            ('div', {'id': re.compile(r'.*description.*', re.I)}),
-        ]
-
-        for tag, attrs in selectors:
-            element = soup.find(tag, attrs)
-            if element:
-                if tag == 'meta':
-                    return element.get('content', '').strip()
-                text = element.text.strip()
-                if text and len(text) > 20:  # Avoid short/empty descriptions
-                    return text[:500]  # Limit length
-        return None
-
-    def _get_all_images(self, soup: BeautifulSoup) -> List[str]:
-        """Get all product images from the page"""
-        images = set()
-
-        # Look for product images
-        for img in soup.find_all('img'):
-            src = img.get('src') or img.get('data-src')
-            if src and not src.startswith('data:'):
-                full_url = urljoin(self.url, src)
-                # Filter out tiny images (likely icons)
-                if 'icon' not in full_url.lower() and 'logo' not in full_url.lower():
-                    images.add(full_url)
-
-        # Also check JSON-LD for images
-        for script in soup.find_all('script', type='application/ld+json'):
-            try:
-                data = json.loads(script.string)
-                if isinstance(data, list):
-                    data = data[0]
-                if 'image' in data:
-                    if isinstance(data['image'], str):
-                        images.add(urljoin(self.url, data['image']))
-                    elif isinstance(data['image'], list):
-                        for img in data['image']:
-                            if isinstance(img, str):
-                                images.add(urljoin(self.url, img))
-            except:
-                continue
-
-        return list(images)[:20]  # Limit to 20 images
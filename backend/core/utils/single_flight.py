@@ -0,0 +1,153 @@
+import copy
+import hashlib
+import os
+import threading
+import time
+import logging
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# fcntl is POSIX-only; without it coalescing is limited to one process
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+SCRAPE_COALESCE_TIMEOUT = float(os.getenv('SCRAPE_COALESCE_TIMEOUT', '60'))  # Max seconds to wait on another scrape
+SCRAPE_LOCK_SLOTS = int(os.getenv('SCRAPE_LOCK_SLOTS', '1024'))  # Lock files shared by all URLs
+LOCK_POLL_INTERVAL = 0.05
+
+
+class _Call:
+    """One in-flight scrape that other threads can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key so only one of them runs.
+
+    Within a process, callers for a key that is already running wait for it
+    and get a copy of its result. Across processes on the same host, the
+    running call holds an flock on one slot of a fixed table of lock files;
+    a process that finds the slot taken waits for it and then asks `recheck`
+    (e.g. the scrape cache) for the result before running the call itself.
+    """
+
+    def __init__(self, slots: int = SCRAPE_LOCK_SLOTS, timeout: float = SCRAPE_COALESCE_TIMEOUT):
+        self.slots = slots
+        self.timeout = timeout
+        self.calls: Dict[str, _Call] = {}
+        self.lock = threading.Lock()
+        self.counters = {
+            'leaders': 0,
+            'coalesced': 0,
+            'process_waits': 0,
+            'process_shared': 0,
+            'timeouts': 0,
+        }
+
+    def _incr(self, name: str):
+        with self.lock:
+            self.counters[name] += 1
+
+    def lock_path(self, key: str) -> str:
+        lock_dir = settings.SCRAPER_LOCK_DIR
+        os.makedirs(lock_dir, exist_ok=True)
+        slot = int(hashlib.sha1(key.encode('utf-8')).hexdigest()[:8], 16) % self.slots
+        return os.path.join(lock_dir, f"slot-{slot:04d}.lock")
+
+    def run(self, key: str, fn: Callable, recheck: Optional[Callable] = None, timeout: Optional[float] = None):
+        """
+        Return fn(), or the result of an identical call already in flight.
+        timeout caps the wait on another call (default self.timeout).
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+
+        if not leader:
+            self._incr('coalesced')
+            logger.info(f"Waiting on in-flight scrape of {key}")
+            if call.done.wait(timeout):
+                if call.error:
+                    raise call.error
+                return copy.deepcopy(call.result)
+            self._incr('timeouts')
+            logger.warning(f"Timed out after {timeout:.1f}s waiting on {key}; scraping it again")
+            return fn()
+
+        self._incr('leaders')
+        try:
+            call.result = self._run_locked(key, fn, recheck, timeout)
+            return copy.deepcopy(call.result)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
+            call.done.set()
+
+    def _run_locked(self, key: str, fn: Callable, recheck: Optional[Callable], timeout: float):
+        if not FCNTL_AVAILABLE:
+            return fn()
+        try:
+            fd = os.open(self.lock_path(key), os.O_CREAT | os.O_RDWR, 0o644)
+        except OSError as e:
+            logger.warning(f"Could not open scrape lock for {key}: {e}")
+            return fn()
+
+        locked = False
+        try:
+            locked = self._try_lock(fd)
+            if not locked:
+                # Another process is scraping a URL in this slot; wait for it
+                self._incr('process_waits')
+                deadline = time.monotonic() + timeout
+                while not locked and time.monotonic() < deadline:
+                    time.sleep(LOCK_POLL_INTERVAL)
+                    locked = self._try_lock(fd)
+                if not locked:
+                    self._incr('timeouts')
+                    logger.warning(f"Timed out after {timeout:.1f}s waiting on scrape lock for {key}")
+                if recheck:
+                    result = recheck()
+                    if result is not None:
+                        self._incr('process_shared')
+                        return result
+            return fn()
+        finally:
+            if locked:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    @staticmethod
+    def _try_lock(fd: int) -> bool:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def stats(self) -> Dict:
+        """Coalescing counters for this process"""
+        with self.lock:
+            stats = dict(self.counters)
+            stats['in_flight'] = len(self.calls)
+        stats['cross_process'] = FCNTL_AVAILABLE
+        return stats
+
+
+scrape_flights = SingleFlight()
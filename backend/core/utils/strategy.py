@@ -0,0 +1,206 @@
+import os
+import logging
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import ScrapeDomainStats
+
+logger = logging.getLogger(__name__)
+
+# Adaptive tier selection settings
+SCRAPER_ADAPTIVE = os.getenv('SCRAPER_ADAPTIVE', 'true').lower() == 'true'
+ADAPTIVE_MIN_ATTEMPTS = int(os.getenv('ADAPTIVE_MIN_ATTEMPTS', '3'))  # Tier attempts before stats are trusted
+ADAPTIVE_BROWSER_FIRST_BELOW = float(os.getenv('ADAPTIVE_BROWSER_FIRST_BELOW', '0.2'))  # Requests success rate floor
+ADAPTIVE_PROBE_EVERY = int(os.getenv('ADAPTIVE_PROBE_EVERY', '20'))  # Browser-first scrapes between requests probes
+ADAPTIVE_PROBE_INTERVAL = int(os.getenv('ADAPTIVE_PROBE_INTERVAL', str(6 * 3600)))  # Max seconds between probes
+EWMA_ALPHA = 0.2  # Weight of the newest outcome in success rates and latencies
+
+# Hedged scraping: start Playwright alongside a requests tier that is taking too long
+SCRAPE_HEDGE = os.getenv('SCRAPE_HEDGE', 'true').lower() == 'true'
+SCRAPE_HEDGE_DELAY = float(os.getenv('SCRAPE_HEDGE_DELAY', '3'))  # Seconds before the hedge fires
+HEDGE_RELIABLE_RATE = 0.9  # Requests success rate at which a fast domain isn't hedged
+
+TIERS = ('requests', 'playwright')
+EXTRACTION_ORDER = ('json-ld', 'site-specific', 'generic')
+
+
+def domain_key(netloc: str) -> str:
+    host = netloc.lower().split(':')[0]
+    return host[4:] if host.startswith('www.') else host
+
+
+def base_method(scrape_method: str) -> str:
+    """The extraction strategy behind a scrape_method, without the tier prefix"""
+    method = (scrape_method or '').replace('playwright-', '')
+    return 'generic' if method in ('generic-html', 'meta-tags') else method
+
+
+class TierAttempt:
+    def __init__(self, tier: str, success: bool, seconds: float, scrape_method: Optional[str] = None,
+                 failure: Optional[str] = None):
+        self.tier = tier
+        self.success = success
+        self.seconds = seconds
+        self.scrape_method = scrape_method
+        self.failure = failure
+
+
+class ScrapePlan:
+    """Tier order and extraction order for one scrape, and when to hedge the requests tier"""
+
+    def __init__(self, tiers: Tuple[str, ...] = TIERS, extraction_order: Tuple[str, ...] = EXTRACTION_ORDER,
+                 probe: bool = False, reason: str = 'default', hedge_after: Optional[float] = None):
+        self.tiers = tiers
+        self.extraction_order = extraction_order
+        self.probe = probe
+        self.reason = reason
+        self.hedge_after = hedge_after  # Seconds before Playwright races the requests tier; None to not hedge
+
+    def __repr__(self):
+        return (f"ScrapePlan(tiers={self.tiers}, extraction={self.extraction_order}, "
+                f"hedge_after={self.hedge_after}, reason={self.reason!r})")
+
+
+def _expected_ms(first_latency, first_rate, second_latency) -> float:
+    """Expected time to a result when trying `first`, then falling back to `second`"""
+    return first_latency + (1 - first_rate) * second_latency
+
+
+def preferred_tier(stats) -> Tuple[str, str]:
+    """Pick the starting tier from learned stats; returns (tier, reason)"""
+    if stats.requests_attempts < ADAPTIVE_MIN_ATTEMPTS or stats.playwright_attempts < 1:
+        return 'requests', 'not enough data'
+    if stats.requests_latency_ms is None or stats.playwright_latency_ms is None:
+        return 'requests', 'not enough data'
+    if stats.requests_success_rate < ADAPTIVE_BROWSER_FIRST_BELOW and stats.playwright_success_rate >= 0.5:
+        return 'playwright', f"requests tier succeeds {stats.requests_success_rate:.0%} of the time"
+    requests_first = _expected_ms(stats.requests_latency_ms, stats.requests_success_rate, stats.playwright_latency_ms)
+    browser_first = _expected_ms(stats.playwright_latency_ms, stats.playwright_success_rate, stats.requests_latency_ms)
+    if browser_first < requests_first:
+        return 'playwright', f"expected {browser_first:.0f} ms vs {requests_first:.0f} ms requests-first"
+    return 'requests', f"expected {requests_first:.0f} ms vs {browser_first:.0f} ms browser-first"
+
+
+def hedge_after(stats=None) -> Optional[float]:
+    """
+    Seconds to give the requests tier before racing Playwright against it,
+    or None. Domains whose requests tier is known to be fast and reliable
+    aren't hedged; new, slow and flaky ones are.
+    """
+    if not SCRAPE_HEDGE:
+        return None
+    if stats is not None and stats.requests_attempts >= ADAPTIVE_MIN_ATTEMPTS and stats.requests_latency_ms is not None:
+        if stats.requests_success_rate >= HEDGE_RELIABLE_RATE and stats.requests_latency_ms < SCRAPE_HEDGE_DELAY * 500:
+            return None
+    return SCRAPE_HEDGE_DELAY
+
+
+def extraction_order(stats) -> Tuple[str, ...]:
+    """Try site selectors before JSON-LD on domains where they're what usually works"""
+    counts: Dict[str, int] = {}
+    for method, count in (stats.method_counts or {}).items():
+        method = base_method(method)
+        counts[method] = counts.get(method, 0) + count
+    if counts.get('site-specific', 0) > counts.get('json-ld', 0):
+        return ('site-specific', 'json-ld', 'generic')
+    return EXTRACTION_ORDER
+
+
+def plan_for(netloc: str) -> ScrapePlan:
+    """Plan a scrape of a domain from its stats; the default plan if there are none"""
+    if not SCRAPER_ADAPTIVE:
+        return ScrapePlan(hedge_after=hedge_after())
+    try:
+        stats = ScrapeDomainStats.objects.filter(domain=domain_key(netloc)).first()
+    except Exception as e:
+        logger.debug(f"Could not load scrape stats for {netloc}: {e}")
+        return ScrapePlan(hedge_after=hedge_after())
+    if stats is None:
+        return ScrapePlan(hedge_after=hedge_after())
+
+    order = extraction_order(stats)
+    if stats.preferred_tier != 'playwright':
+        return ScrapePlan(extraction_order=order, reason='requests first', hedge_after=hedge_after(stats))
+
+    # Browser-first domains still get an occasional requests-first scrape so a fixed site is noticed
+    probe_due = stats.scrapes_since_probe >= ADAPTIVE_PROBE_EVERY or (
+        stats.last_probe_at is None
+        or timezone.now() - stats.last_probe_at > timedelta(seconds=ADAPTIVE_PROBE_INTERVAL)
+    )
+    if probe_due:
+        return ScrapePlan(extraction_order=order, probe=True, reason='probing requests tier',
+                          hedge_after=hedge_after(stats))
+    return ScrapePlan(tiers=('playwright', 'requests'), extraction_order=order, reason='browser first')
+
+
+def _ewma(old: Optional[float], new: float) -> float:
+    return new if old is None else old * (1 - EWMA_ALPHA) + new * EWMA_ALPHA
+
+
+def record(netloc: str, plan: ScrapePlan, attempts: List[TierAttempt]):
+    """Fold the tier attempts of one scrape into the domain's stats"""
+    if not SCRAPER_ADAPTIVE or not attempts:
+        return
+    domain = domain_key(netloc)
+    try:
+        with transaction.atomic():
+            stats, _ = ScrapeDomainStats.objects.select_for_update().get_or_create(domain=domain)
+            for attempt in attempts:
+                prefix = attempt.tier
+                setattr(stats, f'{prefix}_attempts', getattr(stats, f'{prefix}_attempts') + 1)
+                setattr(stats, f'{prefix}_success_rate',
+                        _ewma(getattr(stats, f'{prefix}_success_rate'), 1.0 if attempt.success else 0.0))
+                setattr(stats, f'{prefix}_latency_ms',
+                        _ewma(getattr(stats, f'{prefix}_latency_ms'), attempt.seconds * 1000))
+                if attempt.success:
+                    setattr(stats, f'{prefix}_successes', getattr(stats, f'{prefix}_successes') + 1)
+                    if attempt.scrape_method:
+                        stats.method_counts[attempt.scrape_method] = stats.method_counts.get(attempt.scrape_method, 0) + 1
+                elif attempt.failure:
+                    stats.failure_codes[attempt.failure] = stats.failure_codes.get(attempt.failure, 0) + 1
+
+            if plan.probe:
+                stats.scrapes_since_probe = 0
+                stats.last_probe_at = timezone.now()
+            elif stats.preferred_tier == 'playwright':
+                stats.scrapes_since_probe += 1
+
+            tier, reason = preferred_tier(stats)
+            if tier != stats.preferred_tier:
+                logger.info(f"Scraping {domain} {tier} first from now on ({reason})")
+                stats.preferred_tier = tier
+                stats.scrapes_since_probe = 0
+                if tier == 'playwright':
+                    stats.last_probe_at = timezone.now()
+            stats.save()
+    except Exception as e:
+        logger.debug(f"Could not record scrape stats for {domain}: {e}")
+
+
+def domain_summary(limit: int = 50) -> List[Dict]:
+    """Most recently updated domain stats, for the scraper stats endpoint"""
+    try:
+        rows = ScrapeDomainStats.objects.order_by('-updated_at')[:limit]
+        return [{
+            'domain': stats.domain,
+            'preferred_tier': stats.preferred_tier,
+            'requests': {
+                'attempts': stats.requests_attempts,
+                'success_rate': round(stats.requests_success_rate, 3),
+                'latency_ms': round(stats.requests_latency_ms, 1) if stats.requests_latency_ms is not None else None,
+            },
+            'playwright': {
+                'attempts': stats.playwright_attempts,
+                'success_rate': round(stats.playwright_success_rate, 3),
+                'latency_ms': round(stats.playwright_latency_ms, 1) if stats.playwright_latency_ms is not None else None,
+            },
+            'methods': stats.method_counts,
+            'failures': stats.failure_codes,
+            'extraction_order': list(extraction_order(stats)),
+        } for stats in rows]
+    except Exception as e:
+        logger.debug(f"Could not load scrape domain stats: {e}")
+        return []
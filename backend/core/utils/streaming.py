@@ -0,0 +1,255 @@
+import json
+import os
+import socket
+import logging
+from typing import Dict, List, Optional
+from urllib.parse import urljoin
+
+from lxml import etree
+from urllib3.exceptions import ReadTimeoutError
+
+from .extraction import parse_structured_product
+
+logger = logging.getLogger(__name__)
+
+# Streaming fetch settings
+STREAM_CHUNK_SIZE = 16 * 1024
+EARLY_PARSE_MAX_BYTES = int(os.getenv('SCRAPER_EARLY_MAX_BYTES', str(512 * 1024)))  # Give up on early exit past this
+
+# Meta tags read by the early pass, highest priority first (same order as SinglePassExtractor)
+META_FIELDS = {
+    'title': ['og:title', 'twitter:title'],
+    'price': ['product:price:amount', 'og:price:amount', 'price'],
+    'image_url': ['og:image', 'product:image', 'twitter:image'],
+    'description': ['og:description', 'description'],
+}
+
+
+class EarlyParser:
+    """
+    Incremental lxml parse of the first part of a product page.
+
+    Chunks are fed to an HTMLPullParser and only meta tags, JSON-LD blocks and
+    images are looked at as their elements close. The parser reports complete
+    as soon as it has seen a Product JSON-LD block or, when allowed, meta tags
+    for every field (title, price, image and description); a page missing any
+    of them is left to the full parse, which also looks in the body.
+    """
+
+    def __init__(self, base_url: str, allow_meta: bool = True, allow_json_ld: bool = True,
+                 encoding: Optional[str] = None):
+        self.base_url = base_url
+        self.allow_meta = allow_meta  # Sites with SITE_CONFIGS prefer their selectors over bare meta tags
+        self.allow_json_ld = allow_json_ld  # False where the learned extraction order puts site selectors first
+        self.parser = etree.HTMLPullParser(events=('end',), encoding=encoding)
+        self.bytes_fed = 0
+        self.meta: Dict[str, str] = {}
+        self.product: Optional[Dict] = None
+        self.json_ld: List = []
+        self.images: List[str] = []
+        self.title_text: Optional[str] = None
+        self.head_closed = False
+
+    def feed(self, chunk: bytes) -> bool:
+        """Feed the next chunk; returns True once enough has been seen to stop"""
+        self.bytes_fed += len(chunk)
+        self.parser.feed(chunk)
+        for _, element in self.parser.read_events():
+            self._handle(element)
+        return self.complete
+
+    def _handle(self, element):
+        tag = element.tag
+        if not isinstance(tag, str):
+            return
+        tag = tag.lower()
+        if tag == 'meta':
+            key = element.get('property') or element.get('name') or element.get('itemprop')
+            content = element.get('content')
+            if key and content is not None:
+                self.meta.setdefault(key.lower(), content)
+        elif tag == 'script' and element.get('type') == 'application/ld+json':
+            try:
+                data = json.loads(element.text)
+            except Exception:
+                return
+            self.json_ld.append(data)
+            if self.product is None:
+                try:
+                    product = parse_structured_product(data)
+                except Exception:
+                    product = None
+                if product and (product.get('title') or product.get('price')):
+                    self.product = product
+        elif tag == 'img':
+            src = element.get('src') or element.get('data-src')
+            if src and not src.startswith('data:'):
+                self.images.append(urljoin(self.base_url, src))
+        elif tag == 'title' and self.title_text is None:
+            self.title_text = (element.text or '').strip() or None
+        elif tag == 'head':
+            self.head_closed = True
+
+    def _meta_value(self, field: str) -> Optional[str]:
+        for key in META_FIELDS[field]:
+            if self.meta.get(key):
+                return self.meta[key]
+        return None
+
+    def meta_price(self) -> Optional[float]:
+        for key in META_FIELDS['price']:
+            try:
+                return float(self.meta.get(key, '').replace(',', '').replace('$', '').strip())
+            except ValueError:
+                continue
+        return None
+
+    @property
+    def has_meta_fields(self) -> bool:
+        return (bool(self._meta_value('title')) and self.meta_price() is not None
+                and bool(self._meta_value('image_url')) and bool(self._meta_value('description')))
+
+    @property
+    def complete(self) -> bool:
+        if self.product and self.allow_json_ld:
+            return True
+        # Meta tags live in <head>; wait for it to close so none are missed
+        return self.allow_meta and self.head_closed and self.has_meta_fields
+
+    def all_images(self) -> List[str]:
+        """Images seen so far plus any JSON-LD images"""
+        images = set(image for image in self.images
+                     if 'icon' not in image.lower() and 'logo' not in image.lower())
+        for data in self.json_ld:
+            if isinstance(data, list) and data:
+                data = data[0]
+            if not isinstance(data, dict):
+                continue
+            image = data.get('image')
+            if isinstance(image, str):
+                images.add(urljoin(self.base_url, image))
+            elif isinstance(image, list):
+                images.update(urljoin(self.base_url, img) for img in image if isinstance(img, str))
+        return list(images)[:20]
+
+    def meta_data(self) -> Dict:
+        """Product fields from OpenGraph/Twitter/product meta tags"""
+        image = self._meta_value('image_url')
+        description = self._meta_value('description')
+        return {
+            'title': self._meta_value('title'),
+            'price': self.meta_price(),
+            'image_url': urljoin(self.base_url, image) if image else None,
+            'description': description.strip() if description else None,
+        }
+
+    def result(self, gallery: bool = True) -> Optional[Dict]:
+        """Extracted data and the method that produced it (plus all_images with gallery), or None if incomplete"""
+        if self.product and self.allow_json_ld:
+            data = dict(self.product, scrape_method='json-ld')
+        elif self.complete:
+            data = dict(self.meta_data(), scrape_method='meta-tags')
+        else:
+            return None
+        if gallery:
+            data['all_images'] = self.all_images()
+        return data
+
+
+def iter_body(response, deadline=None):
+    """
+    Chunks of a streamed response body. With a bounded deadline, yields each
+    socket read as it arrives rather than waiting for full chunks, and stops
+    quietly once the deadline expires or is cancelled, so a slowly trickling
+    page can't hold the caller past it.
+    """
+    raw = response.raw
+    if deadline is None or not deadline.bounded or not hasattr(raw, 'read1'):
+        yield from response.iter_content(STREAM_CHUNK_SIZE)
+        return
+    sock = getattr(getattr(raw, 'connection', None), 'sock', None)
+    while not deadline.expired:
+        if sock is not None and deadline.seconds is not None:
+            sock.settimeout(max(deadline.remaining(), 0.01))
+        try:
+            chunk = raw.read1(STREAM_CHUNK_SIZE, decode_content=True)
+        except (ReadTimeoutError, socket.timeout):
+            return
+        if not chunk:
+            return
+        yield chunk
+
+
+def read_with_early_exit(response, parser: EarlyParser, max_bytes: int = EARLY_PARSE_MAX_BYTES,
+                         deadline=None, gallery: bool = True) -> Optional[Dict]:
+    """
+    Stream a requests response (fetched with stream=True) into parser.
+
+    Returns the early result (with all_images if gallery) and closes the
+    response as soon as the parser is complete, leaving the part read on the
+    response. Otherwise reads the whole body and leaves it on the response as
+    if it had not been streamed, so response.text works for the full parse.
+    The early parser stops being fed after max_bytes. If deadline expires
+    first, reading stops and only the part already received is left.
+    """
+    chunks = []
+    early_active = True
+    for chunk in iter_body(response, deadline):
+        chunks.append(chunk)
+        if not early_active:
+            continue
+        try:
+            if parser.feed(chunk):
+                logger.info(f"Early exit after {parser.bytes_fed} bytes: {response.url}")
+                response.close()
+                response._content = b''.join(chunks)
+                response._content_consumed = True
+                return parser.result(gallery)
+        except etree.LxmlError as e:
+            logger.debug(f"Early parse failed, falling back to full parse: {e}")
+            early_active = False
+        if parser.bytes_fed >= max_bytes:
+            early_active = False
+
+    if deadline is not None and deadline.expired:
+        # The rest of the body never arrived; don't return this connection to the pool
+        logger.info(f"Deadline reached after {sum(map(len, chunks))} bytes: {response.url}")
+        response.close()
+
+    # Nothing early; hand the full (or deadline-truncated) body to the regular parse
+    response._content = b''.join(chunks)
+    response._content_consumed = True
+    return None
+
+
+def read_head(response, parser: EarlyParser, max_bytes: int, deadline=None) -> bool:
+    """
+    Stream a response (fetched with stream=True) into parser until </head>
+    has been seen, max_bytes have been read or deadline expires, then close
+    it without reading the rest. Returns True if the whole head was seen.
+    """
+    try:
+        for chunk in iter_body(response, deadline):
+            parser.feed(chunk[:max_bytes - parser.bytes_fed])
+            if parser.head_closed or parser.bytes_fed >= max_bytes:
+                break
+    except etree.LxmlError as e:
+        logger.debug(f"Head parse failed: {e}")
+    finally:
+        response.close()
+    return parser.head_closed
+
+
+def read_body(response, deadline) -> bool:
+    """
+    Read a streamed response body until it ends or deadline expires, leaving
+    what arrived on the response. Returns True if the body was cut short.
+    """
+    chunks = list(iter_body(response, deadline))
+    truncated = deadline.expired
+    if truncated:
+        logger.info(f"Deadline reached after {sum(map(len, chunks))} bytes: {response.url}")
+        response.close()
+    response._content = b''.join(chunks)
+    response._content_consumed = True
+    return truncated
@@ -0,0 +1,197 @@
+import os
+import threading
+import time
+import logging
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Latency histogram settings
+TIMING_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+TIMING_MAX_DOMAINS = int(os.getenv('TIMING_MAX_DOMAINS', '200'))  # Domains with their own histograms
+
+_current_trace: ContextVar[Optional['Trace']] = ContextVar('timing_trace', default=None)
+
+
+class Trace:
+    """
+    Phase timings of one scrape or image download.
+
+    Code anywhere below the operation wraps its stages in phase(); while a
+    trace is active in the context (see trace()) each phase is appended here
+    with its start offset and duration. Phases nest, so a parent's time
+    includes its children's.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.started = time.perf_counter()
+        self.phases: List[Dict] = []
+
+    def add(self, name: str, start: float, seconds: float):
+        self.phases.append({
+            'phase': name,
+            'start_ms': round((start - self.started) * 1000, 2),
+            'ms': round(seconds * 1000, 2),
+        })
+
+    def total_seconds(self) -> float:
+        return time.perf_counter() - self.started
+
+    def report(self) -> Dict:
+        return {
+            'kind': self.kind,
+            'total_ms': round(self.total_seconds() * 1000, 2),
+            'phases': sorted(self.phases, key=lambda phase: phase['start_ms']),
+        }
+
+
+@contextmanager
+def trace(kind: str):
+    """Collect the phases of everything run inside the block into a new Trace"""
+    current = Trace(kind)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def phase(name: str):
+    """Time the block as `name` in the active trace; does nothing without one"""
+    current = _current_trace.get()
+    if current is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.add(name, start, time.perf_counter() - start)
+
+
+def record(name: str, seconds: float):
+    """Add a phase that was timed elsewhere and has just ended"""
+    current = _current_trace.get()
+    if current is not None:
+        current.add(name, time.perf_counter() - seconds, seconds)
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(TIMING_BUCKETS_MS) + 1)  # Last bucket is +Inf
+        self.count = 0
+        self.sum_ms = 0.0
+
+    def observe(self, ms: float):
+        self.buckets[bisect_left(TIMING_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.sum_ms += ms
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(TIMING_BUCKETS_MS + (None,), self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+
+class PhaseHistograms:
+    """
+    Per-phase latency histograms of one kind of operation, kept both per
+    domain and per scrape_method, for this process. Domains beyond
+    TIMING_MAX_DOMAINS are dropped least recently seen first.
+    """
+
+    def __init__(self, kind: str, max_domains: int = TIMING_MAX_DOMAINS):
+        self.kind = kind
+        self.max_domains = max_domains
+        self.lock = threading.Lock()
+        self.by_domain: 'OrderedDict[str, Dict[str, Histogram]]' = OrderedDict()
+        self.by_method: Dict[str, Dict[str, Histogram]] = {}
+
+    def observe(self, current: Trace, domain: str, method: Optional[str] = None):
+        """Fold a finished trace into the histograms; its total goes in as phase 'total'"""
+        durations = {'total': current.total_seconds() * 1000}
+        for entry in current.phases:
+            durations[entry['phase']] = durations.get(entry['phase'], 0.0) + entry['ms']
+
+        domain = domain.lower()
+        domain = domain[4:] if domain.startswith('www.') else domain
+        with self.lock:
+            series = [self.by_domain.pop(domain, None) or {}]
+            self.by_domain[domain] = series[0]
+            while len(self.by_domain) > self.max_domains:
+                self.by_domain.popitem(last=False)
+            if method:
+                series.append(self.by_method.setdefault(method, {}))
+            for histograms in series:
+                for name, ms in durations.items():
+                    histograms.setdefault(name, Histogram()).observe(ms)
+
+    def _summary(self, histograms: Dict[str, Histogram]) -> Dict:
+        return {
+            name: {
+                'count': histogram.count,
+                'avg_ms': round(histogram.sum_ms / histogram.count, 1),
+                'p50_ms': histogram.quantile(0.5),
+                'p95_ms': histogram.quantile(0.95),
+            }
+            for name, histogram in sorted(histograms.items())
+        }
+
+    def stats(self, limit: int = 20) -> Dict:
+        """Phase summaries for the busiest domains and every scrape_method"""
+        with self.lock:
+            domains = sorted(self.by_domain.items(), key=lambda item: -item[1]['total'].count)[:limit]
+            return {
+                'domains': {domain: self._summary(histograms) for domain, histograms in domains},
+                'methods': {method: self._summary(histograms) for method, histograms in sorted(self.by_method.items())},
+            }
+
+    def prometheus(self) -> List[str]:
+        """Histogram series in the Prometheus text format"""
+        lines = []
+        with self.lock:
+            for label, groups in (('domain', self.by_domain), ('scrape_method', self.by_method)):
+                if not groups:
+                    continue
+                metric = f"giftsync_{self.kind}_phase_seconds_by_{label.split('_')[-1]}"
+                lines.append(f"# HELP {metric} Duration of each {self.kind} phase by {label}")
+                lines.append(f"# TYPE {metric} histogram")
+                for value, histograms in groups.items():
+                    value = value.replace('\\', '\\\\').replace('"', '\\"')
+                    for name, histogram in histograms.items():
+                        labels = f'{label}="{value}",phase="{name}"'
+                        cumulative = 0
+                        for bound, count in zip(TIMING_BUCKETS_MS, histogram.buckets):
+                            cumulative += count
+                            lines.append(f'{metric}_bucket{{{labels},le="{bound / 1000:g}"}} {cumulative}')
+                        lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                        lines.append(f'{metric}_sum{{{labels}}} {histogram.sum_ms / 1000:.6f}')
+                        lines.append(f'{metric}_count{{{labels}}} {histogram.count}')
+        return lines
+
+
+scrape_timings = PhaseHistograms('scrape')
+image_timings = PhaseHistograms('image')
+preview_timings = PhaseHistograms('preview')
+
+
+def prometheus_text() -> str:
+    lines = scrape_timings.prometheus() + image_timings.prometheus() + preview_timings.prometheus()
+    return '\n'.join(lines) + '\n'
@@ -3,20 +3,31 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
-from .models import User, Family, WishList, WishListItem, Notification
+from django.http import HttpResponse
+from .models import User, Family, WishList, WishListItem, Notification, ScrapeJob
 from .serializers import (
     UserSerializer, FamilySerializer, WishListSerializer,
     WishListItemSerializer, NotificationSerializer
 )
 from django.db.models import Q
 from django.utils import timezone
-from .utils.scraper import ProductScraper
+from .utils.scraper import PARTIAL_FIELDS, ProductScraper, hedge_stats, scrape_cache
+from .utils.deadline import Deadline
+from .utils.preview import preview_url
+from .utils.image_probe import IMAGE_RANKING, image_prober
+from .utils.image_prefetch import IMAGE_PREFETCH, image_prefetcher
+from .utils.image_downloader import image_memory_stats
+from .utils.image_sources import image_source_cache
+from .utils import http_client, image_ingest, image_store, scrape_jobs, strategy, timing
+from .utils.browser_pool import browser_pool
+from .utils.single_flight import scrape_flights
+from .utils.circuit_breaker import image_breaker, render_breaker, scrape_breaker
 from django.contrib.auth.tokens import default_token_generator
 from .utils.sendgrid_client import send_password_reset_email
 from django.urls import reverse
 from django.conf import settings
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
 import os
@@ -291,37 +302,42 @@ class WishListItemViewSet(viewsets.ModelViewSet):
                     'error': 'URL is required'
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            scraper = ProductScraper(url)
-            data = scraper.scrape()
-
-            # Check if we got any useful data
-            if not data or not any([data.get('title'), data.get('price')]):
-                logger.warning(f"Scraping returned empty data for URL {url}: {data}")
-
-                # Provide helpful error message
-                scrape_method = data.get('scrape_method', 'unknown') if data else 'unknown'
-                error_details = data.get('error', 'No title or price found') if data else 'No data returned'
-
-                return Response({
-                    'error': 'Could not extract product information from URL',
-                    'details': {
-                        'message': error_details,
-                        'scrape_method': scrape_method,
+            # refresh=true skips the scrape cache and always refetches the page
+            refresh = str(request.data.get('refresh', '')).lower() in ('1', 'true')
+
+            # async=true queues the scrape for run_scrape_worker and returns a job to poll
+            if str(request.data.get('async', '')).lower() in ('1', 'true'):
+                try:
+                    job = scrape_jobs.enqueue(request.user, url, refresh=refresh)
+                except scrape_jobs.QueueFullError as e:
+                    logger.warning(f"Refusing scrape job for {url}: {e}")
+                    return Response({
+                        'error': 'Too many scrapes in progress, please try again shortly',
                         'suggestion': 'Please enter product details manually using the form below.'
-                    },
-                    'url': url,
-                    # Still return partial data if available
-                    'partial_data': {
-                        'title': data.get('title') if data else None,
-                        'price': data.get('price') if data else None,
-                        'image_url': data.get('image_url') if data else None,
-                        'description': data.get('description') if data else None,
-                    }
-                }, status=status.HTTP_400_BAD_REQUEST)
+                    }, status=status.HTTP_429_TOO_MANY_REQUESTS, headers={'Retry-After': '10'})
+                return Response(
+                    self._scrape_job_data(job),
+                    status=status.HTTP_202_ACCEPTED,
+                    headers={'Location': self._scrape_job_url(job)}
+                )
 
-            # Success - return data with metadata
-            logger.info(f"Successfully scraped {url} using method: {data.get('scrape_method')}")
-            return Response(data)
+            # deadline (seconds) bounds the whole scrape; past it, what was found so far is returned
+            deadline = Deadline.from_request(request.data.get('deadline'))
+            # gallery=true includes all_images; otherwise the gallery action fetches it later
+            gallery = str(request.data.get('gallery', '')).lower() in ('1', 'true')
+            scraper = ProductScraper(url, use_cache=not refresh, deadline=deadline, gallery=gallery)
+            data = scraper.scrape()
+            if gallery and self._wants_ranking(request):
+                data = self._rank_images(data)
+            body, response_status = self._scrape_result(url, data)
+            if IMAGE_PREFETCH and response_status == status.HTTP_200_OK and body.get('image_url'):
+                # Download the image while the user reviews the form; creating the item claims it
+                body['image_token'] = image_prefetcher.start(request.user.id, body['image_url'])
+            body['budget'] = deadline.report()
+            # debug=true adds per-phase timings (DNS, TLS, fetch, parse, selectors, browser, ...)
+            if str(request.data.get('debug', '')).lower() in ('1', 'true'):
+                body['debug'] = scraper.trace.report()
+            return Response(body, status=response_status)
 
         except Exception as e:
             logger.exception(f"Unexpected error while scraping {url}")
@@ -332,6 +348,147 @@ class WishListItemViewSet(viewsets.ModelViewSet):
                 'suggestion': 'Please enter product details manually.'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=False, methods=['POST'])
+    def gallery(self, request):
+        """all_images for a URL, from the page kept by an earlier scrape_url when possible"""
+        url = request.data.get('url')
+        if not url:
+            return Response({
+                'error': 'URL is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        deadline = Deadline.from_request(request.data.get('deadline'))
+        data = ProductScraper(url, deadline=deadline, gallery=True).scrape()
+        body = {
+            'url': url,
+            'all_images': data.get('all_images') or [],
+            'scrape_method': data.get('scrape_method'),
+        }
+        if self._wants_ranking(request):
+            ranked = self._rank_images(data)
+            body.update(image_url=ranked.get('image_url'), all_images=ranked['all_images'],
+                        image_candidates=ranked['image_candidates'])
+        return Response(body)
+
+    @action(detail=False, methods=['POST'])
+    def prefetch_image(self, request):
+        """Start downloading an image picked in the add-item form; send image_token with the item"""
+        image_url = request.data.get('image_url')
+        if not image_url:
+            return Response({
+                'error': 'image_url is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'image_url': image_url,
+            'image_token': image_prefetcher.start(request.user.id, image_url),
+        }, status=status.HTTP_202_ACCEPTED)
+
+    def _wants_ranking(self, request):
+        """rank_images=true/false in the request, else IMAGE_RANKING"""
+        value = request.data.get('rank_images')
+        if value in (None, ''):
+            return IMAGE_RANKING
+        return str(value).lower() in ('1', 'true')
+
+    def _rank_images(self, data):
+        """
+        Reorder image_url and all_images best first, from the header of each
+        candidate (size, aspect ratio), dropping icons and trackers. The scraped
+        image_url is kept if no candidate could be probed.
+        """
+        images = data.get('all_images') or []
+        ranked = image_prober.rank([data.get('image_url')] + images)
+        data = dict(data)
+        data['image_candidates'] = ranked['images']
+        if ranked['images']:
+            data['image_url'] = ranked['images'][0]['url']
+            # Images past IMAGE_MAX_CANDIDATES weren't probed; they keep their order at the end
+            seen = {probe['url'] for probe in ranked['images'] + ranked['dropped']}
+            data['all_images'] = [probe['url'] for probe in ranked['images']] + [
+                image for image in images if image not in seen
+            ]
+        return data
+
+    @action(detail=False, methods=['POST'])
+    def preview(self, request):
+        """Title and image from the page head only, to prefill the form before the full scrape_url"""
+        url = request.data.get('url')
+        if not url:
+            return Response({
+                'error': 'URL is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        data = preview_url(url)
+        if not (data.get('title') or data.get('image_url')):
+            return Response({
+                'error': 'Could not preview URL',
+                'details': {
+                    'message': data.get('error', 'No title or image in the page head'),
+                    'preview_method': data['preview_method'],
+                    'suggestion': 'Use scrape_url for the full page.'
+                },
+                'url': url,
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data)
+
+    @action(detail=False, methods=['GET'], url_path=r'scrape_jobs/(?P<job_id>\d+)', url_name='scrape-job')
+    def scrape_job(self, request, job_id=None):
+        """Status of a queued scrape; once finished, includes the scrape_url response"""
+        job = get_object_or_404(ScrapeJob, id=job_id, user=request.user)
+        return Response(self._scrape_job_data(job))
+
+    def _scrape_job_url(self, job):
+        return reverse('wishlist-item-scrape-job', kwargs={'job_id': job.id})
+
+    def _scrape_job_data(self, job):
+        data = {
+            'job_id': job.id,
+            'status': job.status,
+            'url': job.url,
+            'status_url': self._scrape_job_url(job),
+            'created_at': job.created_at,
+            'queue_seconds': job.queue_seconds,
+            'run_seconds': job.run_seconds,
+        }
+        if job.is_finished:
+            if job.result is None:
+                job.result = {'scrape_method': 'failed', 'error': job.error}
+            data['result'], data['result_status'] = self._scrape_result(job.url, job.result)
+        return data
+
+    def _scrape_result(self, url, data):
+        """Response body and status for scraped data, shared by sync scrapes and jobs"""
+        # Check if we got any useful data; a result cut short by the deadline counts if it has anything
+        fields = PARTIAL_FIELDS if data and data.get('partial') else ('title', 'price')
+        if not data or not any(data.get(field) for field in fields):
+            logger.warning(f"Scraping returned empty data for URL {url}: {data}")
+
+            # Provide helpful error message
+            scrape_method = data.get('scrape_method', 'unknown') if data else 'unknown'
+            error_details = data.get('error', 'No title or price found') if data else 'No data returned'
+
+            return {
+                'error': 'Could not extract product information from URL',
+                'details': {
+                    'message': error_details,
+                    'scrape_method': scrape_method,
+                    'suggestion': 'Please enter product details manually using the form below.'
+                },
+                'url': url,
+                # Still return partial data if available
+                'partial_data': {
+                    'title': data.get('title') if data else None,
+                    'price': data.get('price') if data else None,
+                    'image_url': data.get('image_url') if data else None,
+                    'description': data.get('description') if data else None,
+                },
+                'partial': bool(data and data.get('partial')),
+            }, status.HTTP_400_BAD_REQUEST
+
+        # Success - return data with metadata
+        logger.info(f"Successfully scraped {url} using method: {data.get('scrape_method')}")
+        return data, status.HTTP_200_OK
+
     @action(detail=False, methods=['POST'])
     def reorder_items(self, request):
         wishlist_id = request.data.get('wishlist_id')
@@ -572,6 +729,41 @@ class PasswordResetViewSet(viewsets.ViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def scraper_stats(request):
+    """Operational counters for the product scraper"""
+    return Response({
+        'cache': scrape_cache.stats(),
+        'http': http_client.pool_stats(),
+        'browser': browser_pool.stats(),
+        'coalescing': scrape_flights.stats(),
+        'hedging': hedge_stats.stats(),
+        'image_prefetch': image_prefetcher.stats(),
+        'timings': {
+            'scrape': timing.scrape_timings.stats(),
+            'image': timing.image_timings.stats(),
+            'preview': timing.preview_timings.stats(),
+        },
+        'circuits': {
+            'scrape': scrape_breaker.stats(),
+            'render': render_breaker.stats(),
+            'image': image_breaker.stats(),
+        },
+        'jobs': scrape_jobs.job_stats(),
+        'image_ingest': image_ingest.ingest_stats(),
+        'image_memory': image_memory_stats(),
+        'image_store': image_store.store_stats(),
+        'image_sources': image_source_cache.stats(),
+        'domains': strategy.domain_summary(),
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def scraper_metrics(request):
+    """Scrape and image phase histograms (this process) in the Prometheus text format"""
+    return HttpResponse(timing.prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def test_email(request):
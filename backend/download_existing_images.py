@@ -2,6 +2,8 @@
 """
 Simple script to download images for items that have image_url but no local image.
 This will work on Railway because it just downloads from URLs (no scraping needed).
+Normally run_image_worker does this in the background; this runs the queue now,
+including images that have already failed.
 """
 
 import os
@@ -16,6 +18,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 django.setup()
 
 from core.models import WishListItem
+from core.utils.image_ingest import ingest_now
 
 def download_existing_images():
     """Download images for items that have image_url"""
@@ -34,15 +37,16 @@ def download_existing_images():
         print(f"  URL: {item.image_url[:80]}...")
 
         try:
-            # Just re-save the item - this triggers the auto-download in save()
-            item.save()
+            # Download it here rather than waiting for the ingestion worker
+            image_status = ingest_now(item)
 
             # Check if image was downloaded
-            if item.image:
+            if image_status == 'ready':
+                item.refresh_from_db()
                 print(f"  ✓ Downloaded: {item.image.name}")
                 success_count += 1
             else:
-                print(f"  ✗ Download failed")
+                print(f"  ✗ Download failed ({image_status})")
                 error_count += 1
 
         except Exception as e:
@@ -16,7 +16,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 django.setup()
 
 from core.models import WishListItem
-from core.utils.scraper import ProductScraper
+from core.utils.batch_scraper import BatchScraper
 
 def prescrape_images():
     """Pre-scrape all product URLs to get actual image URLs"""
@@ -36,15 +36,17 @@ def prescrape_images():
     success_count = 0
     error_count = 0
 
-    for i, item in enumerate(items, 1):
-        print(f"\n[{i}/{items.count()}] Processing: {item.title}")
-        print(f"  URL: {item.link}")
+    # Scrape concurrently (per-domain limits apply); save each result as it arrives
+    items = list(items)
+    batch = BatchScraper()
+    results = batch.iter_results([item.link for item in items])
 
-        try:
-            # Scrape the product page
-            scraper = ProductScraper(item.link)
-            scraped_data, error = scraper.scrape()
+    for i, (index, url, scraped_data) in enumerate(results, 1):
+        item = items[index]
+        print(f"\n[{i}/{len(items)}] Processing: {item.title}")
+        print(f"  URL: {url}")
 
+        try:
             if scraped_data and scraped_data.get('image_url'):
                 image_url = scraped_data['image_url']
                 print(f"  ✓ Found image: {image_url[:80]}...")
@@ -56,8 +58,8 @@ def prescrape_images():
                 success_count += 1
             else:
                 print(f"  ✗ No image found")
-                if error:
-                    print(f"  Error: {error}")
+                if scraped_data.get('error'):
+                    print(f"  Error: {scraped_data['error']}")
                 error_count += 1
 
         except Exception as e:
@@ -68,7 +70,8 @@ def prescrape_images():
     print(f"\nPre-scraping complete!")
     print(f"  Success: {success_count}")
     print(f"  Errors: {error_count}")
-    print(f"  Total: {items.count()}")
+    print(f"  Total: {len(items)}")
+    print(f"  Time: {batch.stats['seconds']}s")
 
 if __name__ == '__main__':
     prescrape_images()
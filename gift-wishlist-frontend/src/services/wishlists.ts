@@ -1,6 +1,13 @@
 import api from './api'
 import type { User } from '@/types'
 
+export interface ImageRendition {
+  width: number
+  height: number
+  webp: string
+  jpeg: string            // Fallback for clients without WebP
+}
+
 export interface WishListItem {
   id: number
   title: string
@@ -9,6 +16,8 @@ export interface WishListItem {
   link: string
   image: string | null    // For uploaded images
   image_url: string       // For scraped images
+  image_status: 'none' | 'pending' | 'processing' | 'ready' | 'failed'  // Download of image_url into image
+  image_renditions: Partial<Record<'thumbnail' | 'card' | 'detail', ImageRendition>>  // Resized copies of image
   size: string
   priority: number
   is_purchased: boolean
@@ -19,6 +28,14 @@ export interface WishListItem {
   wishlist: number
 }
 
+// srcset of the item's WebP renditions, so the browser fetches the smallest one that fills the slot
+export function itemImageSrcset(item: WishListItem): string | undefined {
+  const renditions = Object.values(item.image_renditions || {})
+  if (!renditions.length) return undefined
+  const sources = new Map(renditions.map(rendition => [rendition.webp, `${rendition.webp} ${rendition.width}w`]))
+  return [...sources.values()].join(', ')
+}
+
 export interface WishList {
   id: number
   name: string
@@ -109,10 +126,43 @@ export const wishlistsService = {
       description?: string
       price?: number
       image_url?: string
+      image_token?: string | null
     }>('/wishlist-items/scrape_url/', { url })
     return response.data
   },
 
+  // Start downloading an image before the item is saved; send the token with the item.
+  // The token is null when the server already has the image stored.
+  async prefetchImage(imageUrl: string) {
+    const response = await api.post<{
+      image_url: string
+      image_token: string | null
+    }>('/wishlist-items/prefetch_image/', { image_url: imageUrl })
+    return response.data
+  },
+
+  // Product images for a URL, best first; reuses the page fetched by scrapeUrl
+  async scrapeGallery(url: string) {
+    const response = await api.post<{
+      url: string
+      all_images: string[]
+      image_url?: string | null
+    }>('/wishlist-items/gallery/', { url })
+    return response.data
+  },
+
+  // Quick title/image from the page head only; scrapeUrl still provides the price
+  async previewUrl(url: string) {
+    const response = await api.post<{
+      title?: string
+      description?: string
+      price?: number
+      image_url?: string
+      site_name?: string
+    }>('/wishlist-items/preview/', { url })
+    return response.data
+  },
+
   async getStats() {
     const response = await api.get('/wishlists/stats/')
     return response.data